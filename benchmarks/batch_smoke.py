@@ -0,0 +1,115 @@
+#!/bin/env python3
+"""
+Smoke check of the batch mode: a small corpus is processed from the local stand-in server in the
+threads and in the processes mode.
+
+The corpus has one link, which is not found, and one article with the image, which is not found:
+both must fail as permanent failures, all other articles must be written. Exit code is 1, if any
+mode gives the other result.
+"""
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List
+
+from corpus import make_corpus
+from stand_in_server import StandInServer
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_summary_re = re.compile(r'^Items: (\d+) total, (\d+) succeeded, (\d+) failed$', re.MULTILINE)
+_failed_re = re.compile(r'^Failed: (.*)$', re.MULTILINE)
+
+
+def run_batch(links: List[str], work_dir: Path, extra_args: List[str], timeout: float) -> str:
+    """
+    Run the batch mode in the separate process, as it's run by the user.
+
+    :return: stdout and stderr of the run.
+    """
+
+    links_file = work_dir / 'links.txt'
+    links_file.write_text('\n'.join(links) + '\n')
+    out_dir = work_dir / 'out'
+    out_dir.mkdir()
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (str(ROOT), env.get('PYTHONPATH')) if p)
+    result = subprocess.run([sys.executable, '-c', 'from mart_gui.app import main; main()',
+                             '-b', str(links_file), '-o', str(out_dir), '--retries', '0',
+                             *extra_args],
+                            cwd=work_dir, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, timeout=timeout, check=False)
+
+    return result.stdout.decode(errors='replace')
+
+
+def check(mode: str, output: str, good: int, failed: int) -> List[str]:
+    """
+    :return: problems, empty if the run is correct.
+    """
+
+    if (summary := _summary_re.search(output)) is None:
+        return [f'{mode}: there is no summary']
+
+    total, succeeded, failures = map(int, summary.groups())
+    problems = []
+
+    if (total, succeeded, failures) != (good + failed, good, failed):
+        problems.append(f'{mode}: {succeeded} of {total} succeeded, {failures} failed, '
+                        f'expected {good} succeeded, {failed} failed')
+
+    failure_classes = _failed_re.search(output)
+    if failed and (failure_classes is None or failure_classes.group(1) != f'{failed} permanent'):
+        problems.append(f'{mode}: failures are "{failure_classes and failure_classes.group(1)}", '
+                        f'expected "{failed} permanent"')
+
+    return problems
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--articles', type=int, default=10, help='good articles count')
+    parser.add_argument('-m', '--modes', default='threads,processes',
+                        help='comma separated modes: threads, processes')
+    parser.add_argument('-t', '--timeout', type=float, default=120, help='one run timeout, seconds')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the batch output')
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(',') if m]
+    if unknown := set(modes) - {'threads', 'processes'}:
+        parser.error(f'unknown modes: {", ".join(sorted(unknown))}')
+
+    files = make_corpus(args.articles, 3, 1, 1024)
+    files['/broken_image.md'] = b'# Broken image\n\n![missing](img/missing.png)\n'
+    problems = []
+
+    with StandInServer(files) as server:
+        links = [f'{server.base_url}/article{n}.md' for n in range(args.articles)]
+        # Failing items go first: the items after them must not be affected.
+        links = [f'{server.base_url}/missing.md', f'{server.base_url}/broken_image.md', *links]
+
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                output = run_batch(links, Path(tmp), ['-P'] if 'processes' == mode else [],
+                                   args.timeout)
+            if args.verbose:
+                print(output)
+
+            mode_problems = check(mode, output, args.articles, 2)
+            print(f'{mode}: ' + ('FAILED' if mode_problems else 'OK'))
+            problems.extend(mode_problems)
+
+    for problem in problems:
+        print(problem, file=sys.stderr)
+
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/bin/env python3
+"""
+Count TCP connections, opened by the whole batch, with and without the shared connections pool.
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from markdown_toolset.article_processor import ArticleProcessor  # noqa: E402
+
+from mart_gui.batch import BatchRunner  # noqa: E402
+from mart_gui.fetcher import AsyncFetcher  # noqa: E402
+from mart_gui.item_parameters import ItemParameters  # noqa: E402
+from corpus import make_corpus  # noqa: E402
+from stand_in_server import StandInServer  # noqa: E402
+
+
+def run_processors(links, out_dir: Path, workers: int):
+    """
+    Original processing: `ArticleProcessor` per article, every request opens a new connection.
+    """
+
+    def _process(link):
+        ArticleProcessor(article_file_path_or_url=link, output_path=str(out_dir),
+                         images_dirname='images', skip_all_incorrect=True).process()
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(_process, links))
+
+
+def run_batch(links_file: Path, out_dir: Path, workers: int, fetcher: AsyncFetcher):
+    item = ItemParameters()
+    item.output_path = str(out_dir)
+    BatchRunner(links_file, item, workers, fetcher=fetcher, min_workers=workers).run()
+    fetcher.close()
+
+
+def measure(server: StandInServer, name: str, links, run):
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        # Remote article sources are written into the current directory.
+        os.chdir(tmp)
+        connections = server.connections
+        start = time.monotonic()
+        try:
+            run(Path(tmp))
+        finally:
+            os.chdir(cwd)
+        elapsed = time.monotonic() - start
+
+    connections = server.connections - connections
+    print(f'{name}: {elapsed:.2f} s, {len(links) / elapsed:.1f} articles/s, '
+          f'{connections} connections')
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--articles', type=int, default=100, help='articles count')
+    parser.add_argument('-i', '--images', type=int, default=10, help='images per article')
+    parser.add_argument('-S', '--shared', type=int, default=3,
+                        help='images, shared by all articles')
+    parser.add_argument('-s', '--size', type=int, default=4096, help='image size in bytes')
+    parser.add_argument('-l', '--latency', type=float, default=0.002,
+                        help='server latency, seconds')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='workers count')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='fetcher per host limit')
+    parser.add_argument('--skip-processors', action='store_true',
+                        help='don\'t run original processors')
+    args = parser.parse_args()
+
+    # Processors log every image.
+    logging.disable(logging.WARNING)
+
+    files = make_corpus(args.articles, args.images, args.shared, args.size)
+
+    with StandInServer(files, args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        links = [f'{server.base_url}/article{a}.md' for a in range(args.articles)]
+        links_file = Path(tmp) / 'links.txt'
+        links_file.write_text('\n'.join(links))
+
+        if not args.skip_processors:
+            measure(server, f'processors ({args.workers})', links,
+                    lambda out: run_processors(links, out, args.workers))
+
+        measure(server, 'fetcher, no keep-alive', links,
+                lambda out: run_batch(links_file, out, args.workers,
+                                      AsyncFetcher(64, args.concurrency, keepalive_timeout=0)))
+        measure(server, f'fetcher, pool {args.concurrency}', links,
+                lambda out: run_batch(links_file, out, args.workers,
+                                      AsyncFetcher(64, args.concurrency)))
+
+
+if '__main__' == __name__:
+    main()
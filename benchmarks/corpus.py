@@ -0,0 +1,30 @@
+"""
+Synthetic articles corpus for the benchmarks.
+"""
+from typing import Dict
+
+
+def make_corpus(articles: int, images: int, shared: int, size: int) -> Dict[str, bytes]:
+    """
+    Articles with the images: `shared` images are used by all articles, others are unique.
+
+    Corpus is deterministic: the same parameters give the same files.
+
+    :return: URL path -> content.
+    """
+
+    files = {}
+
+    for n in range(shared):
+        files[f'/img/shared{n}.png'] = b'\x89PNG' + bytes(size)
+
+    for a in range(articles):
+        links = [f'/img/shared{n}.png' for n in range(min(shared, images))]
+        for n in range(images - len(links)):
+            links.append(path := f'/img/a{a}_{n}.png')
+            files[path] = b'\x89PNG' + bytes([a % 256]) + bytes(size)
+        body = f'# Article {a}\n\n' + \
+            '\n'.join(f'![{n}]({link[1:]})' for n, link in enumerate(links)) + '\n'
+        files[f'/article{a}.md'] = body.encode()
+
+    return files
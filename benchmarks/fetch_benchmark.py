@@ -0,0 +1,62 @@
+#!/bin/env python3
+"""
+Compare thread-per-request images downloading with the shared asynchronous fetcher.
+"""
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from markdown_toolset.www_tools import download_from_url  # noqa: E402
+
+from mart_gui.fetcher import AsyncFetcher  # noqa: E402
+from stand_in_server import StandInServer  # noqa: E402
+
+
+def bench_threads(urls, threads: int) -> float:
+    start = time.monotonic()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(download_from_url, urls))
+    return time.monotonic() - start
+
+
+def bench_fetcher(urls, max_in_flight: int, per_host_limit: int):
+    fetcher = AsyncFetcher(max_in_flight, per_host_limit)
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory() as tmp:
+        fetcher.fetch_many([(u, Path(tmp) / str(n)) for n, u in enumerate(urls)])
+    elapsed = time.monotonic() - start
+    fetcher.close()
+    return elapsed, fetcher.connections_opened
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--images', type=int, default=2000, help='images count')
+    parser.add_argument('-s', '--size', type=int, default=4096, help='image size in bytes')
+    parser.add_argument('-l', '--latency', type=float, default=0.01, help='server latency, seconds')
+    parser.add_argument('-t', '--threads', type=int, default=16,
+                        help='threads count for the threaded mode')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='fetcher per host limit')
+    args = parser.parse_args()
+
+    files = {f'/img/{n}.png': b'\x89PNG' + bytes(args.size) for n in range(args.images)}
+
+    with StandInServer(files, args.latency) as server:
+        urls = [f'{server.base_url}{p}' for p in files]
+
+        elapsed = bench_threads(urls, args.threads)
+        print(f'threads ({args.threads}): {elapsed:.2f} s, {len(urls) / elapsed:.1f} requests/s')
+
+        elapsed, connections = bench_fetcher(urls, args.concurrency, args.concurrency)
+        print(f'fetcher ({args.concurrency}): {elapsed:.2f} s, '
+              f'{len(urls) / elapsed:.1f} requests/s, '
+              f'{connections} connections')
+
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,178 @@
+#!/bin/env python3
+"""
+Measure the GUI links table: loading of a large links list, scrolling through it and the memory.
+
+The table model is compared with the `QTableWidget` (`--widget`), which allocates an item and the
+options per row. `--background` loads the file by the background loader of the GUI and measures the
+longest event loop stall. Every run is a fresh process: the peak RSS belongs to this run only.
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Tuple
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PyQt6.QtCore import QEventLoop, QModelIndex, Qt, QTimer  # noqa: E402
+from PyQt6.QtWidgets import QApplication, QHeaderView, QTableView, QTableWidget, QTableWidgetItem  # noqa: E402
+
+from mart_gui.item_parameters import ItemParameters  # noqa: E402
+from mart_gui.links_loader import LinksLoader  # noqa: E402
+from mart_gui.links_model import LinksModel  # noqa: E402
+
+
+def _max_rss() -> int:
+    # Linux reports kilobytes, macOS reports bytes.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if 'darwin' == sys.platform else rss * 1024
+
+
+def write_links(links_file: Path, count: int):
+    # Links are not kept: they would be counted in the peak RSS of the loading.
+    with open(links_file, 'w') as lf:
+        lf.writelines(f'https://host{i % 997}.example.com/articles/{i // 997}/article-{i}.md\n'
+                      for i in range(count))
+
+
+class CountingModel(LinksModel):
+    """
+    Counts the rows, requested by the view.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rows = set()
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        self.rows.add(index.row())
+        return super().data(index, role)
+
+
+def load_model(view: QTableView, links_file: Path) -> CountingModel:
+    model = CountingModel()
+    view.setModel(model)
+    view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+
+    with open(links_file, 'r') as lf:
+        model.append_links([lrs for line in lf if (lrs := line.rstrip())])
+
+    return model
+
+
+def load_background(view: QTableView, links_file: Path) -> Tuple[CountingModel, float]:
+    """
+    :return: the model and the longest interval between the event loop timer ticks, seconds.
+    """
+
+    model = CountingModel()
+    view.setModel(model)
+    view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+
+    ticks = [time.monotonic()]
+    timer = QTimer()
+    timer.setInterval(5)
+    timer.timeout.connect(lambda: ticks.append(time.monotonic()))
+
+    loop = QEventLoop()
+    loader = LinksLoader(links_file)
+    loader.chunk_loaded.connect(lambda chunk: model.append_links(chunk.links,
+                                                                 statuses=chunk.statuses))
+    loader.finished.connect(loop.quit)
+
+    timer.start()
+    loader.start()
+    loop.exec()
+    timer.stop()
+    ticks.append(time.monotonic())
+
+    return model, max(b - a for a, b in zip(ticks, ticks[1:]))
+
+
+def load_widget(view: QTableWidget, links_file: Path):
+    # The former loading: item and options per row.
+    with open(links_file, 'r') as lf:
+        links = [lrs for line in lf if (lrs := line.rstrip())]
+
+    view.setColumnCount(1)
+    view.setRowCount(len(links))
+    for row, link in enumerate(links):
+        item = QTableWidgetItem(link)
+        item.setData(Qt.ItemDataRole.UserRole, ItemParameters())
+        view.setItem(row, 0, item)
+
+
+def scroll(app: QApplication, view: QTableView, steps: int) -> float:
+    """
+    Scroll from the top to the bottom by the steps, every step is painted.
+
+    :return: average step time, seconds.
+    """
+
+    scroll_bar = view.verticalScrollBar()
+    maximum = scroll_bar.maximum()
+    start = time.monotonic()
+
+    for step in range(steps + 1):
+        scroll_bar.setValue(maximum * step // steps)
+        view.viewport().repaint()
+        app.processEvents()
+
+    return (time.monotonic() - start) / (steps + 1)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--links', type=int, default=1_000_000, help='links count')
+    parser.add_argument('-s', '--steps', type=int, default=200, help='scrolling steps')
+    parser.add_argument('--widget', action='store_true',
+                        help='measure the QTableWidget instead of the model')
+    parser.add_argument('--background', action='store_true',
+                        help='load the model by the background loader')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        links_file = Path(tmp) / 'links.txt'
+        write_links(links_file, args.links)
+
+        view = QTableWidget() if args.widget else QTableView()
+        view.resize(800, 600)
+        view.show()
+        app.processEvents()
+
+        rss = _max_rss()
+        start = time.monotonic()
+        stall = None
+        if args.widget:
+            model = load_widget(view, links_file)
+        elif args.background:
+            model, stall = load_background(view, links_file)
+        else:
+            model = load_model(view, links_file)
+        app.processEvents()
+        load_time = time.monotonic() - start
+        memory = _max_rss() - rss
+
+        step_time = scroll(app, view, args.steps)
+
+    name = 'QTableWidget' if args.widget else \
+        'LinksModel, background' if args.background else 'LinksModel'
+    print(f'{name}, {args.links} links: loading {load_time:.2f} s '
+          f'({args.links / load_time:.0f} links/s), '
+          f'+{memory / 2 ** 20:.1f} MiB RSS ({memory / args.links:.0f} bytes/link), '
+          f'scrolling {step_time * 1000:.2f} ms/step')
+    if stall is not None:
+        print(f'Longest event loop stall while loading: {stall * 1000:.0f} ms')
+    if model is not None:
+        print(f'Rows, requested by the view: {len(model.rows)} of {args.links}')
+
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,100 @@
+"""
+Local HTTP stand-in server for the benchmarks.
+"""
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately: Nagle's algorithm delays responses on the kept alive
+    # connections.
+    disable_nagle_algorithm = True
+    _chunk_size = 16 * 1024
+
+    def do_GET(self):  # noqa: N802
+        server: StandInServer = self.server  # type: ignore
+        path = self.path.split('?', 1)[0]
+
+        if server.latency > 0:
+            time.sleep(server.latency)
+
+        if (content := server.files.get(path)) is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', server.content_type(path))
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+
+        if server.bandwidth <= 0:
+            self.wfile.write(content)
+            return
+
+        # Bandwidth is limited per connection.
+        chunk_size = max(1, min(self._chunk_size, server.bandwidth // 10))
+        for offset in range(0, len(content), chunk_size):
+            chunk = content[offset:offset + chunk_size]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / server.bandwidth)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Serves files from the memory with the injected latency and bandwidth, counts accepted
+    connections.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, files: Dict[str, bytes], latency: float = 0.0, port: int = 0,
+                 bandwidth: int = 0):
+        """
+        :parameter files: URL path -> content.
+        :parameter latency: delay before each response, seconds.
+        :parameter bandwidth: response body bytes/s for one connection, 0 - unlimited.
+        """
+
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.files = files
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.connections = 0
+        self._connections_lock = Lock()
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def get_request(self):
+        request = super().get_request()
+        with self._connections_lock:
+            self.connections += 1
+        return request
+
+    def handle_error(self, request, client_address):
+        # Clients disconnect on the cancellation.
+        pass
+
+    @staticmethod
+    def content_type(path: str) -> str:
+        if path.endswith('.md'):
+            return 'text/markdown'
+        if path.endswith('.png'):
+            return 'image/png'
+        return 'application/octet-stream'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
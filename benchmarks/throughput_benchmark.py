@@ -0,0 +1,212 @@
+#!/bin/env python3
+"""
+Measure `AppLogic` throughput on a synthetic corpus, served by the local stand-in server.
+
+Every configuration (fixed or adaptive workers count, threads or processes) runs in a fresh process:
+peak RSS belongs to this configuration only. Results are written as JSON and can be compared with
+the previous run.
+"""
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import active_children, get_context, set_start_method
+from pathlib import Path
+from threading import Event
+from typing import Dict, List, Optional, Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mart_gui.app_logic import AppLogic  # noqa: E402
+from mart_gui.fetcher import AsyncFetcher  # noqa: E402
+from mart_gui.item_parameters import ItemParameters  # noqa: E402
+from mart_gui.memory_budget import MemoryBudget  # noqa: E402
+from corpus import make_corpus  # noqa: E402
+from stand_in_server import StandInServer  # noqa: E402
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """
+    Nearest-rank percentile of the sorted values.
+    """
+
+    if not values:
+        return 0.0
+
+    rank = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+def _max_rss(who: int) -> int:
+    # Linux reports kilobytes, macOS reports bytes.
+    rss = resource.getrusage(who).ru_maxrss
+    return rss if 'darwin' == sys.platform else rss * 1024
+
+
+def run_config(links: List[str], workers: int, use_processes: bool, concurrency: int,
+               memory_budget: int = 0) -> Dict:
+    """
+    Process all links once, executed in the separate process.
+
+    :parameter workers: fixed transform workers count, 0 - adaptive.
+    :parameter memory_budget: memory budget in bytes, 0 - unlimited.
+    """
+
+    logging.disable(logging.WARNING)
+    # Spawned process inherits the "spawn" start method: workers are started by the platform default
+    # method, as in the application.
+    set_start_method(None, force=True)
+
+    failures = []
+    completed = Event()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        # Remote article sources are written into the current directory.
+        os.chdir(tmp)
+
+        item = ItemParameters()
+        item.output_path = tmp
+        budget = MemoryBudget(memory_budget) if memory_budget else None
+        fetcher = AsyncFetcher(64, concurrency, memory_budget=budget)
+        app_logic = AppLogic(completed.set,
+                             on_item_fail=lambda index, path, *_: failures.append(path),
+                             max_workers=workers or None, use_processes=use_processes,
+                             fetcher=fetcher, min_workers=workers or None, memory_budget=budget)
+
+        try:
+            start = time.monotonic()
+            app_logic.add_items([(link, index, item) for index, link in enumerate(links)])
+            completed.wait()
+            elapsed = time.monotonic() - start
+            final_workers = app_logic.active_workers
+        finally:
+            app_logic.shutdown()
+            fetcher.close()
+            os.chdir(cwd)
+
+    # Workers must be waited for, to be counted in the children RSS.
+    deadline = time.monotonic() + 10
+    while active_children() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    latencies = sorted(t.total for t in app_logic.item_timings.values())
+
+    return {
+        'mode': 'processes' if use_processes else 'threads',
+        'workers': workers,
+        'concurrency': concurrency,
+        'items': len(links),
+        'failed': len(failures),
+        'elapsed': round(elapsed, 4),
+        'items_per_second': round(len(links) / elapsed, 2),
+        'latency_p50': round(percentile(latencies, 50), 4),
+        'latency_p95': round(percentile(latencies, 95), 4),
+        'latency_p99': round(percentile(latencies, 99), 4),
+        'peak_rss': _max_rss(resource.RUSAGE_SELF),
+        'peak_rss_children': _max_rss(resource.RUSAGE_CHILDREN),
+        'connections': fetcher.connections_opened,
+        'final_workers': final_workers,
+        'memory_budget': memory_budget,
+        'memory_peak': budget.peak if budget is not None else 0,
+        'memory_waits': budget.waits if budget is not None else 0,
+    }
+
+
+def _config_key(result: Dict):
+    return result['mode'], result['workers'], result['concurrency']
+
+
+def print_results(results: List[Dict], previous: Optional[List[Dict]] = None):
+    previous = {_config_key(r): r for r in previous} if previous else {}
+
+    for r in results:
+        workers = r['workers'] or f'auto->{r["final_workers"]["transform"]}'
+        line = (f'{r["mode"]:>9} w={workers:<7} c={r["concurrency"]:<3} '
+                f'{r["items_per_second"]:8.1f} items/s  '
+                f'p50 {r["latency_p50"]:.3f} s  p95 {r["latency_p95"]:.3f} s  '
+                f'p99 {r["latency_p99"]:.3f} s  RSS {r["peak_rss"] / 2 ** 20:.1f} MiB')
+        if r['peak_rss_children']:
+            line += f' (+{r["peak_rss_children"] / 2 ** 20:.1f} MiB worker)'
+        if r.get('memory_budget'):
+            line += f'  budget {r["memory_peak"] / 2 ** 20:.1f}/' \
+                    f'{r["memory_budget"] / 2 ** 20:.0f} MiB, {r["memory_waits"]} waits'
+        if r['failed']:
+            line += f'  {r["failed"]} failed'
+        if (p := previous.get(_config_key(r))) is not None and p['items_per_second']:
+            line += f'  {100 * (r["items_per_second"] / p["items_per_second"] - 1):+.1f}%'
+        print(line)
+
+
+def _int_list(value: str) -> List[int]:
+    return [0 if 'auto' == v else int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--articles', type=int, default=200, help='articles count')
+    parser.add_argument('-i', '--images', type=int, default=10, help='images per article')
+    parser.add_argument('-S', '--shared', type=int, default=3,
+                        help='images, shared by all articles')
+    parser.add_argument('-s', '--size', type=int, default=16384, help='image size in bytes')
+    parser.add_argument('-l', '--latency', type=float, default=0.005,
+                        help='server latency, seconds')
+    parser.add_argument('-b', '--bandwidth', type=int, default=0,
+                        help='server bandwidth for one connection, bytes/s, 0 - unlimited')
+    parser.add_argument('-w', '--workers', type=_int_list, default=[2, 4, 8],
+                        help='comma separated transform workers counts, "auto" - adaptive')
+    parser.add_argument('-c', '--concurrency', type=_int_list, default=[8],
+                        help='comma separated fetcher per host limits')
+    parser.add_argument('-m', '--modes', default='threads,processes',
+                        help='comma separated modes: threads, processes')
+    parser.add_argument('-M', '--memory-budget', type=int, default=0,
+                        help='memory budget, MiB, 0 - unlimited')
+    parser.add_argument('-o', '--output', default=None, help='JSON file to write the results')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file with the previous results to compare')
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(',') if m]
+    if unknown := set(modes) - {'threads', 'processes'}:
+        parser.error(f'unknown modes: {", ".join(sorted(unknown))}')
+
+    files = make_corpus(args.articles, args.images, args.shared, args.size)
+    results = []
+
+    with StandInServer(files, args.latency, bandwidth=args.bandwidth) as server:
+        links = [f'{server.base_url}/article{a}.md' for a in range(args.articles)]
+
+        for mode in modes:
+            for workers in args.workers:
+                for concurrency in args.concurrency:
+                    with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+                        results.append(pool.submit(run_config, links, workers,
+                                                   'processes' == mode, concurrency,
+                                                   args.memory_budget * 2 ** 20).result())
+
+    previous = None
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding='utf8'))['results']
+
+    print_results(results, previous)
+
+    if args.output:
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'parameters': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+            'results': results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding='utf8')
+
+
+if '__main__' == __name__:
+    main()
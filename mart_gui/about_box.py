@@ -18,4 +18,4 @@ class AboutBox(QDialog):
         self.label_qt_version.setText(QT_VERSION_STR)
         self.label_pyqt_version.setText(PYQT_VERSION_STR)
 
-        self.exec()
\ No newline at end of file
+        self.exec()
@@ -1,14 +1,207 @@
 import sys
-from PyQt6.QtWidgets import QApplication
-from .main_window import MainUi
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from typing import List, Tuple
 
 
 def create_qt_ui(args):
+    from PyQt6.QtWidgets import QApplication
+    from .main_window import MainUi
+
     app = QApplication(args)
     create_qt_ui.window = MainUi()
     app.exec()
 
 
+def run_batch(args: Namespace) -> int:
+    from markdown_toolset.article_processor import OUT_FORMATS_LIST
+    from markdown_toolset.deduplicators import DeduplicationVariant
+    from . import log_config  # noqa
+    from .batch import BatchRunner
+    from .fetcher import AsyncFetcher
+    from .item_parameters import ItemParameters
+    from .dedup_index import DedupIndex
+    from .image_store import ImageStore
+    from .journal import JobJournal
+    from .memory_budget import MemoryBudget
+    from .rate_limit import HostRateLimiter, RateLimit
+    from .retry import RetryPolicy
+    from .timings import write_timings_report
+
+    if args.output_format not in OUT_FORMATS_LIST:
+        print(f'Incorrect output format "{args.output_format}", '
+              f'available: {", ".join(OUT_FORMATS_LIST)}', file=sys.stderr)
+        return 2
+
+    item = ItemParameters()
+    item.output_path = args.out
+    item.output_format = OUT_FORMATS_LIST.index(args.output_format)
+    item.downloading_timeout = args.timeout
+    item.deduplication_type = args.dedup
+    item.images_dir_name = args.images_dir
+    item.images_public_path = args.images_public_path
+    item.skip_list = args.skip_list.split() if args.skip_list else []
+    item.skip_all_incorrect = int(args.skip_all_incorrect)
+    item.download_incorrect_mime = int(args.download_incorrect_mime)
+    item.remove_source = int(args.remove_source)
+    item.save_hierarchy = int(args.save_hierarchy)
+
+    try:
+        rate_limiter = HostRateLimiter.from_file(args.rate_config) if args.rate_config \
+            else HostRateLimiter()
+    except (OSError, ValueError) as e:
+        print(f'Can\'t load rate limits from "{args.rate_config}": {e}', file=sys.stderr)
+        return 2
+
+    if args.rate_limit:
+        rate_limiter.set_default(RateLimit(args.rate_limit, args.rate_burst))
+
+    journal = None
+    if not args.no_journal:
+        journal = JobJournal(args.journal if args.journal else
+                             _default_data_path(Path(args.out), 'journal.sqlite'))
+
+    image_store = None
+    if not args.no_image_store:
+        image_store = ImageStore(args.image_store if args.image_store else
+                                 _default_data_path(Path(args.out), 'images'),
+                                 args.image_store_size * 2 ** 20)
+
+    dedup_index = None
+    if DeduplicationVariant.CONTENT_HASH == args.dedup:
+        dedup_index = DedupIndex(args.dedup_index if args.dedup_index else
+                                 _default_data_path(Path(args.out), 'dedup.sqlite'))
+
+    memory_budget = MemoryBudget(args.memory_budget * 2 ** 20) if args.memory_budget > 0 else None
+    fetcher = AsyncFetcher(args.max_requests, args.max_host_requests, args.pool_size,
+                           args.keepalive, rate_limiter, memory_budget)
+    # Fixed workers count or adaptive limits.
+    min_workers, max_workers = (args.workers, args.workers) if args.workers \
+        else (args.min_workers, args.max_workers)
+    runner = BatchRunner(args.batch, item, max_workers, args.processes, fetcher, journal,
+                         args.incremental, image_store, dedup_index, min_workers, not args.fifo,
+                         RetryPolicy(args.retries, host_budget=args.retry_budget), memory_budget)
+    try:
+        stats = runner.run()
+    finally:
+        for storage in (journal, image_store, dedup_index):
+            if storage is not None:
+                storage.close()
+    stats.print_summary(sys.stdout)
+
+    if args.timings_report:
+        write_timings_report(args.timings_report, runner.timings)
+
+    return 1 if stats.failures else 0
+
+
+def _default_data_path(out_path: Path, name: str) -> Path:
+    out_dir = out_path if out_path.is_dir() or not out_path.suffix else out_path.parent
+    return out_dir / f'.mart-{name}'
+
+
+def parse_args(args: List[str]) -> Tuple[Namespace, List[str]]:
+    """
+    Parse the command line, unknown arguments are returned for Qt in the GUI mode and rejected in
+    the batch mode.
+    """
+
+    from .image_store import DEFAULT_MAX_SIZE
+    from .memory_budget import DEFAULT_MEMORY_BUDGET
+
+    parser = ArgumentParser(description='Markdown articles downloader and converter.')
+    parser.add_argument('-b', '--batch', metavar='LINKS_FILE',
+                        help='process links from the file without the GUI')
+    parser.add_argument('-o', '--out', default='.', help='output path for the batch mode')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='fixed workers count for the batch mode, adaptive by default')
+    parser.add_argument('--min-workers', type=int, default=None,
+                        help='minimum adaptive workers count, 1 by default')
+    parser.add_argument('--max-workers', type=int, default=None,
+                        help='maximum adaptive workers count, 4 * CPU count for threads, '
+                             '2 * CPU count for processes by default')
+    parser.add_argument('-P', '--processes', action='store_true',
+                        help='convert articles in the worker processes instead of threads')
+    parser.add_argument('--max-requests', type=int, default=64,
+                        help='maximum simultaneous HTTP requests count for the whole batch')
+    parser.add_argument('--max-host-requests', type=int, default=8,
+                        help='maximum simultaneous HTTP requests count for one host')
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help='maximum idle kept alive connections count for one host, '
+                             '--max-host-requests by default')
+    parser.add_argument('--keepalive', type=float, default=30.0,
+                        help='idle connection lifetime in seconds, '
+                             '0 to close connections after each request')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // 2 ** 20,
+                        metavar='MIB',
+                        help='memory for the buffered downloads and the conversions, MiB, '
+                             '0 - unlimited')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='requests per second for one host, 0 - unlimited')
+    parser.add_argument('--rate-burst', type=int, default=1,
+                        help='requests count, which can be sent to one host at once, '
+                             'for --rate-limit')
+    parser.add_argument('--rate-config', metavar='FILE', default=None,
+                        help='per host rate limits: INI file with [default] and [host name] '
+                             'sections, with "rate" and "burst" keys')
+    parser.add_argument('-j', '--journal', default=None,
+                        help='jobs journal file, completed items are skipped on restart, '
+                             'OUT/.mart-journal.sqlite by default')
+    parser.add_argument('--no-journal', action='store_true',
+                        help='process all items, don\'t use the journal')
+    parser.add_argument('--image-store', default=None,
+                        help='images store directory, images are downloaded once and copied to the '
+                             'articles, OUT/.mart-images by default')
+    parser.add_argument('--no-image-store', action='store_true',
+                        help='download images for every article')
+    parser.add_argument('--image-store-size', type=int, default=DEFAULT_MAX_SIZE // 2 ** 20,
+                        metavar='MIB',
+                        help='images store size limit, MiB, least recently used images are '
+                             'removed, 0 - unlimited')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='check completed items for the source changes, process changed '
+                             'articles only')
+    parser.add_argument('--timings-report', metavar='FILE', default=None,
+                        help='write items processing phases timings: CSV for the ".csv" file, '
+                             'JSON otherwise')
+    parser.add_argument('--fifo', action='store_true',
+                        help='process links in the file order, shortest expected job first by '
+                             'default')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='retries count of the transient failures: timeouts, 429 and 5xx '
+                             'responses')
+    parser.add_argument('--retry-budget', type=int, default=20,
+                        help='retries count for one host in the batch')
+    parser.add_argument('-f', '--output-format', default='md', help='output format: md, html, pdf')
+    parser.add_argument('-t', '--timeout', type=int, default=-1,
+                        help='downloading timeout, -1 to wait forever')
+    parser.add_argument('-D', '--dedup', type=int, choices=(0, 1, 2), default=0,
+                        help='deduplication type: 0 - disabled, 1 - by names hashing, '
+                             '2 - by content (duplicates are searched in all articles)')
+    parser.add_argument('--dedup-index', default=None,
+                        help='content deduplication index file, OUT/.mart-dedup.sqlite by default')
+    parser.add_argument('-d', '--images-dir', default='images', help='images directory name')
+    parser.add_argument('-p', '--images-public-path', default='', help='images public path')
+    parser.add_argument('-s', '--skip-list', default='',
+                        help='whitespace separated URLs of images to skip')
+    parser.add_argument('-a', '--skip-all-incorrect', action='store_true',
+                        help='skip all incorrect images')
+    parser.add_argument('-m', '--download-incorrect-mime', action='store_true',
+                        help='download images with unrecognized MIME type')
+    parser.add_argument('-R', '--remove-source', action='store_true', help='remove source file')
+    parser.add_argument('-H', '--save-hierarchy', action='store_true', help='save images hierarchy')
+
+    parsed, unknown = parser.parse_known_args(args)
+    if parsed.batch and unknown:
+        parser.error(f'unrecognized arguments: {" ".join(unknown)}')
+
+    return parsed, unknown
+
+
 def main():
-    create_qt_ui(sys.argv)
+    args, qt_args = parse_args(sys.argv[1:])
+
+    if args.batch:
+        sys.exit(run_batch(args))
 
+    create_qt_ui([sys.argv[0], *qt_args])
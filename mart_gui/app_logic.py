@@ -1,88 +1,652 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor, Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from operator import attrgetter
 from os import cpu_count
-from typing import List, Tuple, Callable, Optional
+from pathlib import Path
+from threading import Condition
+from typing import Dict, List, Tuple, Callable, Optional
 
-from markdown_toolset.article_processor import ArticleProcessor, IN_FORMATS_LIST, OUT_FORMATS_LIST
+from markdown_toolset.article_processor import IN_FORMATS_LIST, OUT_FORMATS_LIST
 from markdown_toolset.deduplicators import DeduplicationVariant
 
-from .item_parameters import ItemParameters
+from .cancellation import CancelToken, JobCancelled
+from .completion import CompletionTracker, ProgressSnapshot
+from .concurrency import AimdController, ConcurrencyTuner
+from .dedup_index import DedupIndex
+from .fetcher import AsyncFetcher, RetryDelay
+from .image_store import ImageStore
+from .item_parameters import ItemOptions
+from .journal import JobJournal, JournalEntry
+from .memory_budget import MemoryBudget
+from .pipeline import Pipeline, Stage
+from .prefetch import PrefetchedArticle, PrefetchedArticleProcessor, prefetch_article
+from .retry import RetryPolicy, classify_error
+from .scheduling import JobCostEstimator, schedule_key
+from .timings import ItemTimings
 
 
 _logger = logging.getLogger(__name__)
 
 
+def _init_process_worker():
+    """
+    Worker process initializer: import heavy modules once, before the first item.
+    """
+
+    # pylint: disable=import-outside-toplevel, unused-import
+    import markdown_toolset.formatters  # noqa
+    import markdown_toolset.transformers  # noqa
+    _logger.debug('Worker process initialized')
+
+
+class Job:
+    """
+    Item processing state, passed between the pipeline stages.
+    """
+
+    def __init__(self, file_path: str, index: int, item: ItemOptions, cancel_token: CancelToken):
+        self.file_path = file_path
+        self.index = index
+        self.item = item
+        self.cancel_token = cancel_token
+        self.options = item.fingerprint()
+        # Previous processing record, if the item was completed earlier.
+        self.journal_entry: Optional[JournalEntry] = None
+        self.prefetched: Optional[PrefetchedArticle] = None
+        self.output_file_path: Optional[Path] = None
+        self.timings = ItemTimings(file_path)
+        self.schedule_key = schedule_key(item.priority, 0.0)
+        # Indexes of the same items, which were added while this job was queued: they get this job
+        # result.
+        self.duplicates: List[int] = []
+        # Fetching was started, changed under the engine lock.
+        self.started = False
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.file_path, self.options
+
+    def cleanup(self):
+        if self.prefetched is not None:
+            self.prefetched.cleanup()
+
+
 class AppLogic:
     """
     Main logic class.
+
+    The engine is a long-lived work queue: items can be added at any time, also while the previous
+    items are processed. Item, which is queued or processed already with the same options, is not
+    queued again: it gets the result of the queued one. Progress is reported for all items, added
+    since the engine was idle.
+
+    Items are processed by the pipeline:
+
+    - fetch stage downloads the article source and the images (I/O-bound, images of the article are
+      downloaded concurrently by the fetcher, shared by all items, images store prevents downloading
+      the same image twice);
+    - transform stage converts the article (CPU-bound, one worker per core, threads or processes);
+    - write stage finalizes the results and removes temporary files.
+
+    Fetch and transform workers counts are adaptive between `min_workers` and `max_workers` (fetch
+    stage has 4 times more workers): they grow while the throughput grows and shrink when it drops
+    or the CPU is saturated. Equal limits give the fixed workers count.
+
+    Items are fetched in the order of the priority, then the shortest expected job first (by the
+    previous runs timings or by the local source size), then in the adding order.
+
+    Transient failures (timeouts, connection errors, 429 and 5xx responses) are retried with the
+    jittered exponential backoff by `retry_policy`: failed requests are repeated by the fetcher, the
+    conversion is repeated after the images failures, only failed images are downloaded again. Every
+    host has the retries budget for the batch. Failed items are reported with the failure class:
+    transient, permanent or conversion.
+
+    With the memory budget, the conversion reserves the expected document memory (the source size
+    multiplied by `document_memory_factor` and the largest image) and waits while the budget is used
+    up. The budget is shared with the fetcher, which reserves the buffered response bodies. Sources
+    and images are streamed to the disk.
+
+    With the journal, items states are saved: completed items are not processed again, when the
+    batch is restarted. In the incremental mode completed items are checked for the source changes
+    by the conditional requests (ETag, Last-Modified, content hash) and only changed articles are
+    processed.
     """
+    # Converted document takes several times more memory than its source: text, lines, links and the
+    # output.
+    document_memory_factor = 8
+    # Conversion, interrupted by the crash of a worker process, is repeated in the restarted pool:
+    # the crash can be caused by the other item, converted at the same time.
+    process_crash_retries = 2
+
     def __init__(self, done_callback: Callable,
                  on_item_success: Optional[Callable] = None,
-                 on_item_fail: Optional[Callable] = None):
-        self._core_count = cpu_count() + 1
-        self._pool = ThreadPoolExecutor(max_workers=self._core_count)
-        self._futures = []
+                 on_item_fail: Optional[Callable] = None,
+                 max_workers: Optional[int] = None,
+                 use_processes: bool = False,
+                 fetch_workers: Optional[int] = None,
+                 fetcher: Optional[AsyncFetcher] = None,
+                 journal: Optional[JobJournal] = None,
+                 image_store: Optional[ImageStore] = None,
+                 dedup_index: Optional[DedupIndex] = None,
+                 min_workers: Optional[int] = None,
+                 memory_budget: Optional[MemoryBudget] = None):
+        self._use_processes = use_processes
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+        # Conversions are CPU-bound: one worker per core is the start point, one process per core
+        # bypasses the GIL.
+        initial = cpu_count() if use_processes else cpu_count() + 1
+        maximum = max_workers if max_workers else (2 if use_processes else 4) * cpu_count()
+        minimum = min(min_workers, maximum) if min_workers else 1
+        self._transform_control = AimdController(minimum, maximum, initial)
+
+        self._process_workers = maximum
+        if use_processes:
+            self._process_pool = self._create_process_pool()
+
+        # Fetching mostly waits for the network: CPU saturation is not a reason to stop fetching.
+        if fetch_workers:
+            self._fetch_control = AimdController(fetch_workers, fetch_workers)
+        else:
+            self._fetch_control = AimdController(minimum, 4 * maximum,
+                                                 4 * self._transform_control.limit,
+                                                 increase_step=4, cpu_threshold=None)
+
+        self._fetcher = fetcher if fetcher is not None \
+            else AsyncFetcher(memory_budget=memory_budget)
+        self._memory_budget = memory_budget
+        self._journal = journal
+        self._image_store = image_store
+        self._dedup_index = dedup_index
+        self.skip_completed = True
+        self.incremental = False
+        # Images are taken from the images store, if it's set.
+        self.use_image_store = True
+        self.shortest_first = True
+        self.retry_policy = RetryPolicy()
+        self._cost_estimator = JobCostEstimator(journal)
+
+        # Jobs count, which are not finished.
+        self._pending_count = 0
+        # Items counters and the throughput of the current work.
+        self._tracker = CompletionTracker()
+        # Not finished jobs by the item key.
+        self._queued: Dict[Tuple[str, str], Job] = {}
+        self._item_timings: Dict[int, ItemTimings] = {}
+        self._cancel_token = CancelToken()
+        self._condition = Condition()
         self._done_callback = done_callback
         self._on_item_success = on_item_success
         self._on_item_fail = on_item_fail
 
-    def add_items(self, items: List[Tuple[str, int, ItemParameters]]):
-        if self.running:
+        fetch_stage = Stage('fetch', self._fetch, self._fetch_control.maximum,
+                            limit=self._fetch_control.limit, order=attrgetter('schedule_key'))
+        transform_stage = Stage('transform', self._transform, maximum, 2 * maximum,
+                                limit=self._transform_control.limit)
+        self._pipeline = Pipeline([
+            fetch_stage,
+            transform_stage,
+            Stage('write', self._write, 2, 2 * maximum),
+        ], self._job_done, self._job_failed, self._job_cancelled)
+
+        # Journal lookups and estimates of the added items batches, in the adding order.
+        self._admission = Stage('admit', self._admit, 1)
+        self._admission.start(lambda stage, jobs: None, self._admission_failed)
+
+        self._tuner = ConcurrencyTuner([(fetch_stage, self._fetch_control),
+                                        (transform_stage, self._transform_control)])
+        self._tuner.start()
+
+    def add_items(self, items: List[Tuple[str, int, ItemOptions]]):
+        """
+        Queue items, the engine can be running.
+
+        Items, added after `stop()` and before the completion, are cancelled with the running ones.
+        Completed items are searched in the journal by the admission thread: the caller is not
+        blocked.
+        """
+
+        if not items:
             return
 
-        self._futures.clear()
-        for i in items:
-            _logger.debug('Adding worker for "%s"', i[0])
-            f = self._pool.submit(self._worker, *i)
-            self._futures.append(f)
-            f.add_done_callback(self._future_done)
+        jobs = []
+
+        with self._condition:
+            if 0 == self._pending_count:
+                # New work.
+                self._cancel_token = CancelToken()
+                self.retry_policy.reset()
+                self._pipeline.resume()
+                self._item_timings = {}
+                self._tracker.reset()
+
+            for i in items:
+                job = Job(*i, self._cancel_token)
+                self._tracker.add()
+
+                if (queued := self._queued.get(job.key)) is not None:
+                    _logger.info('"%s" is queued already', job.file_path)
+                    queued.duplicates.append(job.index)
+                    self._item_timings[job.index] = queued.timings
+                    if queued.started:
+                        self._tracker.start()
+                    continue
+
+                self._queued[job.key] = job
+                self._item_timings[job.index] = job.timings
+                jobs.append(job)
+
+            self._pending_count += len(jobs)
+
+        if jobs:
+            self._admission.put(jobs)
+
+    def _admit(self, jobs: List[Job]):
+        """
+        Skip the completed items and queue the others in the scheduling order, called from the
+        admission thread.
+        """
+
+        if jobs[0].cancel_token.cancelled:
+            for job in jobs:
+                self._job_cancelled(job)
+            return
+
+        completed = {}
+
+        if self._journal is not None and (self.skip_completed or self.incremental):
+            completed = self._journal.completed((j.file_path, j.options) for j in jobs)
+
+        queued = []
+
+        for job in jobs:
+            job.journal_entry = completed.get((job.file_path, job.options))
+
+            if job.journal_entry is not None and not self.incremental:
+                _logger.info('"%s" was completed already', job.file_path)
+                job.output_file_path = job.journal_entry.output_path
+                self._job_done(job, 'skipped')
+                continue
+
+            queued.append(job)
+
+        if self.shortest_first and queued:
+            estimates = self._cost_estimator.estimate(j.file_path for j in queued)
+            for job in queued:
+                job.schedule_key = schedule_key(job.item.priority, estimates[job.file_path])
+
+        # Idle workers take the first jobs before the others were queued: the queue order is not
+        # enough.
+        queued.sort(key=attrgetter('schedule_key'))
+
+        for job in queued:
+            if job.cancel_token.cancelled:
+                # Stopped during the lookup: the pipeline queues were drained already.
+                self._job_cancelled(job)
+                continue
+
+            _logger.debug('Adding job for "%s"', job.file_path)
+            self._pipeline.put(job)
+
+    def _admission_failed(self, jobs: List[Job], error: Exception):
+        for job in jobs:
+            self._job_failed(job, error)
 
     @property
     def running(self) -> bool:
-        for f in self._futures:
-            if f.running():
-                return True
-        return False
+        return self._pending_count > 0
+
+    @property
+    def progress(self) -> Tuple[int, int]:
+        """
+        Finished and total items count of the current or the last work.
+        """
+
+        status = self._tracker.snapshot()
+        return status.finished, status.total
+
+    @property
+    def status(self) -> ProgressSnapshot:
+        """
+        Items counters by the state, throughput and ETA of the current or the last work.
+        """
+
+        return self._tracker.snapshot()
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Jobs count, waiting in the stages queues.
+        """
+
+        return sum(s.queue_depth for s in self._pipeline.stages)
+
+    @property
+    def use_processes(self) -> bool:
+        return self._use_processes
+
+    @property
+    def journal(self) -> Optional[JobJournal]:
+        return self._journal
+
+    @property
+    def workers_limits(self) -> Tuple[int, int]:
+        """
+        Minimum and maximum transform workers count.
+        """
+
+        return self._transform_control.minimum, self._transform_control.maximum
+
+    @property
+    def active_workers(self) -> Dict[str, int]:
+        """
+        Current workers count by the stage name.
+        """
+
+        return {s.name: s.limit for s in self._pipeline.stages}
+
+    @property
+    def memory_budget(self) -> Optional[MemoryBudget]:
+        return self._memory_budget
+
+    @property
+    def item_timings(self) -> Dict[int, ItemTimings]:
+        """
+        Timings of the items of the current or the last work, by the item index.
+
+        Item timings are finished before the item callback is called, duplicate items share the
+        timings.
+        """
+
+        return self._item_timings
+
+    def shutdown(self):
+        """
+        Release workers, pending items are cancelled.
+        """
+
+        self._cancel_token.cancel()
+        self._tuner.stop()
+        self._cancel_admission()
+        self._pipeline.cancel_pending()
+        self._admission.stop()
+        self._pipeline.stop()
+
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+
+        self._fetcher.close()
 
     def stop(self):
-        for f in self._futures:
-            f: Future
-            f.cancel()
+        """
+        Request cancellation and return immediately.
+
+        Running downloads and conversions are interrupted at the next chunk or step, partial files
+        are removed. Cancelled items are reported to `on_item_fail` with None error, `done_callback`
+        is called after the last one.
+        """
 
-        for f in self._futures:
-            f.result()
+        self._cancel_token.cancel()
+        self._cancel_admission()
+        self._pipeline.cancel_pending()
 
-    def _future_done(self, future: Future):
-        print('Callback', future)
+    def _cancel_admission(self):
+        for jobs in self._admission.drain():
+            for job in jobs:
+                self._job_cancelled(job)
 
-        result = future.result()
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all items will be finished.
 
-        if result and self._on_item_success is not None:
-            self._on_item_success(*result)
-        elif not result and self._on_item_fail is not None:
-            self._on_item_fail(*result)
+        :return: False on timeout.
+        """
 
-        if not self.running:
+        with self._condition:
+            return self._condition.wait_for(lambda: 0 == self._pending_count, timeout)
+
+    def _detach_job(self, job: Job) -> List[int]:
+        """
+        Remove the job from the queued ones: the same item will be queued again.
+
+        :return: indexes of the items, which get the job result.
+        """
+
+        with self._condition:
+            if self._queued.get(job.key) is job:
+                del self._queued[job.key]
+            return [job.index, *job.duplicates]
+
+    def _finish_job(self, job: Job, state: str, indexes: List[int]):
+        job.cleanup()
+        counters = job.timings.counters
+        self._tracker.finish(state, len(indexes), job.started,
+                             counters.get('source_bytes', 0) + counters.get('image_bytes', 0))
+
+        with self._condition:
+            self._pending_count -= 1
+            completed = 0 == self._pending_count
+            self._condition.notify_all()
+
+        if completed:
             self._done_callback()
 
+    def _job_done(self, job: Job, state: Optional[str] = None):
+        if state is None:
+            state = 'skipped' if job.prefetched is not None and job.prefetched.unchanged else 'done'
+        job.timings.finish(state)
+        indexes = self._detach_job(job)
+
+        if self._on_item_success is not None:
+            for index in indexes:
+                self._on_item_success(index, job.output_file_path)
+
+        self._finish_job(job, 'succeeded', indexes)
+
+    def _job_failed(self, job: Job, error: Exception):
+        if isinstance(error, JobCancelled) or job.cancel_token.cancelled:
+            self._job_cancelled(job)
+            return
+
+        failure_class = classify_error(error)
+        _logger.error('Processing "%s" failed (%s): %s', job.file_path, failure_class, error)
+        job.timings.finish('failed')
+
+        if self._journal is not None:
+            self._journal.record_failed(job.file_path, job.options, str(error))
+
+        indexes = self._detach_job(job)
+
+        if self._on_item_fail is not None:
+            for index in indexes:
+                self._on_item_fail(index, job.file_path, error, failure_class)
+
+        self._finish_job(job, 'failed', indexes)
+
+    def _job_cancelled(self, job: Job):
+        _logger.debug('Processing "%s" cancelled', job.file_path)
+        job.timings.finish('cancelled')
+        indexes = self._detach_job(job)
+
+        if self._on_item_fail is not None:
+            for index in indexes:
+                self._on_item_fail(index, job.file_path, None, None)
+
+        self._finish_job(job, 'cancelled', indexes)
+
+    def _fetch(self, job: Job):
+        item = job.item
+        _logger.info('Fetching "%s"', job.file_path)
+        job.timings.started()
+
+        with self._condition:
+            job.started = True
+            self._tracker.start(1 + len(job.duplicates))
+        source_state = job.journal_entry.source_state if job.journal_entry is not None else None
+        job.prefetched = prefetch_article(job.file_path, self._fetcher, item.skip_list,
+                                          bool(item.download_incorrect_mime),
+                                          item.downloading_timeout, job.cancel_token, source_state,
+                                          self._image_store if self.use_image_store else None,
+                                          job.timings, self._retry_delay(job))
+
+    def _transform(self, job: Job):
+        if job.prefetched.unchanged:
+            _logger.info('"%s" was not changed, skipping', job.file_path)
+            job.output_file_path = job.journal_entry.output_path
+            return
+
+        attempt = 0
+
+        while True:
+            try:
+                job.output_file_path, phases = self._convert(job)
+                break
+            except Exception as e:
+                delay = self._retry_delay(job)(e, attempt, job.file_path)
+                if delay is None:
+                    raise
+
+                attempt += 1
+                # Images, which were downloaded, are reused.
+                job.prefetched.forget_failed()
+                _logger.warning('Converting "%s" failed: %s, retrying in %.2f s', job.file_path, e,
+                                delay)
+
+                if job.cancel_token.wait(delay):
+                    raise JobCancelled('Cancelled by user') from e
+
+        job.timings.merge(phases)
+
+    def _convert(self, job: Job) -> Tuple[str, Dict[str, float]]:
+        budget = self._memory_budget
+        reserved = budget.reserve(self._memory_estimate(job), job.cancel_token) \
+            if budget is not None else 0
+
+        try:
+            if self._process_pool is not None:
+                return self._convert_in_process(job)
+
+            return self._worker(job.file_path, job.item, job.prefetched, job.cancel_token,
+                                self._fetcher, self._dedup_index, self._retry_delay(job))
+        finally:
+            if reserved:
+                budget.release(reserved)
+
+    def _convert_in_process(self, job: Job) -> Tuple[str, Dict[str, float]]:
+        attempt = 0
+
+        while True:
+            pool = self._process_pool
+            try:
+                # Token and retry policy can't be passed to the process: running conversion will be
+                # finished.
+                return pool.submit(self._worker, job.file_path, job.item, job.prefetched, None,
+                                   None, self._dedup_index).result()
+            except BrokenProcessPool:
+                # All conversions of the pool get this error, the pool is not usable anymore.
+                self._restart_process_pool(pool)
+                if attempt >= self.process_crash_retries:
+                    raise
+                attempt += 1
+                job.cancel_token.raise_if_cancelled()
+                _logger.warning('Worker process crashed while converting "%s", retrying',
+                                job.file_path)
+
+    def _create_process_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self._process_workers,
+                                   initializer=_init_process_worker)
+
+    def _restart_process_pool(self, broken: ProcessPoolExecutor):
+        with self._condition:
+            if self._process_pool is not broken:
+                # Restarted by the other conversion.
+                return
+            self._process_pool = self._create_process_pool()
+
+        _logger.warning('Worker process crashed, process pool was restarted')
+        broken.shutdown(wait=False)
+
+    def _memory_estimate(self, job: Job) -> int:
+        """
+        Expected conversion memory: the document and one image at a time.
+        """
+
+        prefetched = job.prefetched
+        source = prefetched.source_path if prefetched.source_path is not None \
+            else Path(job.file_path).expanduser()
+        paths = [i.path for i in prefetched.images.values() if i.path is not None]
+
+        def _size(path: Path) -> int:
+            try:
+                return path.stat().st_size
+            except OSError:
+                return 0
+
+        return self.document_memory_factor * _size(source) + max(map(_size, paths), default=0)
+
+    def _retry_delay(self, job: Job) -> RetryDelay:
+        def delay(error: Exception, attempt: int, url: str) -> Optional[float]:
+            if (result := self.retry_policy.next_delay(error, attempt, url)) is not None:
+                job.timings.count('retries')
+            return result
+
+        return delay
+
+    def _write(self, job: Job):
+        with job.timings.phase('write'):
+            job.cleanup()
+
+            if self._journal is not None:
+                # Unchanged item was not processed: the history is kept.
+                if not job.prefetched.unchanged:
+                    duration = job.timings.processing_time
+                    source_bytes = job.timings.counters.get('source_bytes')
+                else:
+                    duration = source_bytes = None
+                self._journal.record_done(job.file_path, job.options, job.output_file_path,
+                                          job.prefetched.source_state, duration, source_bytes)
+
+            try:
+                job.timings.count('output_bytes', Path(job.output_file_path).stat().st_size)
+            except (OSError, TypeError):
+                pass
+
+        _logger.info('Processing "%s" completed', job.file_path)
+
     @staticmethod
     def _create_article_processor(**kwargs):
-        return ArticleProcessor(**kwargs)
+        return PrefetchedArticleProcessor(**kwargs)
+
+    @classmethod
+    def _worker(cls, file_path: str, item: ItemOptions, prefetched: PrefetchedArticle,
+                cancel_token: Optional[CancelToken] = None, fetcher: Optional[AsyncFetcher] = None,
+                dedup_index: Optional[DedupIndex] = None, retry: Optional[RetryDelay] = None):
+        """
+        Convert one item, must be picklable to run in the worker process: doesn't use the instance
+        state.
+
+        The fetcher can't be passed to the process: not prefetched images are downloaded there
+        without it.
+        """
 
-    def _worker(self, file_path: str, index: int, item: ItemParameters):
         _logger.debug('Starting worker for "%s"', file_path)
-        a_proc = self._create_article_processor(
+        a_proc = cls._create_article_processor(
+            prefetched=prefetched,
+            cancel_token=cancel_token,
+            fetcher=fetcher,
+            dedup_index=dedup_index,
+            retry=retry,
             article_file_path_or_url=file_path,
             skip_list=item.skip_list, downloading_timeout=item.downloading_timeout,
             output_format=OUT_FORMATS_LIST[item.output_format], output_path=item.output_path,
             remove_source=item.remove_source, images_public_path=item.images_public_path,
             input_formats=IN_FORMATS_LIST, skip_all_incorrect=item.skip_all_incorrect,
             download_incorrect_mime=item.download_incorrect_mime,
-            deduplication_type=[i for i in DeduplicationVariant.__members__.values()][item.deduplication_type],
+            deduplication_type=[i for i in DeduplicationVariant.__members__.values()][
+                item.deduplication_type],
             images_dirname=item.images_dir_name,
             save_hierarchy=item.save_hierarchy
         )
         _logger.info('Processing "%s"', file_path)
-        output_file_path = a_proc.process()
-        _logger.info('Processing "%s" completed', file_path)
-        return index, output_file_path
+        return a_proc.process(), a_proc.timings.phases
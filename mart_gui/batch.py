@@ -0,0 +1,188 @@
+"""
+Headless batch processing: drives `AppLogic` without the Qt UI.
+"""
+import logging
+from collections import Counter
+from pathlib import Path
+from threading import Event, Lock
+from time import monotonic
+from typing import List, Optional, TextIO, Tuple, Union
+
+from .app_logic import AppLogic
+from .dedup_index import DedupIndex
+from .fetcher import AsyncFetcher
+from .image_store import ImageStore
+from .item_parameters import ItemParameters
+from .journal import JobJournal
+from .memory_budget import MemoryBudget
+from .retry import RetryPolicy
+from .timings import ItemTimings
+
+
+_logger = logging.getLogger(__name__)
+
+
+def read_links(links_file: Union[Path, str]) -> List[str]:
+    """
+    Read non-empty links from the file, one link per line.
+    """
+
+    with open(links_file, 'r') as lf:
+        return [lrs for line in lf if (lrs := line.rstrip())]
+
+
+class BatchStats:
+    """
+    Batch results accumulator.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.succeeded = 0
+        self.bytes_written = 0
+        self.bytes_deduplicated = 0
+        self.retries = 0
+        self.throttled = 0
+        self.memory_budget: Optional[MemoryBudget] = None
+        # (link, failure class, error text).
+        self.failures: List[Tuple[str, str, str]] = []
+        self._start_time = monotonic()
+        self._end_time: Optional[float] = None
+        self._lock = Lock()
+
+    def add_success(self, output_file_path: Union[Path, str, None]):
+        size = 0
+        try:
+            if output_file_path is not None:
+                size = Path(output_file_path).stat().st_size
+        except OSError as e:
+            _logger.warning('Can\'t get size of "%s": %s', output_file_path, e)
+
+        with self._lock:
+            self.succeeded += 1
+            self.bytes_written += size
+
+    def add_failure(self, link: str, error: Optional[BaseException],
+                    failure_class: Optional[str] = None):
+        with self._lock:
+            if error is None:
+                self.failures.append((link, 'cancelled', 'cancelled'))
+            else:
+                self.failures.append((link, failure_class or 'unknown', str(error)))
+
+    def finish(self):
+        self._end_time = monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return (self._end_time if self._end_time is not None else monotonic()) - self._start_time
+
+    def print_summary(self, out: TextIO):
+        elapsed = max(self.elapsed, 1e-9)
+        processed = self.succeeded + len(self.failures)
+
+        print(f'Items: {self.total} total, {self.succeeded} succeeded, {len(self.failures)} failed',
+              file=out)
+        print(f'Elapsed: {elapsed:.2f} s, {processed / elapsed:.2f} items/s, '
+              f'{self.bytes_written / elapsed:.0f} bytes/s ({self.bytes_written} bytes written)',
+              file=out)
+
+        if self.bytes_deduplicated:
+            print(f'Deduplication: {self.bytes_deduplicated} bytes of the duplicate images were '
+                  f'not written', file=out)
+
+        if self.failures:
+            classes = Counter(failure_class for _, failure_class, _ in self.failures)
+            print('Failed: ' + ', '.join(f'{count} {c}' for c, count in sorted(classes.items())),
+                  file=out)
+            for link, failure_class, error in self.failures:
+                print(f'  {link} [{failure_class}]: {error}', file=out)
+        if self.retries:
+            print(f'Retries: {self.retries}', file=out)
+        if self.throttled:
+            print(f'Throttled requests: {self.throttled}', file=out)
+        if (budget := self.memory_budget) is not None:
+            print(f'Memory budget: {budget.peak / 2 ** 20:.1f} of {budget.limit / 2 ** 20:.0f} MiB '
+                  f'reserved at peak, {budget.waits} waits', file=out)
+
+
+class BatchRunner:
+    """
+    Process all links from the file with the same item parameters.
+    """
+
+    def __init__(self, links_file: Union[Path, str], item: ItemParameters,
+                 max_workers: Optional[int] = None, use_processes: bool = False,
+                 fetcher: Optional[AsyncFetcher] = None,
+                 journal: Optional[JobJournal] = None, incremental: bool = False,
+                 image_store: Optional[ImageStore] = None, dedup_index: Optional[DedupIndex] = None,
+                 min_workers: Optional[int] = None, shortest_first: bool = True,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 memory_budget: Optional[MemoryBudget] = None):
+        self._links_file = links_file
+        self._item = item
+        self._max_workers = max_workers
+        self._min_workers = min_workers
+        self._shortest_first = shortest_first
+        self._retry_policy = retry_policy
+        self._memory_budget = memory_budget
+        self._use_processes = use_processes
+        self._fetcher = fetcher
+        self._journal = journal
+        self._incremental = incremental
+        self._image_store = image_store
+        self._dedup_index = dedup_index
+        self._links: List[str] = []
+        self._completed = Event()
+        self.stats = BatchStats(0)
+        self.timings: List[ItemTimings] = []
+
+    def run(self) -> BatchStats:
+        self._links = read_links(self._links_file)
+        self.stats = BatchStats(len(self._links))
+        _logger.info('Loaded %d links from "%s"', len(self._links), self._links_file)
+        bytes_saved = self._dedup_index.bytes_saved if self._dedup_index is not None else 0
+        throttled = self._fetcher.rate_limiter.throttled_count if self._fetcher is not None else 0
+
+        if self._links:
+            app_logic = AppLogic(self._completed.set, self._on_item_success, self._on_item_fail,
+                                 self._max_workers, self._use_processes, fetcher=self._fetcher,
+                                 journal=self._journal,
+                                 image_store=self._image_store, dedup_index=self._dedup_index,
+                                 min_workers=self._min_workers, memory_budget=self._memory_budget)
+            app_logic.incremental = self._incremental
+            app_logic.shortest_first = self._shortest_first
+            if self._retry_policy is not None:
+                app_logic.retry_policy = self._retry_policy
+            app_logic.add_items([(link, index, self._item)
+                                 for index, link in enumerate(self._links)])
+
+            try:
+                self._completed.wait()
+            except KeyboardInterrupt:
+                _logger.info('Interrupted by user, stopping...')
+                app_logic.stop()
+                app_logic.wait()
+            finally:
+                app_logic.shutdown()
+
+            self.timings = list(app_logic.item_timings.values())
+            self.stats.retries = sum(t.counters.get('retries', 0) for t in self.timings)
+
+        self.stats.finish()
+        self.stats.memory_budget = self._memory_budget
+
+        if self._dedup_index is not None:
+            self.stats.bytes_deduplicated = self._dedup_index.bytes_saved - bytes_saved
+
+        if self._fetcher is not None:
+            self.stats.throttled = self._fetcher.rate_limiter.throttled_count - throttled
+
+        return self.stats
+
+    def _on_item_success(self, index: int, output_file_path: Union[Path, str]):
+        self.stats.add_success(output_file_path)
+
+    def _on_item_fail(self, index: int, file_path: str, error: Optional[BaseException],
+                      failure_class: Optional[str] = None):
+        self.stats.add_failure(file_path, error, failure_class)
@@ -0,0 +1,97 @@
+"""
+Options editing of the selected links: edits are applied to the rows ranges, typing is applied once
+per pause.
+"""
+import logging
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+
+from .links_model import LinksModel, OptionEdit, RowRanges
+
+
+_logger = logging.getLogger(__name__)
+
+
+class BulkEditor(QObject):
+    """
+    Applies the option edits to the links model.
+
+    Debounced edit is kept until the pause: the next edit of the same option and rows replaces it,
+    one change is applied for the whole typing. Pending edit is applied before the rows are moved or
+    removed and before the selection is read.
+    """
+
+    # Pause of the typing, after which the edit is applied.
+    debounce_interval_ms = 300
+
+    def __init__(self, model: LinksModel, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._model = model
+        self._pending: Optional[OptionEdit] = None
+        self._parse: Optional[Callable[[Any], Any]] = None
+
+        self.edits_count = 0
+        self.applied_count = 0
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.debounce_interval_ms)
+        self._timer.timeout.connect(self.flush)
+
+        model.rowsAboutToBeRemoved.connect(self.flush)
+        model.layoutAboutToBeChanged.connect(self.flush)
+        model.modelAboutToBeReset.connect(self.flush)
+
+    @property
+    def pending(self) -> bool:
+        return self._pending is not None
+
+    def edit(self, ranges: RowRanges, name: str, value: Any, debounce: bool = False,
+             parse: Optional[Callable[[Any], Any]] = None):
+        """
+        Set the option of the rows.
+
+        :parameter ranges: merged rows ranges, see `merge_ranges()`.
+        :parameter debounce: apply after the pause, i.e. text typing.
+        :parameter parse: converts the value, when the edit is applied: debounced text is parsed
+                          once.
+        """
+
+        if not ranges:
+            return
+
+        pending = self._pending
+        if pending is not None and (pending.ranges != ranges or pending.name != name):
+            self.flush()
+
+        self.edits_count += 1
+        self._pending = OptionEdit(ranges, name, value)
+        self._parse = parse
+
+        if debounce:
+            self._timer.start()
+        else:
+            self.flush()
+
+    @pyqtSlot()
+    def flush(self):
+        """
+        Apply the pending edit now.
+        """
+
+        self._timer.stop()
+        edit, self._pending = self._pending, None
+        if edit is None:
+            return
+
+        if self._parse is not None:
+            edit = edit._replace(value=self._parse(edit.value))
+            self._parse = None
+
+        start = monotonic()
+        self._model.apply_edit(edit)
+        self.applied_count += 1
+        _logger.debug('Option "%s" of %d rows ranges was set in %.3f s', edit.name,
+                      len(edit.ranges), monotonic() - start)
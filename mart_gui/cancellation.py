@@ -0,0 +1,68 @@
+"""
+Cooperative cancellation: long operations check the token or subscribe to its cancellation.
+"""
+from threading import Event, Lock
+from typing import Callable, List, Optional
+
+
+class JobCancelled(Exception):
+    """
+    Operation was cancelled by the user.
+    """
+
+
+class CancelToken:
+    """
+    Thread-safe cancellation flag with the callbacks, which are called once on cancel.
+    """
+
+    def __init__(self):
+        self._event = Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+
+        for c in callbacks:
+            c()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Sleep until the timeout or the cancellation.
+
+        :return: True if cancelled.
+        """
+
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled('Cancelled by user')
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Add callback, it will be called immediately, if the token was cancelled already.
+        """
+
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return callback
+
+        callback()
+        return callback
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
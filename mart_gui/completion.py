@@ -0,0 +1,128 @@
+"""
+Work progress: items counters by the state and the sliding window throughput.
+"""
+from collections import deque
+from threading import Lock
+from time import monotonic
+from typing import Deque, NamedTuple, Optional, Tuple
+
+
+class ProgressSnapshot(NamedTuple):
+    total: int
+    pending: int
+    running: int
+    succeeded: int
+    failed: int
+    cancelled: int
+    # Sliding window throughput.
+    items_per_second: float
+    bytes_per_second: float
+    # Expected remaining time in seconds, None if the throughput is not known yet.
+    eta: Optional[float]
+
+    @property
+    def finished(self) -> int:
+        return self.succeeded + self.failed + self.cancelled
+
+
+class CompletionTracker:
+    """
+    Thread-safe items counters: every change and the snapshot are O(1) (the window is amortized
+    O(1)).
+
+    Item is pending, then running, then finished: succeeded, failed or cancelled. Item can be
+    finished without running, i.e. when it was cancelled in the queue.
+    """
+
+    def __init__(self, window: float = 10.0):
+        """
+        :parameter window: throughput averaging interval in seconds.
+        """
+
+        self._window = window
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._total = 0
+            self._pending = 0
+            self._running = 0
+            self._succeeded = 0
+            self._failed = 0
+            self._cancelled = 0
+            self._started_at: Optional[float] = None
+            # (finish time, items, bytes).
+            self._finished: Deque[Tuple[float, int, int]] = deque()
+            self._window_items = 0
+            self._window_bytes = 0
+
+    def add(self, count: int = 1):
+        with self._lock:
+            self._total += count
+            self._pending += count
+            if self._started_at is None:
+                self._started_at = monotonic()
+
+    def start(self, count: int = 1):
+        with self._lock:
+            self._pending -= count
+            self._running += count
+
+    def finish(self, state: str, count: int = 1, was_running: bool = True, bytes_count: int = 0):
+        """
+        :parameter state: "succeeded", "failed" or "cancelled", cancelled items are not counted in
+                          the throughput.
+        :parameter was_running: False - item is finished in the queue.
+        :parameter bytes_count: downloaded bytes.
+        """
+
+        now = monotonic()
+
+        with self._lock:
+            if was_running:
+                self._running -= count
+            else:
+                self._pending -= count
+
+            if 'succeeded' == state:
+                self._succeeded += count
+            elif 'failed' == state:
+                self._failed += count
+            else:
+                self._cancelled += count
+
+            # Cancelled items are not processed: they would inflate the throughput and shorten ETA
+            # after Stop.
+            if 'cancelled' != state:
+                self._finished.append((now, count, bytes_count))
+                self._window_items += count
+                self._window_bytes += bytes_count
+            self._expire(now)
+
+    def snapshot(self) -> ProgressSnapshot:
+        now = monotonic()
+
+        with self._lock:
+            self._expire(now)
+            # The window is shorter at the start.
+            interval = min(self._window, now - self._started_at) \
+                if self._started_at is not None else 0.0
+            items_per_second = self._window_items / interval if interval > 0 else 0.0
+            bytes_per_second = self._window_bytes / interval if interval > 0 else 0.0
+            remaining = self._pending + self._running
+            if items_per_second > 0:
+                eta = remaining / items_per_second
+            else:
+                eta = 0.0 if not remaining else None
+
+            return ProgressSnapshot(self._total, self._pending, self._running, self._succeeded,
+                                    self._failed, self._cancelled, items_per_second,
+                                    bytes_per_second, eta)
+
+    def _expire(self, now: float):
+        finished = self._finished
+        while finished and now - finished[0][0] > self._window:
+            _, items, bytes_count = finished.popleft()
+            self._window_items -= items
+            self._window_bytes -= bytes_count
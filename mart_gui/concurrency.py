@@ -0,0 +1,191 @@
+"""
+Adaptive workers count: AIMD controller, driven by the measured throughput, queue waiting and CPU
+saturation.
+"""
+import logging
+import os
+import sys
+from threading import Event, Thread
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from .pipeline import Stage
+
+
+_logger = logging.getLogger(__name__)
+
+
+class CpuMonitor:
+    """
+    CPU utilization since the previous call: of the whole system on Linux, of the process and its
+    children otherwise.
+    """
+
+    def __init__(self):
+        self._cpu_count = os.cpu_count() or 1
+        self._last = self._sample()
+
+    def utilization(self) -> float:
+        """
+        :return: 0.0 - idle, 1.0 - all cores are busy.
+        """
+
+        busy, total = self._sample()
+        last_busy, last_total = self._last
+        self._last = busy, total
+
+        if total <= last_total:
+            return 0.0
+
+        return max(0.0, min(1.0, (busy - last_busy) / (total - last_total)))
+
+    def _sample(self) -> Tuple[float, float]:
+        if sys.platform.startswith('linux'):
+            try:
+                with open('/proc/stat', encoding='ascii') as f:
+                    # cpu user nice system idle iowait irq softirq steal ...
+                    values = [int(v) for v in f.readline().split()[1:]]
+                return sum(values) - values[3] - values[4], sum(values)
+            except (OSError, ValueError, IndexError):
+                pass
+
+        t = os.times()
+        return (t.user + t.system + t.children_user + t.children_system,
+                monotonic() * self._cpu_count)
+
+
+class AimdController:
+    """
+    Additive increase, multiplicative decrease of the workers limit.
+
+    The limit grows by the step, while the jobs are waiting and the throughput grows. Growth stops
+    on the throughput plateau and is probed again later. The limit is cut, when the throughput drops
+    after the growth or under the CPU saturation.
+    """
+
+    def __init__(self, minimum: int, maximum: int, initial: Optional[int] = None,
+                 increase_step: int = 1, cpu_threshold: Optional[float] = 0.9,
+                 decrease_factor: float = 0.75, tolerance: float = 0.05,
+                 latency_threshold: float = 0.05, probe_delay: int = 5):
+        """
+        :parameter minimum: minimum workers count.
+        :parameter maximum: maximum workers count.
+        :parameter initial: starting workers count, `minimum` by default.
+        :parameter increase_step: additive increase.
+        :parameter cpu_threshold: CPU utilization, which is the saturation, None - don't check
+                                  (I/O-bound workers).
+        :parameter decrease_factor: multiplicative decrease factor.
+        :parameter tolerance: relative throughput change, which is the noise.
+        :parameter latency_threshold: average queue waiting in seconds, which means that jobs are
+                                      waiting for workers.
+        :parameter probe_delay: updates count to hold the limit after the plateau was found.
+        """
+
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = max(self.minimum,
+                         min(initial if initial is not None else self.minimum, self.maximum))
+
+        self._increase_step = increase_step
+        self._cpu_threshold = cpu_threshold
+        self._decrease_factor = decrease_factor
+        self._tolerance = tolerance
+        self._latency_threshold = latency_threshold
+        self._probe_delay = probe_delay
+
+        self._last_throughput: Optional[float] = None
+        self._increased = False
+        self._hold = 0
+
+    @property
+    def adaptive(self) -> bool:
+        return self.minimum < self.maximum
+
+    def update(self, throughput: float, backlog: int, queue_latency: float, cpu: float) -> int:
+        """
+        :parameter throughput: jobs per second, processed since the previous update.
+        :parameter backlog: jobs count in the queue.
+        :parameter queue_latency: average queue waiting of the processed jobs, seconds.
+        :parameter cpu: CPU utilization, 0.0 - 1.0.
+        :return: new limit.
+        """
+
+        waiting = backlog > 0 or queue_latency >= self._latency_threshold
+
+        if not throughput and not waiting:
+            # Idle: the next work can be different.
+            self._last_throughput = None
+            self._increased = False
+            self._hold = 0
+            return self.limit
+
+        last = self._last_throughput
+        self._last_throughput = throughput
+        increased, self._increased = self._increased, False
+        saturated = self._cpu_threshold is not None and cpu >= self._cpu_threshold
+
+        if last is not None and throughput < last * (1 - self._tolerance) and \
+                (increased or saturated):
+            self.limit = max(self.minimum,
+                             min(self.limit - 1, int(self.limit * self._decrease_factor)))
+            self._hold = self._probe_delay
+        elif increased and last is not None and throughput <= last * (1 + self._tolerance):
+            # Plateau: more workers don't help now.
+            self._hold = self._probe_delay
+        elif self._hold > 0:
+            self._hold -= 1
+        elif waiting and not saturated and self.limit < self.maximum:
+            self.limit = min(self.limit + self._increase_step, self.maximum)
+            self._increased = True
+
+        return self.limit
+
+
+class ConcurrencyTuner:
+    """
+    Periodically updates the stages limits by their controllers.
+    """
+
+    def __init__(self, stages: List[Tuple[Stage, AimdController]], interval: float = 2.0):
+        self._stages = [(s, c) for s, c in stages if c.adaptive]
+        self._interval = interval
+        self._cpu = CpuMonitor()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._last = {s.name: (s.processed, s.wait_time) for s, _ in self._stages}
+
+    def start(self):
+        if not self._stages:
+            return
+
+        self._thread = Thread(target=self._run, name='concurrency-tuner', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def tick(self, elapsed: float):
+        cpu = self._cpu.utilization()
+
+        for stage, controller in self._stages:
+            processed, wait_time = stage.processed, stage.wait_time
+            last_processed, last_wait_time = self._last[stage.name]
+            self._last[stage.name] = processed, wait_time
+
+            count = processed - last_processed
+            queue_latency = (wait_time - last_wait_time) / count if count else 0.0
+            limit = controller.update(count / elapsed, stage.queue_depth, queue_latency, cpu)
+
+            if limit != stage.limit:
+                _logger.debug('Stage "%s" workers: %d -> %d (%.1f jobs/s, queue %d, '
+                              'waiting %.3f s, CPU %.0f%%)', stage.name, stage.limit, limit,
+                              count / elapsed, stage.queue_depth, queue_latency, 100 * cpu)
+                stage.set_limit(limit)
+
+    def _run(self):
+        last = monotonic()
+
+        while not self._stop.wait(self._interval):
+            now = monotonic()
+            self.tick(now - last)
+            last = now
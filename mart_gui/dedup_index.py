@@ -0,0 +1,278 @@
+"""
+Persistent images deduplication index, shared by all articles, which are written into the same
+images directory.
+"""
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from time import sleep, time
+from typing import List, Optional, Tuple, Union
+
+from markdown_toolset.deduplicators.deduplicator import Deduplicator
+
+
+_logger = logging.getLogger(__name__)
+
+
+def _hash_content(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class DedupIndex:
+    """
+    Images, written into the images directories: size -> content hash -> file.
+
+    Candidates are found by the size, added images are indexed with their hashes, hashes of the
+    files without them are calculated only when the image with the same size appears. Index is safe
+    for the worker threads and the worker processes: it's pickled as the database path.
+
+    Content, which is not found, is claimed in the database transaction before it's written: the
+    other workers with the same content wait for the file instead of writing its copy.
+    """
+
+    # Claim of the killed worker is taken over after this time.
+    _claim_timeout = 60.0
+    _wait_interval = 0.05
+
+    def __init__(self, path: Union[Path, str]):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._db = self._connect()
+
+    def __getstate__(self):
+        return {'_path': self._path}
+
+    def __setstate__(self, state):
+        self._path = state['_path']
+        self._lock = Lock()
+        self._db = self._connect()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def bytes_saved(self) -> int:
+        """
+        Total size of the images, which were not written, because they were found in the index.
+        """
+
+        with self._lock:
+            return self._db.execute('SELECT bytes_saved FROM stats').fetchone()[0]
+
+    def claim(self, images_dir: Path, content: bytes,
+              content_hash: Optional[str] = None) -> Optional[str]:
+        """
+        Find the file with the same content in the images directory or claim the content.
+
+        Claimed content must be written and `add()`-ed or `release()`-d: workers with the same
+        content wait for it.
+
+        :parameter content_hash: content SHA-256, if it's calculated already.
+        :return: file path, relative to the images directory, None - the content was claimed by the
+                 caller.
+        """
+
+        images_dir_key = str(images_dir.absolute())
+        size = len(content)
+        content_hash = content_hash if content_hash is not None else _hash_content(content)
+        key = (images_dir_key, size, content_hash)
+
+        while True:
+            if (file := self._find(images_dir, images_dir_key, content, content_hash)) is not None:
+                self._add_saved(size)
+                return file
+
+            with self._lock:
+                # Immediate transaction locks the database for the other processes too.
+                self._db.execute('BEGIN IMMEDIATE')
+                try:
+                    # File, added after the search, has the hash.
+                    added = self._db.execute('SELECT 1 FROM images WHERE images_dir = ? '
+                                             'AND size = ? AND hash = ?', key).fetchone()
+                    added = added is not None
+                    claimed = self._db.execute('SELECT claimed FROM claims WHERE images_dir = ? '
+                                               'AND size = ? AND hash = ?', key).fetchone()
+                    now = time()
+                    if not added and (claimed is None or claimed[0] < now - self._claim_timeout):
+                        self._db.execute('INSERT OR REPLACE INTO claims '
+                                         '(images_dir, size, hash, claimed) VALUES (?, ?, ?, ?)',
+                                         (*key, now))
+                        self._db.commit()
+                        return None
+                    self._db.commit()
+                except BaseException:
+                    self._db.rollback()
+                    raise
+
+            if not added:
+                _logger.debug('Image with hash %s is written by the other worker, waiting',
+                              content_hash)
+                sleep(self._wait_interval)
+
+    def add(self, images_dir: Path, image_path: Path, size: int,
+            content_hash: Optional[str] = None):
+        """
+        Add written image, the content claim is released.
+        """
+
+        images_dir_key = str(images_dir.absolute())
+
+        try:
+            file = image_path.absolute().relative_to(images_dir.absolute()).as_posix()
+        except ValueError:
+            self.release(images_dir, size, content_hash)
+            return
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO images (images_dir, file, size, hash) '
+                             'VALUES (?, ?, ?, ?)', (images_dir_key, file, size, content_hash))
+            self._db.execute('DELETE FROM claims WHERE images_dir = ? AND size = ? AND hash = ?',
+                             (images_dir_key, size, content_hash))
+            self._db.commit()
+
+    def release(self, images_dir: Path, size: int, content_hash: Optional[str]):
+        """
+        Release the claim of the content, which was not written.
+        """
+
+        with self._lock:
+            self._db.execute('DELETE FROM claims WHERE images_dir = ? AND size = ? AND hash = ?',
+                             (str(images_dir.absolute()), size, content_hash))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(str(self._path), check_same_thread=False, timeout=30)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute('''CREATE TABLE IF NOT EXISTS images (
+                          images_dir TEXT NOT NULL,
+                          file TEXT NOT NULL,
+                          size INTEGER NOT NULL,
+                          hash TEXT,
+                          PRIMARY KEY (images_dir, file))''')
+        db.execute('CREATE INDEX IF NOT EXISTS images_size ON images (images_dir, size)')
+        db.execute('''CREATE TABLE IF NOT EXISTS claims (
+                          images_dir TEXT NOT NULL,
+                          size INTEGER NOT NULL,
+                          hash TEXT NOT NULL,
+                          claimed REAL NOT NULL,
+                          PRIMARY KEY (images_dir, size, hash))''')
+        db.execute('CREATE TABLE IF NOT EXISTS stats (bytes_saved INTEGER NOT NULL)')
+        if db.execute('SELECT COUNT(*) FROM stats').fetchone()[0] == 0:
+            db.execute('INSERT INTO stats (bytes_saved) VALUES (0)')
+        db.commit()
+        return db
+
+    def _find(self, images_dir: Path, images_dir_key: str, content: bytes,
+              content_hash: str) -> Optional[str]:
+        with self._lock:
+            candidates = self._db.execute('SELECT file, hash FROM images '
+                                          'WHERE images_dir = ? AND size = ?',
+                                          (images_dir_key, len(content))).fetchall()
+
+        for file, file_hash in candidates:
+            file_path = images_dir / file
+
+            try:
+                if file_hash is None:
+                    file_hash = self._hash_file(images_dir_key, file, file_path)
+                if file_hash != content_hash:
+                    continue
+                # Hashes collisions prevention.
+                if file_path.read_bytes() == content:
+                    return file
+                # File was changed after it was indexed.
+                self._remove(images_dir_key, file)
+            except OSError as e:
+                _logger.debug('Indexed image "%s" is not available: %s', file_path, e)
+                self._remove(images_dir_key, file)
+
+        return None
+
+    def _hash_file(self, images_dir_key: str, file: str, file_path: Path) -> str:
+        file_hash = _hash_content(file_path.read_bytes())
+
+        with self._lock:
+            self._db.execute('UPDATE images SET hash = ? WHERE images_dir = ? AND file = ?',
+                             (file_hash, images_dir_key, file))
+            self._db.commit()
+
+        return file_hash
+
+    def _add_saved(self, size: int):
+        with self._lock:
+            self._db.execute('UPDATE stats SET bytes_saved = bytes_saved + ?', (size,))
+            self._db.commit()
+
+    def _remove(self, images_dir_key: str, file: str):
+        with self._lock:
+            self._db.execute('DELETE FROM images WHERE images_dir = ? AND file = ?',
+                             (images_dir_key, file))
+            self._db.commit()
+
+
+class IndexedContentDeduplicator(Deduplicator):
+    """
+    Content deduplicator, which finds duplicates in the whole images directory, not only in the
+    current article.
+    """
+
+    def __init__(self, index: DedupIndex, images_dir: Path, img_dir_name: Path,
+                 img_public_path: Optional[Path]):
+        """
+        :parameter images_dir: real images directory.
+        :parameter img_dir_name: images directory, as it's written in the document.
+        :parameter img_public_path: if set, will be used in the document instead of `img_dir_name`.
+        """
+
+        self._index = index
+        self._images_dir = images_dir
+        self._document_dir = img_public_path if img_public_path else img_dir_name
+        # Claimed contents, which were not registered yet: (size, hash).
+        self._claims: List[Tuple[int, str]] = []
+
+    @property
+    def images_dir(self) -> Path:
+        return self._images_dir
+
+    def deduplicate(self, image_url, image_filename, image_content,
+                    replacement_mapping) -> Tuple[bool, str]:
+        content_hash = _hash_content(image_content)
+        existed_file = self._index.claim(self._images_dir, image_content, content_hash)
+
+        if existed_file is None:
+            self._claims.append((len(image_content), content_hash))
+            return True, image_filename
+
+        document_img_path = self._document_dir / existed_file
+        _logger.debug('Image "%s" is the same as "%s"', image_url, document_img_path)
+        replacement_mapping.setdefault(image_url, '/'.join(document_img_path.parts))
+
+        return False, existed_file
+
+    def register(self, image_path: Path, content: bytes):
+        """
+        Add written image to the index.
+        """
+
+        claim = (len(content), _hash_content(content))
+        if claim in self._claims:
+            self._claims.remove(claim)
+        self._index.add(self._images_dir, image_path, *claim)
+
+    def release(self):
+        """
+        Release the claims of the images, which were not written.
+        """
+
+        for size, content_hash in self._claims:
+            self._index.release(self._images_dir, size, content_hash)
+        self._claims.clear()
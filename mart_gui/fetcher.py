@@ -0,0 +1,798 @@
+"""
+Asynchronous HTTP fetching engine, shared by all articles.
+
+One event loop thread serves all requests: the global in-flight limit, the per-host limits and the
+per-host rate limits are applied to the whole batch, connections are kept alive and reused.
+
+HTTP proxies are taken from the environment (`HTTP_PROXY`, `HTTPS_PROXY`, `ALL_PROXY`, `NO_PROXY`,
+or the system settings), HTTPS is tunneled by the CONNECT method. As in `requests.get()`, cookies
+are kept only while the redirects of one request are followed.
+Not supported: HTTPS and SOCKS proxies, compressed responses, HTTP authentication (except the proxy
+basic one).
+"""
+import asyncio
+import logging
+import socket
+import ssl
+import urllib.request
+import weakref
+from base64 import b64encode
+from http.cookiejar import CookieJar
+from pathlib import Path
+from threading import Thread, Lock
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar, Union
+from urllib.parse import unquote, urlsplit, urljoin
+
+from markdown_toolset.www_tools import NECESSARY_HEADERS
+
+from .cancellation import CancelToken, JobCancelled
+from .memory_budget import MemoryBudget
+from .rate_limit import HostRateLimiter
+
+
+_logger = logging.getLogger(__name__)
+
+# Scheme, host, port, proxy URL.
+ConnectionKey = Tuple[str, str, int, Optional[str]]
+# Failed attempt handler: (error, failed attempts count, URL) -> delay before the next attempt,
+# None - don't retry.
+RetryDelay = Callable[[Exception, int, str], Optional[float]]
+
+T = TypeVar('T')
+
+
+async def _timed(operation: Awaitable[T], timeout: Optional[float]) -> T:
+    # Timeout of one network operation: connecting, sending the request or reading the next block.
+    if timeout is None:
+        return await operation
+    return await asyncio.wait_for(operation, timeout)
+
+
+def _authority(host: str, port: int, default_port: Optional[int] = None) -> str:
+    host = f'[{host}]' if ':' in host else host
+    return host if port == default_port else f'{host}:{port}'
+
+
+class _CookieHeaders:
+    """
+    Response headers adapter for the `CookieJar`.
+    """
+
+    def __init__(self, set_cookies: List[str]):
+        self._set_cookies = set_cookies
+
+    def info(self) -> '_CookieHeaders':
+        return self
+
+    def get_all(self, name: str, default=None):
+        return self._set_cookies if 'set-cookie' == name.lower() and self._set_cookies else default
+
+
+class FetchResponse:
+    """
+    HTTP response, compatible with the `requests.Response` fields used by the `www_tools`.
+    """
+
+    def __init__(self, url: str, status: int, reason: str, headers: Dict[str, str],
+                 content: bytes = b'', path: Optional[Path] = None):
+        """
+        :parameter url: final URL, after redirects.
+        :parameter headers: headers with the lowercase names.
+        :parameter content: response body, if it was not written to the file.
+        :parameter path: file with the response body.
+        """
+
+        self.url = url
+        self.status_code = status
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.path = path
+        # Set-Cookie headers: they can't be joined by the comma, as other headers.
+        self.set_cookies: List[str] = []
+        # Host name resolution and connection time, zeros for the kept alive connection.
+        self.dns_time = 0.0
+        self.connect_time = 0.0
+        # Waiting for the host rate limit.
+        self.throttle_time = 0.0
+        # Memory budget reservation of the buffered content.
+        self._reservation: Optional[weakref.finalize] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+    def __str__(self) -> str:
+        return f'<Response [{self.status_code}]>'
+
+    def hold(self, budget: MemoryBudget, size: int):
+        """
+        Keep the memory budget reservation of the buffered content until `release()` or until the
+        response will be collected.
+        """
+
+        if size:
+            self._reservation = weakref.finalize(self, budget.release, size)
+
+    def release(self):
+        """
+        Drop the buffered content and release its memory budget reservation.
+        """
+
+        self.content = b''
+        if self._reservation is not None:
+            self._reservation()
+
+
+class HttpError(OSError):
+    """
+    Response with the error HTTP status.
+    """
+
+    def __init__(self, response: FetchResponse):
+        super().__init__(str(response))
+        self.url = response.url
+        self.status_code = response.status_code
+        self.retry_after = self._parse_retry_after(response.headers.get('retry-after'))
+
+    def __reduce__(self):
+        # Errors of the prefetched images are pickled into the worker processes.
+        return _restore_http_error, (str(self), self.url, self.status_code, self.retry_after)
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        # HTTP date form is rare, only seconds are supported.
+        try:
+            return max(0.0, float(value)) if value is not None else None
+        except ValueError:
+            return None
+
+
+def _restore_http_error(message: str, url: str, status_code: int,
+                        retry_after: Optional[float]) -> HttpError:
+    error = HttpError.__new__(HttpError)
+    OSError.__init__(error, message)
+    error.url = url
+    error.status_code = status_code
+    error.retry_after = retry_after
+    return error
+
+
+class _Connection:
+    def __init__(self, key: ConnectionKey, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.last_used = monotonic()
+        self.dns_time = 0.0
+        self.connect_time = 0.0
+
+    @property
+    def usable(self) -> bool:
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncFetcher:
+    """
+    HTTP/1.1 client with the keep-alive connections pool, running in the own event loop thread.
+    """
+
+    chunk_size = 64 * 1024
+    max_redirects = 10
+    _redirect_statuses = (301, 302, 303, 307, 308)
+
+    def __init__(self, max_in_flight: int = 64, per_host_limit: int = 8,
+                 pool_size: Optional[int] = None, keepalive_timeout: float = 30.0,
+                 rate_limiter: Optional[HostRateLimiter] = None,
+                 memory_budget: Optional[MemoryBudget] = None,
+                 proxies: Optional[Dict[str, str]] = None):
+        """
+        :parameter max_in_flight: maximum simultaneous requests count for all hosts.
+        :parameter per_host_limit: maximum simultaneous requests count for one host.
+        :parameter pool_size: maximum idle connections count for one host, `per_host_limit` by
+                              default.
+        :parameter keepalive_timeout: idle connection lifetime in seconds, 0 - connections are not
+                                      reused.
+        :parameter rate_limiter: requests rate limits by the host, can be reconfigured while
+                                 working.
+        :parameter memory_budget: budget for the response bodies, which are buffered in the memory,
+                                  None - unlimited.
+        :parameter proxies: proxy URL by the URL scheme ("no" - hosts without proxy, as in
+                            `NO_PROXY`), None - from the environment.
+        """
+
+        self.max_in_flight = max_in_flight
+        self.per_host_limit = per_host_limit
+        self.pool_size = pool_size if pool_size is not None else per_host_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.rate_limiter = rate_limiter if rate_limiter is not None else HostRateLimiter()
+        self.memory_budget = memory_budget
+        self._proxies = proxies if proxies is not None else urllib.request.getproxies()
+        self._proxies_from_environment = proxies is None
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[Thread] = None
+        self._start_lock = Lock()
+
+        # Loop thread only data.
+        self._global_limit: Optional[asyncio.Semaphore] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._idle: Dict[ConnectionKey, List[_Connection]] = {}
+        self._proxy_urls: Dict[Tuple[str, str], Optional[str]] = {}
+
+    def fetch(self, url: str, timeout: Optional[float] = None, dest: Optional[Path] = None,
+              cancel_token: Optional[CancelToken] = None, headers: Optional[Dict[str, str]] = None,
+              retry: Optional[RetryDelay] = None, budget_holder: bool = False) -> FetchResponse:
+        """
+        Download URL, blocks the caller thread.
+
+        :parameter timeout: connection and every read timeout in seconds, as in `requests`, None -
+                            infinite: waiting for the requests limits is not limited, a long
+                            transfer is not interrupted.
+        :parameter dest: if set, the response body will be written to this file.
+        :parameter cancel_token: cancels the request, partially written file will be removed.
+        :parameter headers: additional request headers, i.e. conditional request validators.
+        :parameter retry: failed attempts handler, the request is retried after the returned delay.
+        :parameter budget_holder: the caller holds a memory budget reservation: buffered bodies
+                                  extend the budget without waiting, waiting for the memory, which
+                                  the caller holds, never ends.
+        :return: response, buffered content (without `dest`) keeps its memory budget reservation
+                 until `FetchResponse.release()`.
+        :raise HttpError: when HTTP status is not OK.
+        :raise OSError: on the network errors.
+        :raise JobCancelled: when the request was cancelled.
+        """
+
+        return asyncio.run_coroutine_threadsafe(self.afetch(url, timeout, dest, cancel_token,
+                                                            headers, retry, budget_holder),
+                                                self._get_loop()).result()
+
+    def fetch_many(self, requests: Sequence[Tuple[str, Optional[Path]]],
+                   timeout: Optional[float] = None, cancel_token: Optional[CancelToken] = None,
+                   retry: Optional[RetryDelay] = None,
+                   headers: Optional[Sequence[Optional[Dict[str, str]]]] = None
+                   ) -> List[Union[FetchResponse, Exception]]:
+        """
+        Download URLs concurrently, blocks the caller thread until all requests will be finished.
+
+        :parameter requests: URLs with the destination files.
+        :parameter retry: failed attempts handler, only failed requests are retried.
+        :parameter headers: additional headers of every request, i.e. conditional request
+                            validators.
+        :return: responses or errors in the requests order.
+        """
+
+        request_headers = headers if headers is not None else [None] * len(requests)
+
+        async def _gather():
+            return await asyncio.gather(*(self.afetch(url, timeout, dest, cancel_token, h, retry)
+                                          for (url, dest), h in zip(requests, request_headers)),
+                                        return_exceptions=True)
+
+        return asyncio.run_coroutine_threadsafe(_gather(), self._get_loop()).result()
+
+    async def afetch(self, url: str, timeout: Optional[float] = None, dest: Optional[Path] = None,
+                     cancel_token: Optional[CancelToken] = None,
+                     headers: Optional[Dict[str, str]] = None,
+                     retry: Optional[RetryDelay] = None,
+                     budget_holder: bool = False) -> FetchResponse:
+        url = url.split()[0]
+        on_cancel = None
+
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+            # Interrupt waiting for the connection or the data, not only between chunks.
+            on_cancel = cancel_token.add_callback(self._task_canceller(asyncio.current_task()))
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return await self._attempt(url, timeout, dest, cancel_token, headers,
+                                               budget_holder)
+                except (OSError, EOFError) as e:
+                    delay = retry(e, attempt, url) if retry is not None else None
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    _logger.info('Downloading "%s" failed: %s, attempt %d in %.2f s', url, e,
+                                 attempt + 1, delay)
+
+                # Backoff is cancelled with the request.
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if cancel_token is not None and cancel_token.cancelled:
+                raise JobCancelled(f'Downloading "{url}" cancelled') from None
+            raise
+        finally:
+            if on_cancel is not None:
+                cancel_token.remove_callback(on_cancel)
+
+    async def _attempt(self, url: str, timeout: Optional[float], dest: Optional[Path],
+                       cancel_token: Optional[CancelToken], headers: Optional[Dict[str, str]],
+                       budget_holder: bool = False) -> FetchResponse:
+        # Throttled request waits before taking the in-flight slot: requests to other hosts are not
+        # delayed. Waiting is not a part of the request timeout.
+        throttle_time = self.rate_limiter.reserve(urlsplit(url).hostname or '')
+        if throttle_time > 0:
+            await asyncio.sleep(throttle_time)
+
+        try:
+            response = await self._request(url, dest, cancel_token, headers, timeout, budget_holder)
+        except asyncio.TimeoutError as e:
+            raise TimeoutError(f'Downloading "{url}" timed out') from e
+
+        response.throttle_time = throttle_time
+
+        if not response.ok:
+            # HTTP status code >= 400, the error page is not needed.
+            response.release()
+            raise HttpError(response)
+
+        return response
+
+    def close(self):
+        with self._start_lock:
+            if self._loop is None:
+                return
+
+            asyncio.run_coroutine_threadsafe(self._close_idle(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = Thread(target=self._loop.run_forever, name='fetcher', daemon=True)
+                self._thread.start()
+
+            return self._loop
+
+    def _task_canceller(self, task: asyncio.Task):
+        loop = self._loop
+
+        def _cancel():
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(task.cancel)
+
+        return _cancel
+
+    def _proxy_url(self, scheme: str, host: str) -> Optional[str]:
+        # Bypass check can read the system settings: it's cached.
+        if (scheme, host) in self._proxy_urls:
+            return self._proxy_urls[scheme, host]
+
+        proxy = self._proxies.get(scheme) or self._proxies.get('all')
+        if proxy:
+            if self._proxies_from_environment:
+                bypass = urllib.request.proxy_bypass(host)
+            else:
+                bypass = urllib.request.proxy_bypass_environment(host, self._proxies)
+            if bypass:
+                proxy = None
+            elif '://' not in proxy:
+                proxy = f'http://{proxy}'
+
+        self._proxy_urls[scheme, host] = proxy or None
+        return proxy or None
+
+    @staticmethod
+    def _proxy_headers(proxy: str) -> Dict[str, str]:
+        parts = urlsplit(proxy)
+        if parts.username is None:
+            return {}
+
+        credentials = f'{unquote(parts.username)}:{unquote(parts.password or "")}'
+        return {'Proxy-Authorization': f'Basic {b64encode(credentials.encode()).decode("ascii")}'}
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        if (limit := self._host_limits.get(host)) is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return limit
+
+    async def _close_idle(self):
+        for connections in self._idle.values():
+            for c in connections:
+                c.close()
+        self._idle.clear()
+
+    async def _request(self, url: str, dest: Optional[Path], cancel_token: Optional[CancelToken],
+                       headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None,
+                       budget_holder: bool = False) -> FetchResponse:
+        dns_time = connect_time = 0.0
+        cookies = CookieJar()
+
+        for _ in range(self.max_redirects + 1):
+            cookie_request = urllib.request.Request(url)
+            cookies.add_cookie_header(cookie_request)
+            request_headers = headers
+            if cookie_request.has_header('Cookie'):
+                request_headers = {**(headers or {}), 'Cookie': cookie_request.get_header('Cookie')}
+
+            response = await self._request_once(url, dest, cancel_token, request_headers, timeout,
+                                                budget_holder)
+            dns_time += response.dns_time
+            connect_time += response.connect_time
+            if response.set_cookies:
+                cookies.extract_cookies(_CookieHeaders(response.set_cookies), cookie_request)
+
+            if response.status_code in self._redirect_statuses and 'location' in response.headers:
+                response.release()
+                url = urljoin(url, response.headers['location'])
+                _logger.debug('Redirected to "%s"', url)
+                continue
+
+            response.dns_time = dns_time
+            response.connect_time = connect_time
+            return response
+
+        raise OSError(f'Too many redirects for "{url}"')
+
+    async def _request_once(self, url: str, dest: Optional[Path],
+                            cancel_token: Optional[CancelToken],
+                            headers: Optional[Dict[str, str]] = None,
+                            timeout: Optional[float] = None,
+                            budget_holder: bool = False) -> FetchResponse:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+
+        if scheme not in ('http', 'https'):
+            raise OSError(f'Unsupported URL scheme "{scheme}"')
+
+        host = parts.hostname or ''
+        port = parts.port or (443 if 'https' == scheme else 80)
+        proxy = self._proxy_url(scheme, host)
+        key = (scheme, host, port, proxy)
+        target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        if proxy is not None and 'http' == scheme:
+            # Plain HTTP proxy gets the absolute URL.
+            target = f'http://{_authority(host, port, 80)}{target}'
+
+        if self._global_limit is None:
+            self._global_limit = asyncio.Semaphore(self.max_in_flight)
+
+        # Timeout starts, when the request got the slots.
+        async with self._global_limit, self._host_limit(host):
+            # Kept alive connection can be closed by the server in any moment: retry once with a new
+            # one.
+            while True:
+                connection, reused = await self._acquire(key, timeout)
+                try:
+                    response, keep_alive = await self._exchange(connection, url, target, dest,
+                                                                cancel_token, headers, timeout,
+                                                                budget_holder)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    connection.close()
+                    if reused:
+                        _logger.debug('Kept alive connection to %s was closed: %s',
+                                      _authority(host, port), e)
+                        continue
+                    raise ConnectionError(
+                        f'Connection to {_authority(host, port)} failed: {e}') from e
+                except BaseException:
+                    connection.close()
+                    raise
+
+                if keep_alive:
+                    self._release(connection)
+                else:
+                    connection.close()
+
+                if not reused:
+                    response.dns_time = connection.dns_time
+                    response.connect_time = connection.connect_time
+
+                return response
+
+    async def _acquire(self, key: ConnectionKey,
+                       timeout: Optional[float] = None) -> Tuple[_Connection, bool]:
+        idle = self._idle.get(key, [])
+        now = monotonic()
+
+        while idle:
+            connection = idle.pop()
+            if connection.usable and now - connection.last_used < self.keepalive_timeout:
+                self.connections_reused += 1
+                return connection, True
+            connection.close()
+
+        return await _timed(self._connect(key), timeout), False
+
+    def _release(self, connection: _Connection):
+        idle = self._idle.setdefault(connection.key, [])
+
+        if len(idle) >= self.pool_size:
+            connection.close()
+            return
+
+        connection.last_used = monotonic()
+        idle.append(connection)
+
+    async def _connect(self, key: ConnectionKey) -> _Connection:
+        scheme, host, port, proxy = key
+        ssl_context = None
+        tunnel: Optional[Tuple[str, int, Dict[str, str]]] = None
+        connect_host, connect_port = host, port
+
+        if 'https' == scheme:
+            ssl_context = ssl.create_default_context()
+
+        if proxy is not None:
+            proxy_parts = urlsplit(proxy)
+            if 'http' != proxy_parts.scheme.lower():
+                raise OSError(f'Unsupported proxy scheme "{proxy_parts.scheme}"')
+            connect_host, connect_port = proxy_parts.hostname or '', proxy_parts.port or 80
+            if ssl_context is not None:
+                tunnel = (host, port, self._proxy_headers(proxy))
+
+        # Name is resolved separately to measure the resolution time.
+        start = monotonic()
+        addresses = await self._resolve(connect_host, connect_port)
+        resolved = monotonic()
+
+        try:
+            reader, writer = await self._open(addresses, host, ssl_context, tunnel)
+        except ssl.SSLCertVerificationError:
+            _logger.warning('Incorrect SSL certificate, trying to download without verifying...')
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE  # nosec
+            reader, writer = await self._open(addresses, host, ssl_context, tunnel)
+
+        self.connections_opened += 1
+        _logger.debug('Connection to %s opened%s', _authority(host, port),
+                      f' via {connect_host}' if proxy else '')
+
+        connection = _Connection(key, reader, writer)
+        connection.dns_time = resolved - start
+        connection.connect_time = monotonic() - resolved
+
+        return connection
+
+    @staticmethod
+    async def _resolve(host: str, port: int) -> List[Tuple[str, int]]:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = []
+
+        for *_, address in infos:
+            if (address[0], address[1]) not in addresses:
+                addresses.append((address[0], address[1]))
+
+        return addresses
+
+    async def _open(self, addresses: List[Tuple[str, int]], host: str,
+                    ssl_context: Optional[ssl.SSLContext],
+                    tunnel: Optional[Tuple[str, int, Dict[str, str]]] = None
+                    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """
+        :parameter tunnel: target host, port and proxy headers, if addresses are the proxy
+                           addresses.
+        """
+
+        error: Optional[OSError] = None
+
+        for address, port in addresses:
+            try:
+                if tunnel is None:
+                    server_hostname = host if ssl_context is not None else None
+                    return await asyncio.open_connection(address, port, ssl=ssl_context,
+                                                         server_hostname=server_hostname,
+                                                         limit=self.chunk_size * 2)
+
+                sock = await self._open_tunnel(address, port, *tunnel)
+                try:
+                    return await asyncio.open_connection(sock=sock, ssl=ssl_context,
+                                                         server_hostname=host,
+                                                         limit=self.chunk_size * 2)
+                except BaseException:
+                    sock.close()
+                    raise
+            except ssl.SSLError:
+                raise
+            except OSError as e:
+                _logger.debug('Connection to %s:%d failed: %s', address, port, e)
+                error = e
+
+        raise error if error is not None else OSError(f'Can\'t resolve "{host}"')
+
+    @staticmethod
+    async def _open_tunnel(address: str, port: int, host: str, host_port: int,
+                           proxy_headers: Dict[str, str]) -> socket.socket:
+        """
+        Socket, connected to the host through the proxy by the CONNECT method.
+        """
+
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET6 if ':' in address else socket.AF_INET,
+                             socket.SOCK_STREAM)
+        sock.setblocking(False)
+
+        try:
+            await loop.sock_connect(sock, (address, port))
+            authority = _authority(host, host_port)
+            request = f'CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n' + \
+                ''.join(f'{k}: {v}\r\n' for k, v in proxy_headers.items()) + '\r\n'
+            await loop.sock_sendall(sock, request.encode('latin-1'))
+
+            # The host doesn't send anything before the TLS client hello: only the proxy response
+            # head is read.
+            head = b''
+            while b'\r\n\r\n' not in head:
+                if not (data := await loop.sock_recv(sock, 4096)) or len(head) > 64 * 1024:
+                    raise ConnectionError(f'Proxy {address}:{port} closed the connection')
+                head += data
+
+            status_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+            status = status_line.split(' ', 2)[1] if status_line.count(' ') else ''
+            if not status.startswith('2'):
+                raise ConnectionError(f'Proxy tunnel to {authority} failed: "{status_line}"')
+        except BaseException:
+            sock.close()
+            raise
+
+        return sock
+
+    async def _exchange(self, connection: _Connection, url: str, target: str, dest: Optional[Path],
+                        cancel_token: Optional[CancelToken],
+                        extra_headers: Optional[Dict[str, str]] = None,
+                        timeout: Optional[float] = None,
+                        budget_holder: bool = False) -> Tuple[FetchResponse, bool]:
+        scheme, host, port, proxy = connection.key
+
+        headers = {
+            'Host': _authority(host, port, 443 if 'https' == scheme else 80),
+            'Accept': '*/*',
+            'Accept-Encoding': 'identity',
+            'Connection': 'keep-alive' if self.keepalive_timeout > 0 and self.pool_size > 0
+                          else 'close',
+            **NECESSARY_HEADERS,
+            **(self._proxy_headers(proxy) if proxy is not None and 'http' == scheme else {}),
+            **(extra_headers or {}),
+        }
+        request = f'GET {target} HTTP/1.1\r\n' + \
+            ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) + '\r\n'
+
+        connection.writer.write(request.encode('latin-1'))
+        await _timed(connection.writer.drain(), timeout)
+
+        version, status, reason, response_headers, set_cookies = await _timed(
+            self._read_head(connection.reader), timeout)
+
+        if 'close' in response_headers.get('connection', '').lower():
+            keep_alive = False
+        else:
+            keep_alive = 'HTTP/1.1' == version or \
+                'keep-alive' in response_headers.get('connection', '').lower()
+
+        # Only the successful response body is written into the destination file.
+        sink = dest if dest is not None and 200 <= status < 300 else None
+        content, until_eof, reserved = await self._read_body(connection.reader, status,
+                                                             response_headers, sink, cancel_token,
+                                                             timeout, budget_holder)
+
+        response = FetchResponse(url, status, reason, response_headers, content, sink)
+        if reserved:
+            response.hold(self.memory_budget, reserved)
+        response.set_cookies = set_cookies
+
+        return response, keep_alive and not until_eof
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader
+                         ) -> Tuple[str, int, str, Dict[str, str], List[str]]:
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        version, _, rest = lines[0].partition(' ')
+        status, _, reason = rest.partition(' ')
+
+        if not version.startswith('HTTP/') or not status.isdigit():
+            raise ConnectionError(f'Incorrect HTTP status line: "{lines[0]}"')
+
+        headers: Dict[str, str] = {}
+        set_cookies: List[str] = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = f'{headers[name]}, {value}' if name in headers else value
+            if 'set-cookie' == name:
+                set_cookies.append(value)
+
+        return version, int(status), reason, headers, set_cookies
+
+    async def _read_body(self, reader: asyncio.StreamReader, status: int, headers: Dict[str, str],
+                         sink: Optional[Path], cancel_token: Optional[CancelToken],
+                         timeout: Optional[float] = None,
+                         budget_holder: bool = False) -> Tuple[bytes, bool, int]:
+        """
+        Body, which is buffered in the memory, takes the memory budget (Content-Length or every
+        chunk of the body with the unknown length) until the response is released, the sink gets the
+        body by chunks. Timeout limits every read, not the whole body: waiting for the memory budget
+        is not limited. Holder of the other reservation extends the budget without waiting: the
+        waiters ahead of it can wait for its memory.
+
+        :return: body (if it was not written to the sink), True, if the body was read until EOF, and
+                 the reserved size: the reservation is kept with the buffered body.
+        """
+
+        chunks: List[bytes] = []
+        # pylint: disable-next=consider-using-with
+        out_file = open(sink, 'wb') if sink is not None else None
+        budget = self.memory_budget if out_file is None else None
+        reserved = 0
+
+        async def _reserve(size: int) -> int:
+            return budget.extend(size) if budget_holder else await budget.areserve(size)
+
+        async def _write(data: bytes):
+            nonlocal reserved
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            if out_file is not None:
+                out_file.write(data)
+                return
+            if budget is not None and 'content-length' not in headers:
+                reserved += await _reserve(len(data))
+            chunks.append(data)
+
+        until_eof = False
+
+        try:
+            if status < 200 or status in (204, 304):
+                pass
+            elif 'chunked' in headers.get('transfer-encoding', '').lower():
+                while True:
+                    size_line = await _timed(reader.readuntil(b'\r\n'), timeout)
+                    size = int(size_line.split(b';', 1)[0].strip(), 16)
+                    if 0 == size:
+                        # Trailers.
+                        while await _timed(reader.readuntil(b'\r\n'), timeout) != b'\r\n':
+                            pass
+                        break
+                    while size > 0:
+                        data = await _timed(reader.readexactly(min(size, self.chunk_size)), timeout)
+                        size -= len(data)
+                        await _write(data)
+                    await _timed(reader.readexactly(2), timeout)
+            elif 'content-length' in headers:
+                remaining = int(headers['content-length'])
+                if budget is not None:
+                    reserved = await _reserve(remaining)
+                while remaining > 0:
+                    data = await _timed(reader.readexactly(min(remaining, self.chunk_size)),
+                                        timeout)
+                    remaining -= len(data)
+                    await _write(data)
+            else:
+                until_eof = True
+                while data := await _timed(reader.read(self.chunk_size), timeout):
+                    await _write(data)
+        except BaseException:
+            if out_file is not None:
+                out_file.close()
+                sink.unlink(missing_ok=True)
+                out_file = None
+            if reserved:
+                budget.release(reserved)
+            raise
+        finally:
+            if out_file is not None:
+                out_file.close()
+
+        return b''.join(chunks), until_eof, reserved
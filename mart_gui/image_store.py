@@ -0,0 +1,431 @@
+"""
+Content-addressed images store, shared by all articles: the same image is downloaded once and cloned
+to the articles.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import sqlite3
+import uuid
+from pathlib import Path
+from threading import Event, Lock
+from time import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .cancellation import CancelToken
+
+
+_logger = logging.getLogger(__name__)
+
+# Linux ioctl, which clones the file extents (Btrfs, XFS, OCFS2...).
+_FICLONE = 0x40049409
+
+# Store size limit, bytes.
+DEFAULT_MAX_SIZE = 2 ** 30
+# Stored image is revalidated after this time, if the server has not set the max-age, seconds.
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+
+def clone_or_copy(blob_path: Path, dest: Path) -> bool:
+    """
+    Make the image file from the blob: reflink (copy-on-write clone), where the filesystem supports
+    it, or copy.
+
+    Hardlinks are not used: the image, edited in place in one article, would change the blob and the
+    images of all other articles.
+
+    :return: True, if the reflink was created.
+    """
+
+    if sys.platform.startswith('linux'):
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        with open(blob_path, 'rb') as src, open(dest, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+                return True
+            except OSError as e:
+                _logger.debug('Can\'t clone "%s": %s, copying', dest, e)
+
+    shutil.copyfile(blob_path, dest)
+    return False
+
+
+class StoredImage:
+    """
+    Image in the store.
+    """
+
+    def __init__(self, url: str, content_hash: str, file_name: str, path: Path,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 fresh: bool = True):
+        """
+        :parameter url: image download URL.
+        :parameter content_hash: image content SHA-256.
+        :parameter file_name: image file name, as it was received from the server.
+        :parameter path: image blob path.
+        :parameter etag: ETag header of the image response.
+        :parameter last_modified: Last-Modified header of the image response.
+        :parameter fresh: image can be used without the revalidation.
+        """
+
+        self.url = url
+        self.content_hash = content_hash
+        self.file_name = file_name
+        self.path = path
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh = fresh
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """
+        Request headers, which make the server to return "304 Not Modified" for the unchanged image.
+        """
+
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def cache_lifetime(headers: Dict[str, str]) -> Optional[float]:
+    """
+    Response freshness lifetime from the Cache-Control header, seconds.
+
+    :parameter headers: response headers with the lowercase names.
+    :return: lifetime or None, if the server has not set it.
+    """
+
+    for directive in headers.get('cache-control', '').lower().split(','):
+        name, _, value = directive.strip().partition('=')
+        if name in ('no-cache', 'no-store'):
+            return 0.0
+        if 'max-age' == name:
+            try:
+                return max(0.0, float(value.strip('"')))
+            except ValueError:
+                return None
+
+    return None
+
+
+class ImageStore:
+    """
+    Images blobs, named by the content hash, with the URL index in the SQLite database.
+
+    Blobs are cloned into the articles images directories by `clone_or_copy()`.
+    Stored image is fresh during the server max-age or `max_age`, stale image is revalidated by the
+    conditional request. Least recently used images are removed, when the store size exceeds
+    `max_size`: images, used since the store was opened, are kept, the running articles can use
+    them.
+    """
+
+    # Interval to check the cancellation, while waiting for the image, downloaded by the other
+    # article.
+    _wait_interval = 0.1
+    # Image, validated by the server just now, is not validated again by the other articles of the
+    # batch.
+    _min_lifetime = 60.0
+    # Validators, last validation and usage times (UNIX time), server lifetime (NULL - not set),
+    # blob size.
+    _columns = (('etag', 'TEXT'), ('last_modified', 'TEXT'), ('checked', 'REAL'),
+                ('max_age', 'REAL'), ('used', 'REAL'), ('size', 'INTEGER'))
+
+    def __init__(self, root: Union[Path, str], max_size: int = DEFAULT_MAX_SIZE,
+                 max_age: float = DEFAULT_MAX_AGE):
+        """
+        :parameter max_size: store size limit in bytes, 0 - unlimited.
+        :parameter max_age: freshness lifetime of the image, if the server has not set it, seconds.
+        """
+
+        self._root = Path(root)
+        self._objects_dir = self._root / 'objects'
+        self._tmp_dir = self._root / 'tmp'
+        self._objects_dir.mkdir(parents=True, exist_ok=True)
+        self._tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self._lock = Lock()
+        # URL -> event, set when the URL downloading was finished.
+        self._in_flight: Dict[str, Event] = {}
+        # Images, used since this time, are not removed.
+        self._opened = time()
+        # Blobs, which are not used by any URL, but could be taken by the running articles: removed
+        # on close.
+        self._orphans: Set[str] = set()
+
+        self._db = sqlite3.connect(str(self._root / 'index.sqlite'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS images (
+                                url TEXT PRIMARY KEY,
+                                hash TEXT NOT NULL,
+                                file_name TEXT NOT NULL)''')
+
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(images)')}
+        for column, column_type in self._columns:
+            if column not in columns:
+                self._db.execute(f'ALTER TABLE images ADD COLUMN {column} {column_type}')
+
+        # Images of the store versions without the sizes.
+        for content_hash, in self._db.execute('SELECT DISTINCT hash FROM images '
+                                              'WHERE size IS NULL').fetchall():
+            path = self._blob_path(content_hash)
+            self._db.execute('UPDATE images SET size = ? WHERE hash = ?',
+                             (path.stat().st_size if path.exists() else 0, content_hash))
+        self._db.commit()
+
+        self._size = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM '
+            '(SELECT MAX(size) AS size FROM images GROUP BY hash)').fetchone()[0]
+        self.hits = 0
+
+        self.evict()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def size(self) -> int:
+        """
+        Blobs size, bytes.
+        """
+
+        return self._size
+
+    def temp_path(self) -> Path:
+        """
+        Path to download the image: it's on the same filesystem with the blobs and will be moved
+        without copying.
+        """
+
+        return self._tmp_dir / uuid.uuid4().hex
+
+    def lookup(self, url: str, fresh_only: bool = True) -> Optional[StoredImage]:
+        """
+        Stored image of the URL.
+
+        :parameter fresh_only: stale image is not returned, else it's returned to be revalidated.
+        """
+
+        with self._lock:
+            row = self._db.execute('SELECT hash, file_name, etag, last_modified, checked, max_age '
+                                   'FROM images WHERE url = ?', (url,)).fetchone()
+
+        if row is None:
+            return None
+
+        content_hash, file_name, etag, last_modified, checked, max_age = row
+        path = self._blob_path(content_hash)
+        if not path.exists():
+            return None
+
+        lifetime = max(self.max_age if max_age is None else max_age, self._min_lifetime)
+        fresh = checked is not None and time() - checked < lifetime
+        if fresh_only and not fresh:
+            return None
+
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            # Used image is not removed, while the store is opened.
+            self._db.execute('UPDATE images SET used = ? WHERE url = ?', (time(), url))
+            self._db.commit()
+
+        return StoredImage(url, content_hash, file_name, path, etag, last_modified, fresh)
+
+    def add(self, url: str, file_name: str, downloaded_path: Path,
+            headers: Optional[Dict[str, str]] = None) -> StoredImage:
+        """
+        Move the downloaded image into the store.
+
+        :parameter headers: response headers with the lowercase names: validators and Cache-Control.
+        """
+
+        headers = headers or {}
+        content_hash = self._hash_file(downloaded_path)
+        path = self._blob_path(content_hash)
+        size = downloaded_path.stat().st_size
+
+        with self._lock:
+            if path.exists():
+                # The same content was downloaded by another URL.
+                downloaded_path.unlink(missing_ok=True)
+            else:
+                path.parent.mkdir(exist_ok=True)
+                os.replace(downloaded_path, path)
+                self._size += size
+            self._orphans.discard(content_hash)
+
+            previous = self._db.execute('SELECT hash FROM images WHERE url = ?', (url,)).fetchone()
+            now = time()
+            self._db.execute('INSERT OR REPLACE INTO images (url, hash, file_name, etag, '
+                             'last_modified, checked, max_age, used, size) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (url, content_hash, file_name, headers.get('etag'),
+                              headers.get('last-modified'), now, cache_lifetime(headers), now,
+                              size))
+            self._db.commit()
+
+            if previous is not None and previous[0] != content_hash and \
+                    not self._is_referenced(previous[0]):
+                # Image was changed: the old content can be taken by the running articles yet.
+                self._orphans.add(previous[0])
+
+        self.evict()
+
+        return StoredImage(url, content_hash, file_name, path, headers.get('etag'),
+                           headers.get('last-modified'))
+
+    def revalidated(self, url: str, headers: Dict[str, str]) -> Optional[StoredImage]:
+        """
+        Server confirmed, that the stored image was not modified ("304 Not Modified").
+
+        :parameter headers: response headers with the lowercase names.
+        :return: the image, None - it was removed from the store.
+        """
+
+        with self._lock:
+            self._db.execute('UPDATE images SET checked = ?, max_age = ?, '
+                             'etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) '
+                             'WHERE url = ?',
+                             (time(), cache_lifetime(headers), headers.get('etag'),
+                              headers.get('last-modified'), url))
+            self._db.commit()
+
+        return self.lookup(url)
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used images, until the store size doesn't exceed the limit.
+
+        :return: removed blobs count.
+        """
+
+        removed = 0
+
+        with self._lock:
+            if self.max_size <= 0 or self._size <= self.max_size:
+                return 0
+
+            rows = self._db.execute('SELECT url, hash FROM images WHERE used IS NULL OR used < ? '
+                                    'ORDER BY used IS NOT NULL, used', (self._opened,)).fetchall()
+            for url, content_hash in rows:
+                if self._size <= self.max_size:
+                    break
+
+                self._db.execute('DELETE FROM images WHERE url = ?', (url,))
+                if not self._is_referenced(content_hash) and content_hash not in self._orphans:
+                    self._remove_blob(content_hash)
+                    removed += 1
+
+            self._db.commit()
+
+        if removed:
+            _logger.info('%d images were removed from the store, store size: %d bytes', removed,
+                         self._size)
+
+        return removed
+
+    def claim(self, urls: Iterable[str]) -> Tuple[Dict[str, StoredImage], List[str], List[str]]:
+        """
+        Split URLs into the fresh stored images, URLs to download by the caller and URLs,
+        downloading by the others.
+
+        Caller must `release()` claimed URLs after the downloading. Claimed URL can have the stale
+        image: see `conditional_headers()`.
+
+        :return: stored images, claimed URLs, URLs downloading now.
+        """
+
+        stored = {}
+        claimed = []
+        foreign = []
+
+        for url in urls:
+            if (image := self.lookup(url)) is not None:
+                stored[url] = image
+                continue
+
+            with self._lock:
+                if url in self._in_flight:
+                    foreign.append(url)
+                    continue
+                self._in_flight[url] = Event()
+
+            claimed.append(url)
+
+        return stored, claimed, foreign
+
+    def conditional_headers(self, url: str) -> Optional[Dict[str, str]]:
+        """
+        Request headers for the stale stored image of the URL: the server returns "304 Not
+        Modified", if it was not changed, see `revalidated()`.
+
+        :return: headers or None, if the image is not stored or has no validators.
+        """
+
+        if (image := self.lookup(url, fresh_only=False)) is None:
+            return None
+        return image.conditional_headers() or None
+
+    def release(self, urls: Iterable[str]):
+        with self._lock:
+            events = [e for url in urls if (e := self._in_flight.pop(url, None)) is not None]
+
+        for e in events:
+            e.set()
+
+    def wait(self, urls: Iterable[str], cancel_token: Optional[CancelToken] = None):
+        """
+        Wait until the URLs, claimed by others, will be released.
+        """
+
+        for url in urls:
+            with self._lock:
+                event = self._in_flight.get(url)
+
+            if event is None:
+                continue
+
+            while not event.wait(self._wait_interval):
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+
+    def close(self):
+        with self._lock:
+            for content_hash in self._orphans:
+                if not self._is_referenced(content_hash):
+                    self._remove_blob(content_hash)
+            self._orphans.clear()
+            self._db.close()
+
+    def _blob_path(self, content_hash: str) -> Path:
+        return self._objects_dir / content_hash[:2] / content_hash[2:]
+
+    def _is_referenced(self, content_hash: str) -> bool:
+        return self._db.execute('SELECT 1 FROM images WHERE hash = ? LIMIT 1',
+                                (content_hash,)).fetchone() is not None
+
+    def _remove_blob(self, content_hash: str):
+        path = self._blob_path(content_hash)
+        try:
+            self._size -= path.stat().st_size
+            path.unlink()
+        except OSError as e:
+            _logger.debug('Can\'t remove image "%s": %s', path, e)
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                h.update(chunk)
+        return h.hexdigest()
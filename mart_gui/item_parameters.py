@@ -1,5 +1,25 @@
+import hashlib
 from pathlib import Path
-from typing import Union, List, Optional
+from threading import Lock
+from typing import Any, Tuple, Union, List, Optional
+from weakref import WeakValueDictionary
+
+
+# Processing options of the item, in the `OptionProfile` values order.
+OPTION_NAMES = ('skip_list', 'downloading_timeout', 'output_format', 'output_path',
+                'images_public_path', 'input_format', 'deduplication_type', 'images_dir_name',
+                'skip_all_incorrect', 'download_incorrect_mime', 'remove_source', 'save_hierarchy',
+                'priority')
+
+
+def _fingerprint(p: 'ItemOptions') -> str:
+    skip_list = p.skip_list if isinstance(p.skip_list, str) else sorted(p.skip_list)
+    options = (skip_list, p.downloading_timeout, p.output_format, p.output_path,
+               p.images_public_path, p.input_format, p.deduplication_type, p.images_dir_name,
+               bool(p.skip_all_incorrect), bool(p.download_incorrect_mime), bool(p.remove_source),
+               bool(p.save_hierarchy))
+
+    return hashlib.sha1(repr(options).encode()).hexdigest()  # nosec
 
 
 class ItemParameters:
@@ -17,9 +37,9 @@ class ItemParameters:
     default_output_path = Path.cwd().as_posix()
     default_images_public_path = ''
     default_images_dir_name = ''
+    default_priority = 0
 
     def __init__(self):
-        self.downloaded: bool = False
         self.skip_list: Union[str, List[str]] = []
         self.downloading_timeout: int = self.default_downloading_timeout
         self.output_format: int = self.default_output_format
@@ -34,7 +54,102 @@ class ItemParameters:
         self.remove_source: int = 0
         self.save_hierarchy: int = 0
 
-        self.output_file_path: Optional[str] = None
+        # Scheduling only, doesn't change the result: not in the fingerprint.
+        self.priority: int = self.default_priority
 
     def set_default(self, property_name: str):
         setattr(self, property_name, getattr(self, f'default_{property_name}'))
+
+    def fingerprint(self) -> str:
+        """
+        Processing options hash: items with the same source and fingerprint give the same result.
+        """
+
+        return _fingerprint(self)
+
+
+class OptionProfile:
+    """
+    Immutable item options, shared by all items with the same options (flyweight).
+
+    Profiles are got by `of()` and `replace()`: equal options give the same object, while it's
+    referenced. Options are read as the `ItemParameters` attributes, the skip list is a tuple.
+    """
+
+    __slots__ = OPTION_NAMES + ('_fingerprint', '__weakref__')
+
+    _profiles: 'WeakValueDictionary[Tuple[Any, ...], OptionProfile]' = WeakValueDictionary()
+    _lock = Lock()
+
+    def __init__(self):
+        raise TypeError('Use OptionProfile.of() to get the profile')
+
+    @classmethod
+    def of(cls, parameters: Optional[ItemParameters] = None) -> 'OptionProfile':
+        """
+        Profile of the parameters.
+
+        :parameter parameters: options, None - default options.
+        """
+
+        if parameters is None:
+            parameters = ItemParameters()
+
+        return cls._get(tuple(getattr(parameters, name) for name in OPTION_NAMES))
+
+    def replace(self, **options: Any) -> 'OptionProfile':
+        """
+        Profile with the changed options, this profile is not changed.
+        """
+
+        if unknown := options.keys() - set(OPTION_NAMES):
+            raise AttributeError(f'Unknown options: {", ".join(sorted(unknown))}')
+
+        return self._get(tuple(options.get(name, getattr(self, name)) for name in OPTION_NAMES))
+
+    def fingerprint(self) -> str:
+        """
+        Processing options hash, the same as the `ItemParameters` hash with these options.
+        """
+
+        if (fingerprint := self._fingerprint) is None:
+            fingerprint = _fingerprint(self)
+            object.__setattr__(self, '_fingerprint', fingerprint)
+
+        return fingerprint
+
+    def values(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in OPTION_NAMES)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError('Option profile is immutable, use replace()')
+
+    def __delattr__(self, name: str):
+        raise AttributeError('Option profile is immutable')
+
+    def __reduce__(self):
+        # Unpickled profile is shared in the worker process too.
+        return self._get, (self.values(),)
+
+    def __repr__(self) -> str:
+        return f'OptionProfile({", ".join(f"{n}={getattr(self, n)!r}" for n in OPTION_NAMES)})'
+
+    @classmethod
+    def _get(cls, values: Tuple[Any, ...]) -> 'OptionProfile':
+        skip_list = values[0]
+        if not isinstance(skip_list, (str, tuple)):
+            values = (tuple(skip_list),) + values[1:]
+
+        with cls._lock:
+            if (profile := cls._profiles.get(values)) is None:
+                profile = object.__new__(cls)
+                for name, value in zip(OPTION_NAMES, values):
+                    object.__setattr__(profile, name, value)
+                object.__setattr__(profile, '_fingerprint', None)
+                cls._profiles[values] = profile
+
+        return profile
+
+
+# Item options, as the engine reads them.
+ItemOptions = Union[ItemParameters, OptionProfile]
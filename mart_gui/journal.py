@@ -0,0 +1,231 @@
+"""
+Persistent jobs journal: interrupted batches are resumed, completed items are not processed again.
+"""
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+
+_logger = logging.getLogger(__name__)
+
+
+class SourceState:
+    """
+    Article source validators, saved after the processing: unchanged source doesn't need to be
+    processed again.
+    """
+
+    def __init__(self, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 content_hash: Optional[str] = None, stamp: Optional[str] = None):
+        """
+        :parameter etag: remote source ETag header.
+        :parameter last_modified: remote source Last-Modified header.
+        :parameter content_hash: source content SHA-256.
+        :parameter stamp: local source modification time and size.
+        """
+
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.stamp = stamp
+
+    @staticmethod
+    def hash_content(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def file_stamp(path: Path) -> str:
+        st = path.stat()
+        return f'{st.st_mtime_ns}:{st.st_size}'
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """
+        Request headers, which make the server to return "304 Not Modified" for the unchanged
+        source.
+        """
+
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class JournalEntry:
+    """
+    Completed item record.
+    """
+
+    def __init__(self, output_path: str, source_state: SourceState):
+        self.output_path = output_path
+        self.source_state = source_state
+
+
+class JobJournal:
+    """
+    Items states, stored in the SQLite database.
+
+    Item key is the source path or URL with the item options fingerprint: the same source,
+    processed with the other options, is a new item.
+    """
+
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+
+    # SQLite host parameters limit is 999 in the old versions.
+    _lookup_chunk_size = 500
+    _source_state_columns = ('etag', 'last_modified', 'content_hash', 'stamp')
+    # Processing history for the scheduling.
+    _history_columns = (('duration', 'REAL'), ('source_bytes', 'INTEGER'))
+
+    def __init__(self, path: Union[Path, str]):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        # Used from the pipeline threads and from the GUI thread under the lock.
+        self._db = sqlite3.connect(str(self._path), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                source TEXT NOT NULL,
+                                options TEXT NOT NULL,
+                                state TEXT NOT NULL,
+                                output_path TEXT,
+                                error TEXT,
+                                updated REAL NOT NULL,
+                                PRIMARY KEY (source, options))''')
+
+        # Journals, created by the previous versions, don't have source validators and history.
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(jobs)')}
+        for column, column_type in (*((c, 'TEXT') for c in self._source_state_columns),
+                                    *self._history_columns):
+            if column not in columns:
+                self._db.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+
+        self._db.commit()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def record(self, source: str, options: str, state: str,
+               output_path: Optional[Union[Path, str]] = None, error: Optional[str] = None,
+               source_state: Optional[SourceState] = None,
+               duration: Optional[float] = None, source_bytes: Optional[int] = None):
+        """
+        :parameter duration: processing time without the queues waiting, the previous value is kept,
+                             if not set.
+        :parameter source_bytes: source size, the previous value is kept, if not set.
+        """
+
+        source_state = source_state if source_state is not None else SourceState()
+        # Relative output path depends on the current directory.
+        output_path = None if output_path is None else str(Path(output_path).absolute())
+
+        with self._lock:
+            self._db.execute('INSERT INTO jobs (source, options, state, output_path, error, '
+                             'updated, etag, last_modified, content_hash, stamp, duration, '
+                             'source_bytes) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                             'ON CONFLICT (source, options) DO UPDATE SET state = excluded.state, '
+                             'output_path = excluded.output_path, error = excluded.error, '
+                             'updated = excluded.updated, '
+                             'etag = excluded.etag, last_modified = excluded.last_modified, '
+                             'content_hash = excluded.content_hash, stamp = excluded.stamp, '
+                             'duration = COALESCE(excluded.duration, duration), '
+                             'source_bytes = COALESCE(excluded.source_bytes, source_bytes)',
+                             (source, options, state, output_path, error, time(),
+                              source_state.etag, source_state.last_modified,
+                              source_state.content_hash, source_state.stamp, duration,
+                              source_bytes))
+            self._db.commit()
+
+    def record_done(self, source: str, options: str, output_path: Optional[Union[Path, str]],
+                    source_state: Optional[SourceState] = None, duration: Optional[float] = None,
+                    source_bytes: Optional[int] = None):
+        self.record(source, options, self.STATE_DONE, output_path, source_state=source_state,
+                    duration=duration, source_bytes=source_bytes)
+
+    def record_failed(self, source: str, options: str, error: str):
+        self.record(source, options, self.STATE_FAILED, error=error)
+
+    def completed(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], JournalEntry]:
+        """
+        Find completed items, which output still exists.
+
+        :parameter keys: (source, options fingerprint) pairs.
+        :return: key -> completed item record mapping.
+        """
+
+        result = {}
+        keys = list(keys)
+        sources = list({k[0] for k in keys})
+        wanted = set(keys)
+
+        for start in range(0, len(sources), self._lookup_chunk_size):
+            chunk = sources[start:start + self._lookup_chunk_size]
+            rows = self._select(f'SELECT source, options, output_path, etag, last_modified, '
+                                f'content_hash, stamp FROM jobs WHERE state = ? '
+                                f'AND source IN ({",".join("?" * len(chunk))})',
+                                [self.STATE_DONE, *chunk])
+            for source, options, output_path, *source_state in rows:
+                key = (source, options)
+                if key in wanted and output_path and Path(output_path).exists():
+                    result[key] = JournalEntry(output_path, SourceState(*source_state))
+
+        return result
+
+    def durations(self, sources: Iterable[str]) -> Dict[str, float]:
+        """
+        Last known processing time of the sources with any options.
+        """
+
+        result = {}
+        sources = list(set(sources))
+
+        for start in range(0, len(sources), self._lookup_chunk_size):
+            chunk = sources[start:start + self._lookup_chunk_size]
+            rows = self._select(f'SELECT source, duration FROM jobs WHERE duration IS NOT NULL '
+                                f'AND source IN ({",".join("?" * len(chunk))}) ORDER BY updated',
+                                chunk)
+            # The latest record wins.
+            result.update(rows)
+
+        return result
+
+    def seconds_per_byte(self) -> Optional[float]:
+        """
+        Average processing time of the source byte, None if there is no history.
+        """
+
+        total_duration, total_bytes = self._select('SELECT SUM(duration), SUM(source_bytes) '
+                                                   'FROM jobs WHERE duration IS NOT NULL '
+                                                   'AND source_bytes > 0', [])[0]
+
+        return total_duration / total_bytes if total_bytes else None
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM jobs')
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _select(self, query: str, parameters: List) -> List[Tuple]:
+        with self._lock:
+            return self._db.execute(query, parameters).fetchall()
@@ -0,0 +1,136 @@
+"""
+Background links file loading: the file is read and validated by chunks out of the GUI thread.
+"""
+import locale
+import logging
+import mmap
+import os
+from pathlib import Path
+from threading import Thread
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from .cancellation import CancelToken, JobCancelled
+from .links_model import link_status
+
+
+_logger = logging.getLogger(__name__)
+
+# Chunk is cut at the first line end after this size.
+CHUNK_SIZE = 2 ** 20
+
+
+class LinksChunk(NamedTuple):
+    links: List[str]
+    # Row statuses of the links.
+    statuses: List[int]
+    # Bytes read, including this chunk.
+    position: int
+    # File size, 0 - unknown (i.e. pipe).
+    size: int
+
+
+def _mapped_blocks(data: mmap.mmap, chunk_size: int) -> Iterator[Tuple[bytes, int]]:
+    position = 0
+    size = len(data)
+
+    while position < size:
+        end = data.find(b'\n', position + chunk_size)
+        end = size if end < 0 else end + 1
+        yield data[position:end], end
+        position = end
+
+
+def _read_blocks(file: BinaryIO, chunk_size: int) -> Iterator[Tuple[bytes, int]]:
+    position = 0
+
+    while lines := file.readlines(chunk_size):
+        block = b''.join(lines)
+        position += len(block)
+        yield block, position
+
+
+def read_chunks(path: Union[Path, str], chunk_size: int = CHUNK_SIZE,
+                cancel_token: Optional[CancelToken] = None) -> Iterator[LinksChunk]:
+    """
+    Read non-empty links from the file by chunks, one link per line.
+
+    The file is memory-mapped, when it's possible: the lines are not copied into the read buffers.
+
+    :raise JobCancelled: when the token was cancelled.
+    """
+
+    # Encoding of the text files, opened without the encoding.
+    encoding = locale.getpreferredencoding(False)
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        try:
+            data: Optional[mmap.mmap] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty file, pipe or the filesystem without mapping.
+            data = None
+
+        try:
+            blocks = _mapped_blocks(data, chunk_size) if data is not None \
+                else _read_blocks(f, chunk_size)
+
+            for block, position in blocks:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+
+                links = [lrs for line in block.decode(encoding).splitlines()
+                         if (lrs := line.rstrip())]
+                yield LinksChunk(links, [link_status(link) for link in links], position, size)
+        finally:
+            if data is not None:
+                data.close()
+
+
+class LinksLoader(QObject):
+    """
+    Loads the links file in the background thread, chunks are delivered to the GUI thread by the
+    signals.
+    """
+
+    # LinksChunk.
+    chunk_loaded = pyqtSignal(object)
+    # Error message, empty if the file was loaded or the loading was cancelled.
+    finished = pyqtSignal(str)
+
+    def __init__(self, path: Union[Path, str], chunk_size: int = CHUNK_SIZE,
+                 parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.path = path
+        self._chunk_size = chunk_size
+        self._cancel_token = CancelToken()
+        self._thread = Thread(target=self._run, name='links-loader', daemon=True)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_token.cancelled
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        """
+        Stop reading, chunks, which were read already, can be delivered.
+        """
+
+        self._cancel_token.cancel()
+
+    def _run(self):
+        error = ''
+
+        try:
+            for chunk in read_chunks(self.path, self._chunk_size, self._cancel_token):
+                self.chunk_loaded.emit(chunk)
+        except JobCancelled:
+            _logger.debug('Loading of "%s" was cancelled', self.path)
+        except (OSError, UnicodeError) as e:
+            _logger.warning('Can\'t load links from "%s": %s', self.path, e)
+            error = str(e)
+
+        self.finished.emit(error)
@@ -0,0 +1,453 @@
+"""
+Links table: rows are kept in the compact columns, the view requests the data of the visible rows
+only.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, pyqtSignal
+from PyQt6.QtGui import QBrush, QColor
+
+from markdown_toolset.www_tools import is_url
+
+from .item_parameters import OptionProfile
+
+
+# Row statuses.
+STATUS_NEW = 0
+STATUS_SUCCEEDED = 1
+STATUS_FAILED = 2
+# Not URL and not existing file.
+STATUS_INVALID = 3
+
+
+def link_status(link: str) -> int:
+    if not link or is_url(link) or Path(link).is_file():
+        return STATUS_NEW
+    return STATUS_INVALID
+
+
+# Rows as the (first, last) ranges, inclusive.
+RowRanges = Tuple[Tuple[int, int], ...]
+
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> RowRanges:
+    """
+    Sorted not overlapping ranges: overlapping and adjacent ranges are merged.
+    """
+
+    merged: List[Tuple[int, int]] = []
+    for first, last in sorted(ranges):
+        if merged and merged[-1][1] + 1 >= first:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+
+    return tuple(merged)
+
+
+def subtract_ranges(ranges: RowRanges, other: RowRanges) -> RowRanges:
+    """
+    Rows of the merged `ranges`, which are not in the merged `other`.
+    """
+
+    result: List[Tuple[int, int]] = []
+    i = 0
+
+    for first, last in ranges:
+        while i < len(other) and other[i][1] < first:
+            i += 1
+
+        j = i
+        while j < len(other) and other[j][0] <= last:
+            if other[j][0] > first:
+                result.append((first, other[j][0] - 1))
+            first = max(first, other[j][1] + 1)
+            j += 1
+
+        if first <= last:
+            result.append((first, last))
+
+    return tuple(result)
+
+
+def intersect_ranges(ranges: RowRanges, other: RowRanges) -> RowRanges:
+    """
+    Rows of the merged `ranges`, which are in the merged `other` too.
+    """
+
+    return subtract_ranges(ranges, subtract_ranges(ranges, other))
+
+
+class OptionEdit(NamedTuple):
+    """
+    One option change of the rows.
+    """
+
+    ranges: RowRanges
+    name: str
+    value: Any
+
+
+class LinksStore:
+    """
+    Links table columns: link string, status code (one byte), options profile id (four bytes) and
+    stable row id (eight bytes) per row.
+
+    Rows with the same options share one immutable profile: edited rows get another profile
+    (copy-on-write), the items, passed to the engine, keep their options. Profiles are counted by
+    the rows: a profile, which is not used by any row, is released by `release_unused()` and its id
+    is reused. Row id is not changed by the sorting and the removal of the other rows: engine items
+    and their results are identified by it. Ids are not reused, also after `clear()`.
+    Output paths and tooltips are kept only for the finished rows, by the row id.
+    """
+
+    def __init__(self):
+        self.links: List[str] = []
+        self.statuses = array('b')
+        self.profile_ids = array('I')
+        self.row_ids = array('Q')
+        # None - released profile.
+        self.profiles: List[Optional[OptionProfile]] = []
+        self.output_paths: Dict[int, str] = {}
+        self.tooltips: Dict[int, str] = {}
+        self._profile_index: Dict[OptionProfile, int] = {}
+        # Rows count by the profile id.
+        self._profile_rows: List[int] = []
+        self._free_ids: List[int] = []
+        self._next_id = 0
+        # Row ids are ascending until the rows are sorted, then rows are found by the index.
+        self._ids_ascending = True
+        self._rows_by_id: Optional[Dict[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def clear(self):
+        next_id = self._next_id
+        self.__init__()
+        # Results of the items, which were queued before, don't get the new rows.
+        self._next_id = next_id
+
+    def rows(self, row_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Rows of the ids, removed rows are skipped.
+
+        :return: row by the row id.
+        """
+
+        result = {}
+        all_ids = self.row_ids
+
+        if self._ids_ascending:
+            for row_id in row_ids:
+                if (row := bisect_left(all_ids, row_id)) < len(all_ids) and all_ids[row] == row_id:
+                    result[row_id] = row
+            return result
+
+        if self._rows_by_id is None:
+            self._rows_by_id = {row_id: row for row, row_id in enumerate(all_ids)}
+        for row_id in row_ids:
+            if (row := self._rows_by_id.get(row_id)) is not None:
+                result[row_id] = row
+        return result
+
+    def intern(self, profile: OptionProfile) -> int:
+        """
+        Id of the profile, the profile is added, if it's not in the store.
+        """
+
+        if (profile_id := self._profile_index.get(profile)) is None:
+            if self._free_ids:
+                profile_id = self._free_ids.pop()
+                self.profiles[profile_id] = profile
+            else:
+                profile_id = len(self.profiles)
+                self.profiles.append(profile)
+                self._profile_rows.append(0)
+            self._profile_index[profile] = profile_id
+
+        return profile_id
+
+    def release_unused(self):
+        """
+        Release the profiles, which are not used by any row. Interned profile is kept until this
+        call, even if it was not assigned to the rows yet.
+        """
+
+        for profile_id, rows in enumerate(self._profile_rows):
+            if 0 == rows and (profile := self.profiles[profile_id]) is not None:
+                del self._profile_index[profile]
+                self.profiles[profile_id] = None
+                self._free_ids.append(profile_id)
+
+    def profile(self, row: int) -> OptionProfile:
+        return self.profiles[self.profile_ids[row]]
+
+    def append(self, links: Sequence[str], statuses: Sequence[int], profile_id: int):
+        self.links.extend(links)
+        self.statuses.extend(statuses)
+        self.profile_ids.extend(array('I', [profile_id]) * len(links))
+        first = len(self.row_ids)
+        self.row_ids.extend(range(self._next_id, self._next_id + len(links)))
+        self._next_id += len(links)
+        if self._rows_by_id is not None:
+            self._rows_by_id.update(zip(self.row_ids[first:], range(first, len(self.row_ids))))
+        self._profile_rows[profile_id] += len(links)
+
+    def remove(self, first: int, last: int):
+        for profile_id, rows in self.range_profile_rows(first, last).items():
+            self._profile_rows[profile_id] -= rows
+        if self.output_paths or self.tooltips:
+            for row_id in self.row_ids[first:last + 1]:
+                self.output_paths.pop(row_id, None)
+                self.tooltips.pop(row_id, None)
+        del self.links[first:last + 1]
+        del self.statuses[first:last + 1]
+        del self.profile_ids[first:last + 1]
+        del self.row_ids[first:last + 1]
+        self._rows_by_id = None
+        self.release_unused()
+
+    def reset_result(self, row: int, status: int):
+        row_id = self.row_ids[row]
+        self.statuses[row] = status
+        self.output_paths.pop(row_id, None)
+        self.tooltips.pop(row_id, None)
+
+    def range_profile_rows(self, first: int, last: int) -> Dict[int, int]:
+        """
+        Rows count by the distinct profile id of the rows range.
+        """
+
+        ids = self.profile_ids[first:last + 1]
+        # Usually the range has one profile: the set is faster, than the counter.
+        if 1 == len(distinct := set(ids)):
+            return {next(iter(distinct)): len(ids)}
+
+        return Counter(ids)
+
+    def apply(self, edit: OptionEdit) -> Dict[int, int]:
+        """
+        Set the option of the rows ranges: every distinct profile of the rows is replaced once, the
+        profile ids are replaced by the range, not by the row. Replaced profiles are not released:
+        call `release_unused()`.
+
+        :return: new profile id by the old profile id of the rows.
+        """
+
+        profile_ids = self.profile_ids
+        profile_rows = self._profile_rows
+        replaced: Dict[int, int] = {}
+
+        for first, last in edit.ranges:
+            ids = self.range_profile_rows(first, last)
+
+            for old_id, rows in ids.items():
+                if old_id not in replaced:
+                    replaced[old_id] = self.intern(
+                        self.profiles[old_id].replace(**{edit.name: edit.value}))
+                profile_rows[old_id] -= rows
+                profile_rows[replaced[old_id]] += rows
+
+            if 1 == len(ids):
+                profile_ids[first:last + 1] = \
+                    array('I', [replaced[next(iter(ids))]]) * (last - first + 1)
+            else:
+                profile_ids[first:last + 1] = \
+                    array('I', map(replaced.__getitem__, profile_ids[first:last + 1]))
+
+        return replaced
+
+    def permute(self, order: Sequence[int]):
+        """
+        Reorder rows: new row `i` is the old row `order[i]`.
+        """
+
+        self.links = [self.links[i] for i in order]
+        self.statuses = array('b', (self.statuses[i] for i in order))
+        self.profile_ids = array('I', (self.profile_ids[i] for i in order))
+        self.row_ids = array('Q', (self.row_ids[i] for i in order))
+        self._ids_ascending = False
+        self._rows_by_id = None
+
+
+class LinksModel(QAbstractTableModel):
+    """
+    One column links table over the `LinksStore`.
+
+    Bulk changes (loading, removing, results) are reported by one signal for the rows range, not by
+    the row.
+    """
+
+    # Link text was edited in the view, the row.
+    link_edited = pyqtSignal(int)
+    # Option was edited: the rows ranges and the new profile id by the old profile id.
+    profiles_replaced = pyqtSignal(object, object)
+
+    _colors = {STATUS_SUCCEEDED: 'darkGreen', STATUS_FAILED: 'darkRed', STATUS_INVALID: 'darkRed'}
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._store = LinksStore()
+        self._brushes = {status: QBrush(QColor(color)) for status, color in self._colors.items()}
+
+    @property
+    def store(self) -> LinksStore:
+        return self._store
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._store)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else 1
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+
+        row = index.row()
+        store = self._store
+
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return store.links[row]
+        if Qt.ItemDataRole.ForegroundRole == role:
+            return self._brushes.get(store.statuses[row])
+        if Qt.ItemDataRole.ToolTipRole == role:
+            return store.tooltips.get(store.row_ids[row])
+        if Qt.ItemDataRole.UserRole == role:
+            return store.profile(row)
+
+        return None
+
+    def headerData(self, section: int, orientation: Qt.Orientation,
+                   role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if Qt.Orientation.Horizontal == orientation and Qt.ItemDataRole.DisplayRole == role:
+            return self.tr('Link')
+
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlag:
+        return super().flags(index) | Qt.ItemFlag.ItemIsEditable
+
+    def setData(self, index: QModelIndex, value: Any, role: int = Qt.ItemDataRole.EditRole) -> bool:
+        if not index.isValid() or Qt.ItemDataRole.EditRole != role:
+            return False
+
+        link = str(value).strip()
+        if link == self._store.links[index.row()]:
+            return False
+
+        self.set_link(index.row(), link)
+        self.link_edited.emit(index.row())
+        return True
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder):
+        store = self._store
+        if len(store) < 2:
+            return
+
+        self.layoutAboutToBeChanged.emit()
+        rows = sorted(range(len(store)), key=store.links.__getitem__,
+                      reverse=Qt.SortOrder.DescendingOrder == order)
+        store.permute(rows)
+
+        new_rows = array('I', bytes(4 * len(rows)))
+        for new, old in enumerate(rows):
+            new_rows[old] = new
+        persistent = self.persistentIndexList()
+        self.changePersistentIndexList(persistent, [self.index(new_rows[i.row()], i.column())
+                                                    for i in persistent])
+        self.layoutChanged.emit()
+
+    def append_links(self, links: Sequence[str], profile: Optional[OptionProfile] = None,
+                     statuses: Optional[Sequence[int]] = None) -> range:
+        """
+        Append rows with the same options, invalid links are marked.
+
+        :parameter profile: rows options, None - default options.
+        :parameter statuses: statuses of the links, which were validated already.
+        :return: new rows.
+        """
+
+        store = self._store
+        first = len(store)
+        if not links:
+            return range(first, first)
+
+        profile_id = store.intern(profile if profile is not None else OptionProfile.of())
+        if statuses is None:
+            statuses = [link_status(link) for link in links]
+
+        self.beginInsertRows(QModelIndex(), first, first + len(links) - 1)
+        store.append(links, statuses, profile_id)
+        self.endInsertRows()
+
+        return range(first, len(store))
+
+    def set_link(self, row: int, link: str):
+        self._store.links[row] = link
+        self._store.reset_result(row, link_status(link))
+        index = self.index(row, 0)
+        self.dataChanged.emit(index, index)
+
+    def remove_rows(self, ranges: RowRanges):
+        # From the end: the rows before the removed range are not moved.
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self._store.remove(first, last)
+            self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._store.clear()
+        self.endResetModel()
+
+    def set_results(self, results: Sequence[Tuple[int, bool, Optional[str], Optional[str]]]):
+        """
+        Show the finished items.
+
+        :parameter results: (row id, success, output file path, tooltip), removed rows are skipped.
+        """
+
+        store = self._store
+        rows = store.rows(r[0] for r in results)
+        changed = []
+
+        for row_id, success, output_path, tooltip in results:
+            if (row := rows.get(row_id)) is None:
+                continue
+
+            store.reset_result(row, STATUS_SUCCEEDED if success else STATUS_FAILED)
+            if success and output_path is not None:
+                store.output_paths[row_id] = str(output_path)
+            if tooltip:
+                store.tooltips[row_id] = tooltip
+            changed.append(row)
+
+        if changed:
+            self.dataChanged.emit(self.index(min(changed), 0), self.index(max(changed), 0))
+
+    def output_path(self, row: int) -> Optional[str]:
+        """
+        Output file of the succeeded row.
+        """
+
+        return self._store.output_paths.get(self._store.row_ids[row])
+
+    def apply_edit(self, edit: OptionEdit):
+        self.profiles_replaced.emit(edit.ranges, self._store.apply(edit))
+        # Replaced profiles are released after the receivers have seen them.
+        self._store.release_unused()
+
+    def work_items(self, rows: Iterable[int]) -> List[Tuple[str, int, OptionProfile]]:
+        """
+        Engine items of the rows with the not empty links, items are identified by the row ids.
+        """
+
+        store = self._store
+        return [(link, store.row_ids[row], store.profile(row)) for row in rows
+                if (link := store.links[row])]
@@ -1,32 +1,41 @@
+from collections import deque
 from pathlib import Path
-from typing import Optional, List, Union, Any
+from typing import Callable, Deque, Optional, List, Sequence, Tuple, Union, Any
 
 from PyQt6 import uic, QtCore
-from PyQt6.QtWidgets import QAbstractItemView, QTableWidget, QWidget, QFileDialog, QMessageBox, QMainWindow, \
-    QTableWidgetItem, QTextEdit, QPushButton
-from PyQt6.QtGui import QColor, QBrush
-from PyQt6.QtCore import pyqtSlot, Qt
+from PyQt6.QtWidgets import QAbstractItemView, QHeaderView, QTableView, QFileDialog, QMessageBox, \
+    QMainWindow, QTextEdit, QPushButton, QInputDialog, QLabel, QProgressBar
+from PyQt6.QtCore import pyqtSlot, Qt, QStandardPaths, QTimer, QModelIndex, QItemSelection
 
 from markdown_toolset.article_processor import OUT_FORMATS_LIST, IN_FORMATS_LIST
-from markdown_toolset.www_tools import is_url
-from ordered_set import OrderedSet
 
 from .about_box import AboutBox
 from .error_message import ErrorMessage
 from .app_logic import AppLogic
+from .bulk_edit import BulkEditor
+from .dedup_index import DedupIndex
+from .fetcher import AsyncFetcher
 from .resources import res  # noqa
+from .image_store import ImageStore
 from .item_parameters import ItemParameters
+from .journal import JobJournal
+from .links_loader import LinksChunk, LinksLoader
+from .links_model import LinksModel, RowRanges, merge_ranges
 from .log_config import streamer, logging
+from .memory_budget import DEFAULT_MEMORY_BUDGET, MemoryBudget
+from .rate_limit import HostRateLimiter
+from .selection_aggregate import SelectionAggregate
+from .status_panel import StatusPanel
+from .timings import write_timings_report
+from .ui_bridge import AppLogicBridge, ItemResult
 
 
 _logger = logging.getLogger(__name__)
 
 # QtCore.QDir.addSearchPath('icons', (Path(__file__).parent / 'resources' / 'icons').as_posix())
 
-class MainUi(QMainWindow):
-    _failed_color = 'darkRed'
-    _success_color = 'darkGreen'
 
+class MainUi(QMainWindow):
     def __init__(self):
         super(MainUi, self).__init__()
         uic.loadUi(Path(__file__).parent / 'resources' / 'mat.ui', self)
@@ -41,6 +50,7 @@ class MainUi(QMainWindow):
         self.btnSelectOutPath: QPushButton
         self.btnSelectPubPath: QPushButton
         self.documentEditor: QTextEdit
+        self.downloadLinks: QTableView
 
         self.btnExit.clicked.connect(self._exit_app)
 
@@ -66,12 +76,30 @@ class MainUi(QMainWindow):
         self.downloadIncorrectMIME.stateChanged.connect(self._toggled_download_unrecognized_mime)
         self.saveHierarchy.stateChanged.connect(self._toggled_save_hierarchy)
 
+        self._links_model = LinksModel(self)
+        self._links_model.link_edited.connect(self._link_list_link_edited)
+        self.downloadLinks.setModel(self._links_model)
+        # Fixed rows height: the view doesn't measure the rows, which are not shown.
+        self.downloadLinks.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        # Highlighted column header checks every row of the column on the selection change.
+        self.downloadLinks.horizontalHeader().setHighlightSections(False)
         self.downloadLinks.setAcceptDrops(True)
         self.downloadLinks.installEventFilter(self)
         self.downloadLinks.viewport().installEventFilter(self)
-        self.downloadLinks.cellActivated.connect(self._link_list_cell_activated)
-        self.downloadLinks.itemChanged.connect(self._link_list_item_changed)
-        self.downloadLinks.currentItemChanged.connect(self._link_list_current_item_changed)
+        self.downloadLinks.activated.connect(self._link_list_cell_activated)
+        self._bulk_editor = BulkEditor(self._links_model, self)
+        # Pending edit belongs to the rows, which were selected, when it was made: it's applied
+        # first.
+        self.downloadLinks.selectionModel().selectionChanged.connect(self._bulk_editor.flush)
+        self.downloadLinks.selectionModel().selectionChanged.connect(
+            self._link_list_selection_changed)
+        self._selection_aggregate = SelectionAggregate(self._links_model.store)
+        self._links_model.profiles_replaced.connect(self._selection_aggregate.replace_profiles)
+        self._links_model.rowsInserted.connect(
+            lambda _, first, __: self._selection_aggregate.rows_inserted(first))
+        self._links_model.rowsAboutToBeRemoved.connect(self._selection_aggregate.invalidate)
+        self._links_model.layoutAboutToBeChanged.connect(self._selection_aggregate.invalidate)
+        self._links_model.modelAboutToBeReset.connect(self._selection_aggregate.invalidate)
         self.downloadLinks.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
 
         self.outputPath.setText(Path.cwd().as_posix())
@@ -81,6 +109,7 @@ class MainUi(QMainWindow):
         self.imagesDirectory.editingFinished.connect(self._images_directory_changed)
 
         self.timeoutSetter.valueChanged.connect(self._timeout_changed)
+        self.prioritySetter.valueChanged.connect(self._priority_changed)
 
         self.inputFormatList.addItems([f.upper() for f in IN_FORMATS_LIST])
         self.inputFormatList.currentIndexChanged.connect(self._input_format_changed)
@@ -88,24 +117,95 @@ class MainUi(QMainWindow):
         self.outputFormatList.addItems([f.upper() for f in OUT_FORMATS_LIST])
         self.outputFormatList.currentIndexChanged.connect(self._output_format_changed)
 
+        # Items order is the `DeduplicationVariant` order.
         self.dedupTypeList.addItem(self.tr('Disabled'))
-        self.dedupTypeList.addItem(self.tr('By content'))
         self.dedupTypeList.addItem(self.tr('By file name'))
+        self.dedupTypeList.addItem(self.tr('By content'))
         self.dedupTypeList.currentIndexChanged.connect(self._dedup_type_changed)
 
         self.skipList.textChanged.connect(self._skip_list_changed)
 
         self.actionAbout_Qt.triggered.connect(lambda: QMessageBox.aboutQt(self))
         self.actionAbout.triggered.connect(AboutBox)
+        self.actionProcess_pool.toggled.connect(self._toggled_process_pool)
+        self.actionWorkers_limits.triggered.connect(self._set_workers_limits)
+        self.actionRate_limits.triggered.connect(self._set_rate_limits)
+        self.actionShortest_first.toggled.connect(self._toggled_shortest_first)
+        self.actionSkip_completed.toggled.connect(self._toggled_skip_completed)
+        self.actionIncremental.toggled.connect(self._toggled_incremental)
+        self.actionClear_journal.triggered.connect(self._clear_journal)
+        self.actionImage_store.toggled.connect(self._toggled_image_store)
+        self.actionImage_store_size.triggered.connect(self._set_image_store_size)
+        self.actionExport_timings.triggered.connect(self._export_timings)
 
         self.documentEditor.redoAvailable.connect(self._switch_ed_redo)
         self.documentEditor.undoAvailable.connect(self._switch_ed_undo)
         self.documentEditor.textChanged.connect(self._ed_text_changed)
         self.btnEditSave.clicked.connect(self._btn_ed_save_click)
 
+        self._app_logic_bridge = AppLogicBridge(self)
+        self._app_logic_bridge.items_finished.connect(self._on_items_finished)
+        self._app_logic_bridge.completed.connect(self._on_complete)
+
+        self._journal = JobJournal(Path(QStandardPaths.writableLocation(
+            QStandardPaths.StandardLocation.AppDataLocation)) / 'journal.sqlite')
+        self._image_store = ImageStore(Path(QStandardPaths.writableLocation(
+            QStandardPaths.StandardLocation.CacheLocation)) / 'images')
+        self._dedup_index = DedupIndex(Path(QStandardPaths.writableLocation(
+            QStandardPaths.StandardLocation.AppDataLocation)) / 'dedup.sqlite')
+        # Timings report of the last work, written on the completion.
+        self._timings_report_path = Path(QStandardPaths.writableLocation(
+            QStandardPaths.StandardLocation.AppDataLocation)) / 'timings.json'
+        self._dedup_bytes_saved = 0
+        # Shared by the fetchers of all engines: limits are applied to the running batch.
+        self._rate_limiter = HostRateLimiter()
+        self._memory_budget = MemoryBudget(DEFAULT_MEMORY_BUDGET)
+
+        # Adaptive workers limits, None - defaults.
+        self._min_workers: Optional[int] = None
+        self._max_workers: Optional[int] = None
+        self._status_panel = StatusPanel(self)
+        self.statusbar.addPermanentWidget(self._status_panel)
+        self._workers_label = QLabel(self)
+        self.statusbar.addPermanentWidget(self._workers_label)
+        self._workers_timer = QTimer(self)
+        self._workers_timer.setInterval(1000)
+        self._workers_timer.timeout.connect(self._update_workers_label)
+
+        # Links files are loaded one by one in the background.
+        self._links_files: Deque[Union[Path, str]] = deque()
+        self._links_loader: Optional[LinksLoader] = None
+        self._loaded_links_count = 0
+        self._loading_progress = QProgressBar(self)
+        self._loading_progress.setMaximumWidth(200)
+        self._loading_progress.setFormat(self.tr('Loading links: %p%'))
+        self._loading_progress.hide()
+        self.statusbar.addPermanentWidget(self._loading_progress)
+        self._btn_cancel_loading = QPushButton(self.tr('Cancel loading'), self)
+        self._btn_cancel_loading.clicked.connect(self._cancel_links_loading)
+        self._btn_cancel_loading.hide()
+        self.statusbar.addPermanentWidget(self._btn_cancel_loading)
+
         self.show()
         self._log('Program started')
-        self._app_logic = AppLogic(self._on_complete, self._on_item_success, self._on_item_fail)
+        self._app_logic = self._create_app_logic()
+        self._update_workers_label()
+
+    def _create_app_logic(self, use_processes: bool = False) -> AppLogic:
+        # AppLogic calls back from the worker threads: the bridge moves results to the GUI thread.
+        bridge = self._app_logic_bridge
+        app_logic = AppLogic(bridge.on_complete, bridge.on_item_success, bridge.on_item_fail,
+                             max_workers=self._max_workers, use_processes=use_processes,
+                             fetcher=AsyncFetcher(rate_limiter=self._rate_limiter,
+                                                  memory_budget=self._memory_budget),
+                             journal=self._journal, image_store=self._image_store,
+                             dedup_index=self._dedup_index,
+                             min_workers=self._min_workers, memory_budget=self._memory_budget)
+        app_logic.skip_completed = self.actionSkip_completed.isChecked()
+        app_logic.incremental = self.actionIncremental.isChecked()
+        app_logic.use_image_store = self.actionImage_store.isChecked()
+        app_logic.shortest_first = self.actionShortest_first.isChecked()
+        return app_logic
 
     def _log(self, strings: Union[str, List[str]]):
         if isinstance(strings, str):
@@ -129,24 +229,35 @@ class MainUi(QMainWindow):
 
     def _set_link_list_buttons(self):
         select = self.downloadLinks.selectionModel()
-        self.btnClearLinks.setEnabled(self.downloadLinks.rowCount() > 0)
+        self.btnClearLinks.setEnabled(self._links_model.rowCount() > 0)
         #
-        self.btnStart.setEnabled(self.downloadLinks.rowCount() > 0)
+        self.btnStart.setEnabled(self._links_model.rowCount() > 0)
         self.btnDelLink.setEnabled(select.hasSelection())
         self.btnOpenMdFile.setEnabled(len(select.selection()) <= 1)
 
-    def _get_links_data(self) -> List[ItemParameters]:
-        links_table: QTableWidget = self.downloadLinks
+    def _selected_ranges(self) -> RowRanges:
+        return merge_ranges((r.top(), r.bottom())
+                            for r in self.downloadLinks.selectionModel().selection())
+
+    def _selection_parameters(self) -> Tuple[ItemParameters, List[str], bool]:
+        """
+        Options of the selected rows, see `SelectionAggregate.parameters()`.
+        """
 
-        links = [ld for si in links_table.selectedItems()
-                 if (ld := si.data(Qt.ItemDataRole.UserRole)) is not None]
+        self._bulk_editor.flush()
+        if self._selection_aggregate.dirty:
+            self._selection_aggregate.reset(self._selected_ranges())
 
-        return links
+        return self._selection_aggregate.parameters()
+
+    def _set_links_option(self, name: str, value: Any, debounce: bool = False,
+                          parse: Optional[Callable[[Any], Any]] = None):
+        self._bulk_editor.edit(self._selected_ranges(), name, value, debounce, parse)
 
     def _update_controls(self):
         self._enable_control_box()
         self._set_link_list_buttons()
-        self._item_parameters_to_ui(self._get_links_data())
+        self._item_parameters_to_ui()
 
     @staticmethod
     def _set_checkbox_state(checkbox, state: int, no_block=False):
@@ -177,78 +288,31 @@ class MainUi(QMainWindow):
         finally:
             control.blockSignals(False)
 
-    @staticmethod
-    def _bool_to_tri_state(s: bool) -> int:
-        return 2 if s else 0
-
-    @staticmethod
-    def _set_default(p: ItemParameters, property_name: str, value):
-        if getattr(p, property_name) != value:
-            p.set_default(property_name)
-
-    def _item_parameters_to_ui(self, ips: List[ItemParameters]) -> None:
+    def _item_parameters_to_ui(self) -> None:
         """
         Translate item parameters to the UI, when string in the items table was selected.
-
-        :param ips: items list.
         """
-        p = ItemParameters()
-        new_skip_set = OrderedSet()
-        skip_set_common: bool = False
-
-        first_item = True
-
-        for i in ips:
-            if first_item:
-                p.skip_list = sorted(i.skip_list)
-                p.downloading_timeout = i.downloading_timeout
-                p.output_format = i.output_format
-                p.output_path = i.output_path
-                p.images_public_path = i.images_public_path
-                p.input_format = i.input_format
-                p.deduplication_type = i.deduplication_type
-                p.images_dir_name = i.images_dir_name
-
-                p.remove_source = self._bool_to_tri_state(i.remove_source)
-                p.save_hierarchy = self._bool_to_tri_state(i.save_hierarchy)
-                p.download_incorrect_mime = self._bool_to_tri_state(i.download_incorrect_mime)
-                p.skip_all_incorrect = self._bool_to_tri_state(i.skip_all_incorrect)
-                new_skip_set.update(p.skip_list)
-                # List can contains duplicates.
-                if list(new_skip_set) != p.skip_list:
-                    skip_set_common = True
-
-                first_item = False
-                continue
-
-            self._set_default(p, 'remove_source', self._bool_to_tri_state(i.remove_source))
-            self._set_default(p, 'save_hierarchy', self._bool_to_tri_state(i.save_hierarchy))
-            self._set_default(p, 'download_incorrect_mime', self._bool_to_tri_state(i.download_incorrect_mime))
-            self._set_default(p, 'skip_all_incorrect', self._bool_to_tri_state(i.skip_all_incorrect))
-            self._set_default(p, 'downloading_timeout', i.downloading_timeout)
-            self._set_default(p, 'output_format', i.output_format)
-            self._set_default(p, 'input_format', i.input_format)
-            self._set_default(p, 'deduplication_type', i.deduplication_type)
-            self._set_default(p, 'output_path', i.output_path)
-            self._set_default(p, 'images_public_path', i.images_public_path)
-            self._set_default(p, 'images_dir_name', i.images_dir_name)
-
-            s_skip_list = sorted(i.skip_list)
-            if list(new_skip_set) != s_skip_list:
-                new_skip_set.update(s_skip_list)
-                skip_set_common = True
-
-        controls = self.controlToolBox.findChildren(QWidget)
+        p, skip_lines, skip_list_mixed = self._selection_parameters()
+
+        # Only the option controls are changed: signals of the other tool box widgets are not
+        # touched.
+        controls = (self.removeSource, self.skipIncorrect, self.downloadIncorrectMIME,
+                    self.saveHierarchy, self.timeoutSetter, self.prioritySetter,
+                    self.inputFormatList, self.outputFormatList, self.dedupTypeList,
+                    self.outputPath, self.imagesPublicationPath, self.imagesDirectory,
+                    self.skipList)
         try:
             for c in controls:
                 c.blockSignals(True)
 
-            for cb, var in ((self.removeSource, p.remove_source), (self.skipIncorrect, p.skip_all_incorrect),
+            for cb, var in ((self.removeSource, p.remove_source),
+                            (self.skipIncorrect, p.skip_all_incorrect),
                             (self.downloadIncorrectMIME, p.download_incorrect_mime),
                             (self.saveHierarchy, p.save_hierarchy)):
                 self._set_checkbox_state(cb, var, True)
 
             self.timeoutSetter.setValue(p.downloading_timeout)
+            self.prioritySetter.setValue(p.priority)
             self.inputFormatList.setCurrentIndex(p.input_format)
             self.outputFormatList.setCurrentIndex(p.output_format)
             self.dedupTypeList.setCurrentIndex(p.deduplication_type)
@@ -260,7 +324,7 @@ class MainUi(QMainWindow):
             self.imagesPublicationPath.setText(p.images_public_path)
             self.imagesDirectory.setText(p.images_dir_name)
 
-            if skip_set_common:
+            if skip_list_mixed:
                 # if I use `self.skipList`, text color is gray.
                 self.skipList.setStyleSheet(
                     f'QPlainTextEdit {{color: {self.palette().mid().color().name()};}}')
@@ -268,7 +332,7 @@ class MainUi(QMainWindow):
                 self.skipList.setStyleSheet(
                     f'QPlainTextEdit {{color: {self.palette().text().color().name()};}}')
 
-            self.skipList.setPlainText('\n'.join(new_skip_set))
+            self.skipList.setPlainText('\n'.join(skip_lines))
         finally:
             for c in controls:
                 c.blockSignals(False)
@@ -312,7 +376,7 @@ class MainUi(QMainWindow):
 
     def eventFilter(self, source, event):
         if source is self.downloadLinks.viewport():
-            if event.type() == QtCore.QEvent.Type.DragEnter or event.type() == QtCore.QEvent.Type.DragMove:
+            if event.type() in (QtCore.QEvent.Type.DragEnter, QtCore.QEvent.Type.DragMove):
                 event.accept()
                 return True
             elif event.type() == QtCore.QEvent.Type.Drop and event.mimeData().hasUrls():
@@ -325,43 +389,38 @@ class MainUi(QMainWindow):
 
     @pyqtSlot()
     def _skip_list_changed(self):
-        for link_data in self._get_links_data():
-            link_data.skip_list = self.skipList.toPlainText().split()
+        # Text is split once, when the typing is paused.
+        self._set_links_option('skip_list', self.skipList.toPlainText(), debounce=True,
+                               parse=str.split)
         self.skipList.setStyleSheet(
             f'QPlainTextEdit {{color: {self.palette().text().color().name()};}}')
 
     @pyqtSlot(int)
     def _input_format_changed(self, index: int):
-        for link_data in self._get_links_data():
-            link_data.input_format = index
+        self._set_links_option('input_format', index)
 
     @pyqtSlot(int)
     def _output_format_changed(self, index: int):
-        for link_data in self._get_links_data():
-            link_data.output_format = index
+        self._set_links_option('output_format', index)
 
     @pyqtSlot(int)
     def _dedup_type_changed(self, index: int):
-        for link_data in self._get_links_data():
-            link_data.deduplication_type = index
+        self._set_links_option('deduplication_type', index)
 
     @pyqtSlot()
     def _output_path_changed(self):
         text = self.outputPath.text()
-        for link_data in self._get_links_data():
-            link_data.output_path = text
+        self._set_links_option('output_path', text)
 
     @pyqtSlot()
     def _publication_path_changed(self):
         text = self.imagesPublicationPath.text()
-        for link_data in self._get_links_data():
-            link_data.images_public_path = text
+        self._set_links_option('images_public_path', text)
 
     @pyqtSlot()
     def _images_directory_changed(self):
         text = self.imagesDirectory.text()
-        for link_data in self._get_links_data():
-            link_data.images_dir_name = text
+        self._set_links_option('images_dir_name', text)
 
     @pyqtSlot()
     def _select_download_path_clicked(self):
@@ -371,21 +430,20 @@ class MainUi(QMainWindow):
     def _select_image_public_path_clicked(self):
         self._get_path(self.publicationPath, self.tr('Select public image directory'))
 
-    @pyqtSlot(int, int)
-    def _link_list_cell_activated(self, row: int, col: int):
+    @pyqtSlot(QModelIndex)
+    def _link_list_cell_activated(self, index: QModelIndex):
         try:
             self.documentEditor.blockSignals(True)
-            if row >= 0:
-                links_table = self.downloadLinks
-                item: ItemParameters = links_table.item(row, 0).data(Qt.ItemDataRole.UserRole)
+            if (row := index.row()) >= 0:
+                output_file_path = self._links_model.output_path(row)
 
-                if item.downloaded:
+                if output_file_path is not None:
                     self.documentEditor: QTextEdit
                     self.documentEditor.setEnabled(True)
                     self.btnEditSave.setEnabled(False)
-                    self.documentEditor.setDocumentTitle(str(item.output_file_path))
-                    self.labelFilename.setText(str(item.output_file_path))
-                    with open(item.output_file_path, 'r') as f:
+                    self.documentEditor.setDocumentTitle(output_file_path)
+                    self.labelFilename.setText(output_file_path)
+                    with open(output_file_path, 'r') as f:
                         self.documentEditor.setMarkdown(f.read())
                 else:
                     self.documentEditor.setEnabled(False)
@@ -401,52 +459,64 @@ class MainUi(QMainWindow):
             self.documentEditor.blockSignals(False)
             self._update_controls()
 
-    @pyqtSlot(QTableWidgetItem)
-    def _link_list_item_changed(self, item: QTableWidgetItem):
+    @pyqtSlot(int)
+    def _link_list_link_edited(self, row: int):
         self._update_controls()
+        # Link, entered while working, is processed by the running engine.
+        self._queue_rows([row])
 
-    @pyqtSlot(QTableWidgetItem, QTableWidgetItem)
-    def _link_list_current_item_changed(self, item1: QTableWidgetItem, item2: QTableWidgetItem):
+    def _queue_rows(self, rows: Sequence[int]):
+        """
+        Add rows to the running engine, rows, which are queued already, are skipped by the engine.
+        """
+
+        if not self._app_logic.running:
+            return
+
+        self._bulk_editor.flush()
+        if items := self._links_model.work_items(rows):
+            self._log(f'{len(items)} links were added to the running work')
+            self._app_logic.add_items(items)
+            self._update_workers_label()
+
+    @pyqtSlot(QItemSelection, QItemSelection)
+    def _link_list_selection_changed(self, selected: QItemSelection, deselected: QItemSelection):
+        aggregate = self._selection_aggregate
+        aggregate.deselect(tuple((r.top(), r.bottom()) for r in deselected))
+        aggregate.select(tuple((r.top(), r.bottom()) for r in selected))
         self._update_controls()
-        ld: ItemParameters = getattr(item1, 'linked_data', None)
-        if ld is not None:
-            out_path = Path(ld.output_path)
-            if out_path.exists() and out_path.is_file():
-                with open(out_path) as f:
-                    self.documentEditor.setMarkdown(f.read())
 
     @pyqtSlot(int)
     def _toggled_remove_source(self, state: int):
         self.removeSource.setTristate(False)
 
-        for link_data in self._get_links_data():
-            link_data.remove_source = bool(state)
+        self._set_links_option('remove_source', bool(state))
 
     @pyqtSlot(int)
     def _toggled_skip_incorrect(self, state: int):
         self.skipIncorrect.setTristate(False)
 
-        for link_data in self._get_links_data():
-            link_data.skip_all_incorrect = bool(state)
+        self._set_links_option('skip_all_incorrect', bool(state))
 
     @pyqtSlot(int)
     def _toggled_download_unrecognized_mime(self, state: int):
         self.downloadIncorrectMIME.setTristate(False)
 
-        for link_data in self._get_links_data():
-            link_data.download_incorrect_mime = bool(state)
+        self._set_links_option('download_incorrect_mime', bool(state))
 
     @pyqtSlot(int)
     def _toggled_save_hierarchy(self, state: int):
         self.saveHierarchy.setTristate(False)
 
-        for link_data in self._get_links_data():
-            link_data.save_hierarchy = bool(state)
+        self._set_links_option('save_hierarchy', bool(state))
 
     @pyqtSlot(int)
     def _timeout_changed(self, value: int):
-        for link_data in self._get_links_data():
-            link_data.downloading_timeout = value
+        self._set_links_option('downloading_timeout', value)
+
+    @pyqtSlot(int)
+    def _priority_changed(self, value: int):
+        self._set_links_option('priority', value)
 
     @pyqtSlot(bool)
     def _toggled_viewer_box(self, state: bool):
@@ -460,6 +530,141 @@ class MainUi(QMainWindow):
         self.linksBox.setChecked(state)
         self.rightContainer.setVisible(state)
 
+    @pyqtSlot(bool)
+    def _toggled_process_pool(self, state: bool):
+        if self._app_logic.running:
+            self._log('Execution mode can\'t be changed while working')
+            self.actionProcess_pool.blockSignals(True)
+            self.actionProcess_pool.setChecked(self._app_logic.use_processes)
+            self.actionProcess_pool.blockSignals(False)
+            return
+
+        self._app_logic.shutdown()
+        self._app_logic = self._create_app_logic(state)
+        self._update_workers_label()
+        self._log(f'Execution mode: {"processes" if state else "threads"}')
+
+    @pyqtSlot()
+    def _set_workers_limits(self):
+        if self._app_logic.running:
+            self._log('Workers limits can\'t be changed while working')
+            return
+
+        minimum, maximum = self._app_logic.workers_limits
+        minimum, ok = QInputDialog.getInt(self, self.tr('Workers limits'),
+                                          self.tr('Minimum workers count:'), minimum, 1, 1024)
+        if not ok:
+            return
+
+        maximum, ok = QInputDialog.getInt(self, self.tr('Workers limits'),
+                                          self.tr('Maximum workers count '
+                                                  '(equal to the minimum - fixed count):'),
+                                          max(minimum, maximum), minimum, 1024)
+        if not ok:
+            return
+
+        self._min_workers, self._max_workers = minimum, maximum
+        self._app_logic.shutdown()
+        self._app_logic = self._create_app_logic(self._app_logic.use_processes)
+        self._update_workers_label()
+        self._log(f'Workers limits: {minimum} - {maximum}')
+
+    @pyqtSlot()
+    def _set_rate_limits(self):
+        text, ok = QInputDialog.getMultiLineText(
+            self, self.tr('Rate limits'),
+            self.tr('Requests per second ("rate", 0 - unlimited) and requests at once ("burst"):\n'
+                    '[default] section for all hosts, [host name] sections for the hosts and their '
+                    'subdomains.'),
+            self._rate_limiter.to_config() or '[default]\nrate = 0\nburst = 1\n')
+        if not ok:
+            return
+
+        try:
+            self._rate_limiter.load_config(text)
+        except ValueError as e:
+            ErrorMessage(self, self.tr('Incorrect rate limits: {}').format(e))
+            return
+
+        self._log('Rate limits changed')
+
+    @pyqtSlot()
+    def _update_workers_label(self):
+        app_logic = self._app_logic
+        self._status_panel.update_status(app_logic.status, app_logic.active_workers,
+                                         app_logic.queue_depth, app_logic.running)
+
+        minimum, maximum = app_logic.workers_limits
+        budget = self._memory_budget
+        self._workers_label.setText(
+            self.tr('Workers limits: {} - {}, memory: {:.0f} of {:.0f} MiB').format(
+                minimum, maximum, budget.used / 2 ** 20, budget.limit / 2 ** 20))
+
+    @pyqtSlot(bool)
+    def _toggled_skip_completed(self, state: bool):
+        self._app_logic.skip_completed = state
+
+    @pyqtSlot(bool)
+    def _toggled_incremental(self, state: bool):
+        self._app_logic.incremental = state
+
+    @pyqtSlot(bool)
+    def _toggled_shortest_first(self, state: bool):
+        self._app_logic.shortest_first = state
+
+    @pyqtSlot(bool)
+    def _toggled_image_store(self, state: bool):
+        self._app_logic.use_image_store = state
+
+    @pyqtSlot()
+    def _set_image_store_size(self):
+        store = self._image_store
+        size, ok = QInputDialog.getInt(self, self.tr('Images store size'),
+                                       self.tr('Maximum images store size, MiB (0 - unlimited):'),
+                                       store.max_size // 2 ** 20, 0, 2 ** 20)
+        if not ok:
+            return
+
+        store.max_size = size * 2 ** 20
+        removed = store.evict()
+        self._log(f'Images store size limit: {size} MiB, {removed} images removed, '
+                  f'{store.size / 2 ** 20:.1f} MiB used')
+
+    @pyqtSlot()
+    def _clear_journal(self):
+        if self._app_logic.running:
+            self._log('Journal can\'t be cleared while working')
+            return
+
+        self._journal.clear()
+        self._log('Jobs journal cleared')
+
+    @pyqtSlot()
+    def _export_timings(self):
+        if not (timings := self._app_logic.item_timings):
+            self._log('There are no timings to export, start the work first')
+            return
+
+        file_path, _ = QFileDialog.getSaveFileName(self, self.tr('Export timings report'),
+                                                   'timings.json',
+                                                   self.tr('JSON (*.json);;CSV (*.csv)'))
+        if not file_path:
+            return
+
+        self._write_timings_report(file_path)
+
+    def _write_timings_report(self, file_path: Union[Path, str]):
+        timings = self._app_logic.item_timings
+
+        try:
+            Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+            write_timings_report(file_path, timings.values())
+        except OSError as e:
+            self._log(f'Timings report "{file_path}" writing failed: {e}')
+            return
+
+        self._log(f'Timings report for {len(timings)} items was written to "{file_path}"')
+
     @pyqtSlot(bool)
     def _switch_ed_undo(self, available: bool):
         self.btnEditUndo.setEnabled(available and self.documentEditor.isEnabled())
@@ -481,106 +686,95 @@ class MainUi(QMainWindow):
 
     @pyqtSlot()
     def _load_links_file(self):
-        if res_path := self._open_file_dialog(self.tr('Open file with links to download'), without_dir=True):
+        if res_path := self._open_file_dialog(self.tr('Open file with links to download'),
+                                              without_dir=True):
             self._load_links(res_path)
 
-    @staticmethod
-    def _hl_item(item: QTableWidgetItem, color: str):
-        item.setForeground(QBrush(QColor(color)))
-
-    def _hl_row(self, row_num: int, color: str):
-        links_table: QTableWidget = self.downloadLinks
-        try:
-            links_table.blockSignals(True)
-            self._hl_item(links_table.item(row_num, 0), color)
-        finally:
-            links_table.blockSignals(False)
-            links_table.repaint()
-
-    def _hl_failed_row(self, row_num):
-        self._hl_row(row_num, self._failed_color)
-
-    def _hl_successful_row(self, row_num: int):
-        self._hl_row(row_num, self._success_color)
-
     def _load_links(self, res_path: Union[Path, str]):
-        links_table: QTableWidget = self.downloadLinks
+        """
+        Load links file in the background, rows are added by chunks while the file is read.
+        """
 
-        try:
-            links_table.blockSignals(True)
+        self._links_files.append(res_path)
+        if self._links_loader is None:
+            self._load_next_links_file()
 
-            with open(res_path, 'r') as lf:
-                ls = []
-                err_log = []
+    def _load_next_links_file(self):
+        if not self._links_files:
+            self._links_loader = None
+            self._loading_progress.hide()
+            self._btn_cancel_loading.hide()
+            return
 
-                for line in lf:
-                    try:
-                        lrs = line.rstrip()
+        loader = self._links_loader = LinksLoader(self._links_files.popleft())
+        loader.chunk_loaded.connect(self._on_links_chunk_loaded)
+        loader.finished.connect(self._on_links_loaded)
+        self._loaded_links_count = 0
 
-                        if not lrs:
-                            continue
+        self._loading_progress.setRange(0, 100)
+        self._loading_progress.setValue(0)
+        self._loading_progress.show()
+        self._btn_cancel_loading.show()
+        loader.start()
 
-                        ls.append(lrs)
-                    except UnicodeError as e:
-                        err_log.append(str(e))
+    @pyqtSlot(object)
+    def _on_links_chunk_loaded(self, chunk: LinksChunk):
+        if self.sender() is not self._links_loader or self._links_loader.cancelled:
+            return
+
+        rows = self._links_model.append_links(chunk.links, statuses=chunk.statuses)
+        self._loaded_links_count += len(rows)
+        self._queue_rows(rows)
 
-                if err_log:
-                    ErrorMessage(self, '\n'.join(err_log))
+        if rows:
+            self._select_first_row()
+            self._set_link_list_buttons()
 
-                strings = {nl: l for nl, l in enumerate(ls)}
-                prev_row_count = links_table.rowCount()
-                links_table.setRowCount(prev_row_count + len(strings))
+        if chunk.size:
+            self._loading_progress.setValue(chunk.position * 100 // chunk.size)
+        else:
+            # Unknown size: busy indicator.
+            self._loading_progress.setRange(0, 0)
 
-                err_log.clear()
+    @pyqtSlot(str)
+    def _on_links_loaded(self, error: str):
+        loader = self._links_loader
+        if self.sender() is not loader:
+            return
 
-                for nl, line in strings.items():
-                    item = QTableWidgetItem(line)
-                    try:
-                        if not is_url(line) and not Path(line).is_file():
-                            self._hl_item(item, self._failed_color)
-                        self._add_download_link(prev_row_count + nl, item)
-                    except Exception as e:
-                        _logger.error('%s', e)
-                        err_log.append(str(e))
+        if error:
+            ErrorMessage(self, self.tr('Can\'t load file "{}": {}').format(loader.path, error))
+        elif loader.cancelled:
+            self._log(f'Loading of "{loader.path}" was cancelled, '
+                      f'{self._loaded_links_count} links were loaded')
+        else:
+            self._log(f'{self._loaded_links_count} links were loaded from "{loader.path}"')
 
-                if err_log:
-                    ErrorMessage(self, '\n'.join(err_log))
+        self._update_controls()
+        self._load_next_links_file()
 
-            if links_table.rowCount() > 0:
-                links_table.selectRow(0)
-        except Exception as e:
-            ErrorMessage(self, self.tr(f'Can\'t load file "{res_path}": {str(e)}'))
-        finally:
-            links_table.blockSignals(False)
-            self._update_controls()
+    @pyqtSlot()
+    def _cancel_links_loading(self):
+        self._links_files.clear()
+        if self._links_loader is not None:
+            self._links_loader.cancel()
 
     @pyqtSlot()
     def _clear_links(self):
-        self.downloadLinks.setRowCount(0)
+        self._cancel_links_loading()
+        self._links_model.clear()
         self._update_controls()
 
     @pyqtSlot()
     def _add_link(self):
-        links_table = self.downloadLinks
-
-        row_number = links_table.rowCount()
-        links_table.setRowCount(row_number + 1)
-        self._add_download_link(row_number)
+        self._links_model.append_links([''])
+        self._select_first_row()
+        self._update_controls()
 
     @pyqtSlot()
     def _del_link(self):
-        table = self.downloadLinks
-
-        try:
-            table.blockSignals(True)
-            indexes = table.selectionModel().selectedRows()
-
-            for i in indexes:
-                table.removeRow(i.row())
-
-        finally:
-            table.blockSignals(False)
-            self._update_controls()
+        self._links_model.remove_rows(self._selected_ranges())
+        self._update_controls()
 
     @pyqtSlot()
     def _open_md_file(self):
@@ -591,76 +785,78 @@ class MainUi(QMainWindow):
         if filename is None:
             return
 
-        links_table = self.downloadLinks
+        links_model = self._links_model
 
         try:
-            links_table.blockSignals(True)
-            if 0 == links_table.rowCount():
-                links_table.setRowCount(1)
-                self._add_download_link(0, QTableWidgetItem(filename))
+            if 0 == links_model.rowCount():
+                links_model.append_links([filename])
+                self._select_first_row()
             else:
-                indexes = links_table.selectionModel().selectedRows()
+                ranges = self._selected_ranges()
 
-                assert len(indexes) == 1, 'Incorrect selection'
-                self._add_download_link(indexes[0].row(), QTableWidgetItem(filename))
+                assert len(ranges) == 1 and ranges[0][0] == ranges[0][1], 'Incorrect selection'
+                links_model.set_link(ranges[0][0], filename)
 
         finally:
-            links_table.blockSignals(False)
             self._update_controls()
 
-    def _get_download_links(self, row_numbers: List[int]) -> List[QTableWidgetItem]:
-        links_table: QTableWidget = self.downloadLinks
-        return [links_table.item(rn, 0) for rn in row_numbers]
-
-    def _get_row_by_text(self, text: str) -> int:
-        links_table: QTableWidget = self.downloadLinks
-
-        result = links_table.findItems(text, Qt.MatchFlag.MatchExactly)
-
-        if 0 == len(result):
-            raise ValueError(f'Cant\'t find text "{text}"')
-
-        return result[0].row()
-
-    def _add_download_link(self, row_number: int, item: Optional[QTableWidgetItem] = None):
-        links_table: QTableWidget = self.downloadLinks
-        if item is None:
-            item = QTableWidgetItem()
-
-        item.setData(Qt.ItemDataRole.UserRole, ItemParameters())
-        links_table.setItem(row_number, 0, item)
-
-        if not links_table.selectionModel().selectedRows():
-            links_table.selectRow(0)
+    def _select_first_row(self):
+        if not self.downloadLinks.selectionModel().hasSelection():
+            self.downloadLinks.selectRow(0)
 
     @pyqtSlot()
     def _start(self):
         if self._app_logic.running:
             self._log('User stopped work...')
+            # Completion will be reported to the `_on_complete()`.
+            self.btnStart.setEnabled(False)
+            self.btnStart.setText(self.tr('Stopping...'))
             self._app_logic.stop()
-            self.btnStart.setText(self.tr('Start'))
         else:
             self._log('Work started...')
+            self._app_logic_bridge.reset_stats()
+            self._dedup_bytes_saved = self._dedup_index.bytes_saved
+            self._workers_timer.start()
             self.btnStart.setText(self.tr('Stop'))
-            links_table = self.downloadLinks
-
-            download_files = [(item.text(), item.row(), item.data(Qt.ItemDataRole.UserRole)) for i
-                              in range(links_table.rowCount()) if (item := links_table.item(i, 0))]
+            self._bulk_editor.flush()
+            download_files = self._links_model.work_items(range(self._links_model.rowCount()))
             self._app_logic.add_items(download_files)
 
+    @pyqtSlot()
     def _on_complete(self):
-        self._log('Work completed...')
-        self.btnStart.setText(self.tr('Start'))
-
-    def _on_item_success(self, index, file_path):
-        self._hl_successful_row(index)
-        links_table = self.downloadLinks
-        item: ItemParameters = links_table.item(index, 0).data(Qt.ItemDataRole.UserRole)
-        item.downloaded = True
-        item.output_file_path = file_path
+        if self._app_logic.running:
+            # Links were added after the completion was reported: the new work was started.
+            return
 
-    def _on_item_fail(self, index, file_path):
-        self._hl_failed_row(index)
+        bridge = self._app_logic_bridge
+        self._log(f'Work completed: {bridge.events_count} results were shown by '
+                  f'{bridge.updates_count} updates ({bridge.coalesced_count} coalesced)')
+        if bytes_saved := self._dedup_index.bytes_saved - self._dedup_bytes_saved:
+            self._log(f'Deduplication: {bytes_saved} bytes of the duplicate images were not '
+                      f'written')
+        if self._app_logic.item_timings:
+            self._write_timings_report(self._timings_report_path)
+        self._workers_timer.stop()
+        self._update_workers_label()
+        self.btnStart.setText(self.tr('Start'))
+        self.btnStart.setEnabled(True)
+
+    @pyqtSlot(list)
+    def _on_items_finished(self, results: List[ItemResult]):
+        item_timings = self._app_logic.item_timings
+        rows = []
+
+        # Items are identified by the row ids: the rows could be sorted or removed while working.
+        for row_id, file_path, error, failure_class, success in results:
+            tooltip = []
+            if error is not None:
+                tooltip.append(self.tr('{} failure: {}').format(failure_class, error))
+            if (timings := item_timings.get(row_id)) is not None:
+                tooltip.append(timings.summary())
+            rows.append((row_id, success, file_path, '\n'.join(tooltip)))
+
+        # One repaint of the changed rows range.
+        self._links_model.set_results(rows)
 
     @pyqtSlot()
     def _exit_app(self):
@@ -0,0 +1,185 @@
+"""
+Global memory budget: workers reserve bytes before buffering and wait, while the budget is used up.
+"""
+import asyncio
+import logging
+from collections import deque
+from threading import Event, Lock
+from typing import Callable, Deque, List, Optional
+
+from .cancellation import CancelToken, JobCancelled
+
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET = 1024 * 2 ** 20
+
+
+class _Waiter:
+    __slots__ = ('size', 'wake')
+
+    def __init__(self, size: int, wake: Callable[[], None]):
+        self.size = size
+        self.wake = wake
+
+
+class MemoryBudget:
+    """
+    Bytes budget, shared by the worker threads and the fetcher event loop.
+
+    Reservations are granted in the request order: a large reservation is not starved by the small
+    ones. Reservation larger than the whole budget is reduced to the budget: it waits until
+    everything else is released. Holder of a reservation extends it by `extend()`, nested
+    reservation would wait for itself.
+    """
+
+    def __init__(self, limit: int):
+        """
+        :parameter limit: budget in bytes.
+        """
+
+        self.limit = max(1, limit)
+        self.peak = 0
+        self.waits = 0
+        self._used = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = Lock()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    def reserve(self, size: int, cancel_token: Optional[CancelToken] = None) -> int:
+        """
+        Reserve bytes, blocks the caller thread.
+
+        :return: reserved size, it must be released.
+        :raise JobCancelled: when the token was cancelled while waiting.
+        """
+
+        size = self._clamp(size)
+        event = Event()
+
+        with self._lock:
+            if self._take(size):
+                return size
+            waiter = self._enqueue(size, event.set)
+
+        on_cancel = cancel_token.add_callback(event.set) if cancel_token is not None else None
+        try:
+            event.wait()
+        finally:
+            if on_cancel is not None:
+                cancel_token.remove_callback(on_cancel)
+
+        if not self._withdraw(waiter):
+            return size
+
+        raise JobCancelled('Cancelled by user')
+
+    async def areserve(self, size: int) -> int:
+        """
+        Reserve bytes in the event loop, other tasks are not blocked while waiting.
+
+        :return: reserved size, it must be released.
+        """
+
+        size = self._clamp(size)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            if self._take(size):
+                return size
+            waiter = self._enqueue(size, _wake)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not self._withdraw(waiter):
+                # Was granted at the same time.
+                self.release(size)
+            raise
+
+        return size
+
+    def extend(self, size: int) -> int:
+        """
+        Reserve bytes at once, also over the limit, doesn't wait: for the holder of the other
+        reservation.
+
+        Holder can't wait in the queue: the waiters ahead of it can wait for the memory, which it
+        holds.
+
+        :return: reserved size, it must be released.
+        """
+
+        size = max(0, size)
+
+        with self._lock:
+            self._used += size
+            self.peak = max(self.peak, self._used)
+
+        return size
+
+    def release(self, size: int):
+        if size <= 0:
+            return
+
+        with self._lock:
+            self._used -= size
+            granted = self._grant()
+
+        for wake in granted:
+            wake()
+
+    def _clamp(self, size: int) -> int:
+        return max(0, min(size, self.limit))
+
+    def _take(self, size: int) -> bool:
+        if self._waiters or self._used + size > self.limit:
+            return False
+
+        self._used += size
+        self.peak = max(self.peak, self._used)
+        return True
+
+    def _enqueue(self, size: int, wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(size, wake)
+        self._waiters.append(waiter)
+        self.waits += 1
+        _logger.debug('Waiting for %d bytes of the memory budget, %d of %d used', size, self._used,
+                      self.limit)
+        return waiter
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """
+        Remove not granted waiter.
+
+        :return: False, if the waiter was granted.
+        """
+
+        with self._lock:
+            if waiter not in self._waiters:
+                return False
+            self._waiters.remove(waiter)
+            granted = self._grant()
+
+        for wake in granted:
+            wake()
+
+        return True
+
+    def _grant(self) -> List[Callable[[], None]]:
+        granted = []
+
+        while self._waiters and self._used + self._waiters[0].size <= self.limit:
+            waiter = self._waiters.popleft()
+            self._used += waiter.size
+            granted.append(waiter.wake)
+
+        self.peak = max(self.peak, self._used)
+        return granted
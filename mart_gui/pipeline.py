@@ -0,0 +1,203 @@
+"""
+Staged jobs pipeline: every stage has its own worker threads and a bounded input queue.
+"""
+import logging
+from itertools import count
+from queue import PriorityQueue, Queue, Empty
+from threading import Condition, Thread, Lock
+from time import monotonic
+from typing import Any, Callable, List, Optional
+
+
+_logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    Pipeline stage: worker threads take jobs from the input queue, call the handler and pass jobs to
+    the next stage.
+
+    Only `limit` workers take jobs at the same time, the limit can be changed while working.
+    """
+
+    # Queue entries: (0, order key, sequence number, enqueuing time, job), stop request is (1,):
+    # it's after all jobs.
+    _stop_entry = (1,)
+
+    def __init__(self, name: str, handler: Callable[[Any], None], workers: int, queue_size: int = 0,
+                 limit: Optional[int] = None, order: Optional[Callable[[Any], Any]] = None):
+        """
+        :parameter name: stage name for the logs.
+        :parameter handler: jobs handler, will be called from the stage worker threads.
+        :parameter workers: stage worker threads count, maximum limit.
+        :parameter queue_size: maximum input queue size, 0 - unbounded. Full queue blocks the
+                               previous stage.
+        :parameter limit: active workers count, `workers` by default.
+        :parameter order: job sort key, jobs with the lower key are taken first, FIFO by default.
+        """
+
+        self.name = name
+        self.workers = workers
+        self._handler = handler
+        self._order = order
+        self._sequence = count()
+        self._queue: Queue = PriorityQueue(maxsize=queue_size) if order is not None \
+            else Queue(maxsize=queue_size)
+        self._threads: List[Thread] = []
+        self._forward: Optional[Callable[['Stage', Any], None]] = None
+        self._on_error: Optional[Callable[[Any, Exception], None]] = None
+
+        self._gate = Condition()
+        self._limit = workers if limit is None else max(1, min(limit, workers))
+        self._active = 0
+        self._stopping = False
+
+        # Statistics for the concurrency tuning.
+        self.processed = 0
+        self.wait_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    def set_limit(self, limit: int):
+        with self._gate:
+            self._limit = max(1, min(limit, self.workers))
+            self._gate.notify_all()
+
+    def start(self, forward: Callable[['Stage', Any], None],
+              on_error: Callable[[Any, Exception], None]):
+        self._forward = forward
+        self._on_error = on_error
+
+        for n in range(self.workers):
+            t = Thread(target=self._run, name=f'{self.name}-{n}', daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def stop(self):
+        with self._gate:
+            self._stopping = True
+            self._gate.notify_all()
+
+        for _ in self._threads:
+            self._queue.put(self._stop_entry)
+
+    def put(self, job: Any):
+        # Sequence number keeps FIFO order for the equal keys, enqueuing time gives the queue
+        # waiting time.
+        order = self._order(job) if self._order is not None else 0
+        self._queue.put((0, order, next(self._sequence), monotonic(), job))
+
+    def drain(self) -> List[Any]:
+        """
+        Remove all queued jobs and return them.
+        """
+
+        jobs = []
+        try:
+            while True:
+                entry = self._queue.get_nowait()
+                if entry is self._stop_entry:
+                    # Keep stop request.
+                    self._queue.put(entry)
+                    break
+                jobs.append(entry[-1])
+        except Empty:
+            pass
+
+        return jobs
+
+    def _run(self):
+        while True:
+            with self._gate:
+                while self._active >= self._limit and not self._stopping:
+                    self._gate.wait()
+                self._active += 1
+
+            try:
+                if (entry := self._queue.get()) is self._stop_entry:
+                    break
+                self._process(*entry[-2:])
+            finally:
+                with self._gate:
+                    self._active -= 1
+                    self._gate.notify()
+
+    def _process(self, enqueued: float, job: Any):
+        started = monotonic()
+
+        try:
+            self._handler(job)
+        except Exception as e:  # pylint: disable=broad-except
+            _logger.debug('Stage "%s" failed: %s', self.name, e)
+            self._on_error(job, e)
+            return
+        finally:
+            with self._gate:
+                self.processed += 1
+                self.wait_time += started - enqueued
+
+        self._forward(self, job)
+
+
+class Pipeline:
+    """
+    Chain of the stages, the first stage queue must be unbounded: `put()` doesn't block the caller.
+
+    The last stage finalizes the results and is not cancellable: jobs, which have reached it, are
+    completed.
+    """
+
+    def __init__(self, stages: List[Stage], on_done: Callable[[Any], None],
+                 on_error: Callable[[Any, Exception], None], on_cancel: Callable[[Any], None]):
+        self._stages = stages
+        self._on_done = on_done
+        self._on_error = on_error
+        self._on_cancel = on_cancel
+        self._cancelling = False
+        self._lock = Lock()
+
+        for s in stages:
+            s.start(self._forward, on_error)
+
+    @property
+    def stages(self) -> List[Stage]:
+        return self._stages
+
+    def put(self, job: Any):
+        self._stages[0].put(job)
+
+    def resume(self):
+        self._cancelling = False
+
+    def cancel_pending(self):
+        """
+        Cancel all queued jobs, jobs which are processed now will be cancelled after the current
+        stage.
+        """
+
+        with self._lock:
+            self._cancelling = True
+            jobs = [j for s in self._stages[:-1] for j in s.drain()]
+
+        for j in jobs:
+            self._on_cancel(j)
+
+    def stop(self):
+        for s in self._stages:
+            s.stop()
+
+    def _forward(self, stage: Stage, job: Any):
+        index = self._stages.index(stage)
+
+        if index + 1 == len(self._stages):
+            self._on_done(job)
+        elif self._cancelling and index + 2 < len(self._stages):
+            self._on_cancel(job)
+        else:
+            self._stages[index + 1].put(job)
@@ -0,0 +1,591 @@
+"""
+Articles prefetching: the source and the images are downloaded before the conversion,
+so the conversion itself doesn't wait for the network.
+"""
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+from io import StringIO
+from time import monotonic
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from markdown_toolset.article_downloader import ArticleDownloader
+from markdown_toolset.article_processor import ArticleProcessor
+from markdown_toolset.deduplicators import DeduplicationVariant
+from markdown_toolset.image_downloader import ImageDownloader
+from markdown_toolset.transformers import TRANSFORMERS
+from markdown_toolset.www_tools import is_url, get_filename_from_url, get_base_url
+
+from .cancellation import CancelToken, JobCancelled
+from .dedup_index import DedupIndex, IndexedContentDeduplicator
+from .fetcher import AsyncFetcher, FetchResponse, RetryDelay
+from .image_store import ImageStore, StoredImage, clone_or_copy
+from .journal import SourceState
+from .timings import ItemTimings
+
+
+_logger = logging.getLogger(__name__)
+
+
+class PrefetchedImage:
+    """
+    Downloaded image: file with the content or the downloading error.
+    """
+
+    def __init__(self, url: str, file_name: Optional[str] = None, path: Optional[Path] = None,
+                 error: Optional[Exception] = None, stored: bool = False, downloaded: bool = True):
+        """
+        :parameter stored: image file is the images store blob, it must be cloned, not written.
+        :parameter downloaded: image was downloaded, not taken from the store.
+        """
+
+        self.url = url
+        self.file_name = file_name
+        self.path = path
+        self.error = error
+        self.stored = stored
+        self.downloaded = downloaded and error is None
+        self.size = path.stat().st_size if path is not None and downloaded else 0
+
+    @classmethod
+    def from_store(cls, image: StoredImage, downloaded: bool) -> 'PrefetchedImage':
+        return cls(image.url, image.file_name, image.path, stored=True, downloaded=downloaded)
+
+
+class PrefetchedArticle:
+    """
+    Article source and images, which were downloaded in advance.
+    """
+
+    def __init__(self, source_path: Optional[Path] = None, base_url: str = ''):
+        # Local copy of the remote article or None for the local article.
+        self.source_path = source_path
+        self.base_url = base_url
+        # Image download URL -> image.
+        self.images: Dict[str, PrefetchedImage] = {}
+        self.work_dir: Optional[Path] = None
+        # Validators of the processed source version.
+        self.source_state: Optional[SourceState] = None
+        # Source was not changed since the previous processing: the article is not processed.
+        self.unchanged = False
+
+    @property
+    def bytes_downloaded(self) -> int:
+        source_size = self.source_path.stat().st_size if self.source_path is not None else 0
+        return source_size + sum(i.size for i in self.images.values())
+
+    def forget_failed(self) -> int:
+        """
+        Remove images, which were not downloaded: they will be downloaded again by the processor.
+
+        :return: removed images count.
+        """
+
+        failed = [url for url, image in self.images.items() if image.error is not None]
+        for url in failed:
+            del self.images[url]
+        return len(failed)
+
+    def make_work_dir(self) -> Path:
+        if self.work_dir is None:
+            self.work_dir = Path(tempfile.mkdtemp(prefix='mart_'))
+        return self.work_dir
+
+    def cleanup(self):
+        if self.work_dir is not None:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+
+def _timeout(downloading_timeout: int) -> Optional[int]:
+    return downloading_timeout if downloading_timeout > 0 else None
+
+
+def fetch_source(article_url: str, fetcher: AsyncFetcher, downloading_timeout: int = -1,
+                 cancel_token: Optional[CancelToken] = None,
+                 known_state: Optional[SourceState] = None,
+                 timings: Optional[ItemTimings] = None,
+                 retry: Optional[RetryDelay] = None) -> Tuple[Optional[Path], str, SourceState]:
+    """
+    Download remote article, like `ArticleDownloader` does.
+
+    :parameter known_state: previously processed source version, the request will be conditional.
+    :parameter retry: failed attempts handler of the fetcher.
+    :return: local article path (None, if the source was not changed), article base URL and source
+             validators.
+    """
+
+    headers = known_state.conditional_headers() if known_state is not None else None
+    # Must be written to the filesystem: probably user wants to save original Markdown.
+    # The body is streamed into the file, the name is known after the response: the file is renamed.
+    fd, part_name = tempfile.mkstemp(suffix='.part', prefix='.mart_', dir='.')
+    os.close(fd)
+    part_path = Path(part_name)
+
+    try:
+        response = fetcher.fetch(article_url, timeout=_timeout(downloading_timeout), dest=part_path,
+                                 cancel_token=cancel_token, headers=headers, retry=retry)
+
+        if timings is not None:
+            _account_response(timings, response)
+            timings.count('source_bytes', part_path.stat().st_size)
+
+        if 304 == response.status_code:
+            _logger.info('Article "%s" was not modified', article_url)
+            part_path.unlink(missing_ok=True)
+            return None, '', known_state
+
+        state = SourceState(response.headers.get('etag'), response.headers.get('last-modified'),
+                            SourceState.hash_file(part_path))
+
+        if known_state is not None and known_state.content_hash == state.content_hash:
+            _logger.info('Article "%s" content was not changed', article_url)
+            part_path.unlink(missing_ok=True)
+            return None, '', state
+
+        article_path = Path(get_filename_from_url(response) or Path(article_url).name)
+
+        _logger.debug('Article [remote] will be written to "%s"', article_path)
+        os.replace(part_path, article_path)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+    return article_path, get_base_url(response), state
+
+
+def _account_response(timings: ItemTimings, response: Union[FetchResponse, Exception]):
+    if isinstance(response, FetchResponse):
+        timings.add('dns', response.dns_time)
+        timings.add('connect', response.connect_time)
+        timings.add('throttle', response.throttle_time)
+
+
+def local_source_state(article_path: Path,
+                       known_state: Optional[SourceState] = None) -> Tuple[bool, SourceState]:
+    """
+    Check local article for changes: the content is hashed only, if the file modification time or
+    size was changed.
+
+    :return: True, if the article was changed, and the current source validators.
+    """
+
+    stamp = SourceState.file_stamp(article_path)
+
+    if known_state is not None and known_state.stamp == stamp:
+        return False, known_state
+
+    state = SourceState(content_hash=SourceState.hash_file(article_path), stamp=stamp)
+
+    return known_state is None or known_state.content_hash != state.content_hash, state
+
+
+def find_image_links(article_text: str) -> List[str]:
+    """
+    Find image links with the same parsers, which are used by the article transformers.
+    """
+
+    links = []
+
+    for transformer in TRANSFORMERS:
+        # pylint: disable=protected-access
+        for link in transformer(StringIO(article_text), None)._read_article():
+            if (link := str(link)) not in links:
+                links.append(link)
+
+    return links
+
+
+def image_download_url(image_url: str, base_url: str, article_path: Path) -> str:
+    """
+    Make image download URL, like `ImageDownloader` does.
+    """
+
+    if is_url(image_url):
+        return image_url
+
+    if base_url:
+        return f'{base_url}/{image_url}'
+
+    return str(article_path.parent / image_url)
+
+
+def images_to_prefetch(article_path: Path, base_url: str, skip_list: Union[str, List[str]],
+                       download_incorrect_mime: bool) -> List[str]:
+    """
+    Remote images download URLs, which will be requested by the `ImageDownloader`.
+    """
+
+    with open(article_path, 'r', encoding='utf8', errors='replace') as article_file:
+        image_links = find_image_links(article_file.read())
+
+    if isinstance(skip_list, str):
+        # Skip list file will be read by the `ArticleProcessor`, skipped images are not prefetched
+        # only.
+        skip_list = [] if skip_list.startswith('@') else [s.strip() for s in skip_list.split(',')]
+
+    skip_set = set(skip_list)
+    urls = []
+
+    for image_url in image_links:
+        if image_url in skip_set:
+            continue
+
+        url = image_download_url(image_url, base_url, article_path)
+        if not is_url(url) or url in urls:
+            continue
+
+        if not download_incorrect_mime and mimetypes.guess_type(url)[0] is None:
+            continue
+
+        urls.append(url)
+
+    return urls
+
+
+def _prefetched_image(url: str, result: Union[FetchResponse, Exception]) -> PrefetchedImage:
+    if isinstance(result, Exception):
+        # `ImageDownloader` decides, what to do with the error.
+        _logger.debug('Image "%s" prefetching failed: %s', url, result)
+        return PrefetchedImage(url, error=result)
+
+    try:
+        return PrefetchedImage(url, get_filename_from_url(result), result.path)
+    except Exception as e:  # pylint: disable=broad-except
+        if result.path is not None:
+            result.path.unlink(missing_ok=True)
+        return PrefetchedImage(url, error=e)
+
+
+def _fetch_images(prefetched: PrefetchedArticle, urls: List[str], fetcher: AsyncFetcher,
+                  timeout: Optional[int], cancel_token: Optional[CancelToken], timings: ItemTimings,
+                  retry: Optional[RetryDelay] = None):
+    work_dir = prefetched.make_work_dir()
+    results = fetcher.fetch_many([(url, work_dir / str(n)) for n, url in enumerate(urls)],
+                                 timeout=timeout, cancel_token=cancel_token, retry=retry)
+
+    for result in results:
+        _account_response(timings, result)
+
+    if cancel_token is not None and cancel_token.cancelled:
+        prefetched.cleanup()
+        cancel_token.raise_if_cancelled()
+
+    for url, result in zip(urls, results):
+        prefetched.images[url] = _prefetched_image(url, result)
+
+
+def _fetch_images_via_store(prefetched: PrefetchedArticle, urls: List[str], fetcher: AsyncFetcher,
+                            timeout: Optional[int], cancel_token: Optional[CancelToken],
+                            image_store: ImageStore, timings: ItemTimings,
+                            retry: Optional[RetryDelay] = None):
+    """
+    Take images from the store, download missing images into the store.
+
+    Images, which are downloading by the other articles now, are waited for, not downloaded twice.
+    Stale stored images are requested conditionally: unchanged images are not downloaded again.
+    """
+
+    stored, claimed, foreign = image_store.claim(urls)
+
+    for url, image in stored.items():
+        prefetched.images[url] = PrefetchedImage.from_store(image, downloaded=False)
+
+    try:
+        if claimed:
+            results = fetcher.fetch_many([(url, image_store.temp_path()) for url in claimed],
+                                         timeout=timeout, cancel_token=cancel_token, retry=retry,
+                                         headers=[image_store.conditional_headers(url)
+                                                  for url in claimed])
+            for url, result in zip(claimed, results):
+                _account_response(timings, result)
+                if isinstance(result, FetchResponse) and 304 == result.status_code:
+                    # Image, removed from the store meanwhile, will be downloaded by the processor.
+                    if (stored_image := image_store.revalidated(url, result.headers)) is not None:
+                        prefetched.images[url] = PrefetchedImage.from_store(stored_image,
+                                                                            downloaded=False)
+                    continue
+
+                image = _prefetched_image(url, result)
+                if image.error is None:
+                    stored_image = image_store.add(url, image.file_name, image.path, result.headers)
+                    image = PrefetchedImage.from_store(stored_image, downloaded=True)
+                prefetched.images[url] = image
+    finally:
+        image_store.release(claimed)
+
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
+    if not foreign:
+        return
+
+    image_store.wait(foreign, cancel_token)
+    missing = []
+
+    for url in foreign:
+        if (image := image_store.lookup(url)) is not None:
+            prefetched.images[url] = PrefetchedImage.from_store(image, downloaded=False)
+        else:
+            # Downloading by the other article has failed: the error will be reported for this
+            # article too.
+            missing.append(url)
+
+    if missing:
+        _fetch_images(prefetched, missing, fetcher, timeout, cancel_token, timings, retry)
+
+
+def prefetch_article(article_file_path_or_url: str, fetcher: AsyncFetcher,
+                     skip_list: Union[str, List[str]], download_incorrect_mime: bool,
+                     downloading_timeout: int = -1,
+                     cancel_token: Optional[CancelToken] = None,
+                     known_state: Optional[SourceState] = None,
+                     image_store: Optional[ImageStore] = None,
+                     timings: Optional[ItemTimings] = None,
+                     retry: Optional[RetryDelay] = None) -> PrefetchedArticle:
+    """
+    Download article source and all its remote images, images are downloaded concurrently.
+
+    :parameter known_state: previously processed source version: if the source was not changed,
+                            images are not downloaded and the article is marked as unchanged.
+    :parameter image_store: images are taken from the store and downloaded into it.
+    :parameter timings: source and images phases durations and counters are added here.
+    :parameter retry: failed requests handler: only failed requests are retried.
+    :raise JobCancelled: when the token was cancelled, downloaded images are removed.
+    """
+
+    timings = timings if timings is not None else ItemTimings(article_file_path_or_url)
+    start = monotonic()
+
+    if is_url(article_file_path_or_url):
+        article_path, base_url, state = fetch_source(article_file_path_or_url, fetcher,
+                                                     downloading_timeout, cancel_token, known_state,
+                                                     timings, retry)
+        prefetched = PrefetchedArticle(article_path, base_url)
+        prefetched.unchanged = article_path is None
+    else:
+        article_path = Path(article_file_path_or_url).expanduser()
+        prefetched = PrefetchedArticle()
+        changed, state = local_source_state(article_path, known_state)
+        prefetched.unchanged = not changed
+        timings.count('source_bytes', article_path.stat().st_size)
+
+    timings.add('fetch_source', monotonic() - start)
+    prefetched.source_state = state
+
+    if prefetched.unchanged:
+        return prefetched
+
+    with timings.phase('fetch_images'):
+        urls = images_to_prefetch(article_path, prefetched.base_url, skip_list,
+                                  download_incorrect_mime)
+
+        if urls and image_store is not None:
+            _fetch_images_via_store(prefetched, urls, fetcher, _timeout(downloading_timeout),
+                                    cancel_token, image_store, timings, retry)
+        elif urls:
+            _fetch_images(prefetched, urls, fetcher, _timeout(downloading_timeout), cancel_token,
+                          timings, retry)
+
+    for image in prefetched.images.values():
+        timings.count('images')
+        timings.count('image_bytes', image.size)
+        if image.error is not None:
+            timings.count('images_failed')
+        elif not image.downloaded:
+            timings.count('images_stored')
+
+    return prefetched
+
+
+class _PrefetchedArticleDownloader(ArticleDownloader):
+    """
+    Returns already downloaded article instead of downloading.
+    """
+
+    def __init__(self, article_path: Path, article_base_url: str, *args, **kwargs):
+        super().__init__(str(article_path), *args, **kwargs)
+        self._prefetched_path = article_path
+        self._prefetched_base_url = article_base_url
+
+    def _get_article(self):
+        return self._prefetched_path, self._prefetched_base_url
+
+
+class PrefetchedArticleProcessor(ArticleProcessor):
+    """
+    Article processor, which takes the source and the images from the `PrefetchedArticle`.
+    """
+
+    def __init__(self, prefetched: PrefetchedArticle, cancel_token: Optional[CancelToken] = None,
+                 fetcher: Optional[AsyncFetcher] = None, dedup_index: Optional[DedupIndex] = None,
+                 retry: Optional[RetryDelay] = None, **kwargs):
+        """
+        :parameter fetcher: shared fetcher for the images, which were not prefetched, connections
+                            are reused.
+        :parameter dedup_index: deduplication index for the content deduplication, shared by all
+                                articles.
+        :parameter retry: failed attempts handler for the fetcher.
+        """
+
+        super().__init__(**kwargs)
+        self._prefetched = prefetched
+        self._cancel_token = cancel_token
+        self._fetcher = fetcher
+        self._dedup_index = dedup_index
+        self._retry = retry
+        # Conversion phases: transform, dedup and format (article formatting and writing, i.e. PDF
+        # rendering).
+        self.timings = ItemTimings(kwargs.get('article_file_path_or_url', ''))
+        self._stopped = False
+        # Last image content, taken from the images store, with the blob path.
+        self._stored_content: Optional[Tuple[bytes, Path]] = None
+
+        if prefetched.source_path is not None:
+            self._article_downloader = _PrefetchedArticleDownloader(
+                prefetched.source_path,
+                prefetched.base_url,
+                kwargs.get('output_path') or Path.cwd(),
+                self._article_formatter,
+                self._downloading_timeout,
+                self._remove_source,
+            )
+
+    def process(self):
+        start = monotonic()
+
+        try:
+            return self._process()
+        finally:
+            phases = self.timings.phases
+            self.timings.add('format', monotonic() - start - phases.get('transform', 0.0) -
+                             phases.get('dedup', 0.0))
+
+    def _process(self):
+        token = self._cancel_token
+
+        if token is None:
+            return super().process()
+
+        token.raise_if_cancelled()
+        on_cancel = token.add_callback(self.stop)
+
+        try:
+            article_out_path = super().process()
+        finally:
+            token.remove_callback(on_cancel)
+
+        if self._stopped:
+            # Transformation was interrupted: the output is incomplete.
+            Path(article_out_path).unlink(missing_ok=True)
+            raise JobCancelled(f'Processing "{article_out_path}" cancelled')
+
+        return article_out_path
+
+    def stop(self):
+        self._stopped = True
+
+        if self._img_downloader is not None:
+            super().stop()
+        else:
+            self._running = False
+
+    def _transform_article(self, article_path, input_format_list, transformers_list):
+        # Images downloader is created in the `process()`.
+        # pylint: disable=protected-access
+        img_downloader = self._img_downloader
+        img_downloader._get_remote_image = self._get_remote_image
+        img_downloader._write_image = self._write_image
+
+        if self._dedup_index is not None and \
+                DeduplicationVariant.CONTENT_HASH == self._deduplication_type:
+            out_path_maker = img_downloader._out_path_maker
+            img_downloader._deduplicator = IndexedContentDeduplicator(
+                self._dedup_index, out_path_maker.images_dir, out_path_maker._img_dir_name,
+                out_path_maker._img_public_path)
+
+        if (deduplicator := img_downloader._deduplicator) is not None:
+            deduplicate = deduplicator.deduplicate
+
+            def _timed_deduplicate(*args):
+                with self.timings.phase('dedup'):
+                    return deduplicate(*args)
+
+            deduplicator.deduplicate = _timed_deduplicate
+
+        start = monotonic()
+        dedup_start = self.timings.phases.get('dedup', 0.0)
+
+        try:
+            return super()._transform_article(article_path, input_format_list, transformers_list)
+        finally:
+            if isinstance(img_downloader._deduplicator, IndexedContentDeduplicator):
+                # Images, which were not written, are not waited by the other articles.
+                img_downloader._deduplicator.release()
+            dedup_time = self.timings.phases.get('dedup', 0.0) - dedup_start
+            self.timings.add('transform', monotonic() - start - dedup_time)
+
+    def _get_remote_image(self, image_url: str, img_num: int, img_count: int):
+        image = self._prefetched.images.get(image_url)
+        self._stored_content = None
+
+        if image is None and self._fetcher is not None:
+            _logger.info('Downloading image %d of %d from "%s"...', img_num + 1, img_count,
+                         image_url)
+            # Written to the file: the conversion memory budget includes the image, the fetcher
+            # doesn't reserve it. Buffered redirect and error bodies extend the conversion
+            # reservation.
+            path = self._prefetched.make_work_dir() / f'fallback{img_num}'
+            try:
+                response = self._fetcher.fetch(image_url, _timeout(self._downloading_timeout),
+                                               dest=path, cancel_token=self._cancel_token,
+                                               retry=self._retry, budget_holder=True)
+                content = path.read_bytes() if response.path is not None else b''
+                return get_filename_from_url(response), content
+            finally:
+                path.unlink(missing_ok=True)
+
+        if image is None:
+            # pylint: disable=protected-access
+            return ImageDownloader._get_remote_image(self._img_downloader, image_url, img_num,
+                                                     img_count)
+
+        if image.error is not None:
+            raise image.error
+
+        _logger.info('Image %d of %d from "%s" was prefetched', img_num + 1, img_count, image_url)
+
+        content = image.path.read_bytes()
+        if image.stored:
+            # Content object identifies the blob in the `_write_image()`.
+            self._stored_content = (content, image.path)
+
+        return image.file_name, content
+
+    def _write_image(self, image_path: Path, data: bytes, image_link):
+        # pylint: disable=protected-access
+        stored_content, self._stored_content = self._stored_content, None
+        img_downloader = self._img_downloader
+        rescaling = getattr(image_link, 'need_rescaling', False)
+        deduplicator = img_downloader._deduplicator
+        indexed = not rescaling and isinstance(deduplicator, IndexedContentDeduplicator)
+
+        if image_path.exists():
+            # Will not be overwritten.
+            ImageDownloader._write_image(img_downloader, image_path, data, image_link)
+            if indexed:
+                deduplicator.release()
+            return
+
+        if stored_content is None or stored_content[0] is not data or rescaling:
+            ImageDownloader._write_image(img_downloader, image_path, data, image_link)
+        else:
+            img_downloader._make_directories(image_path.parent)
+            _logger.info('Image will be cloned to the file "%s"...', image_path)
+            clone_or_copy(stored_content[1], image_path)
+
+        if indexed:
+            deduplicator.register(image_path, data)
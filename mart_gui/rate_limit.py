@@ -0,0 +1,180 @@
+"""
+Per host requests rate limiting: token buckets, shared by all workers.
+"""
+import configparser
+import logging
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SECTION = 'default'
+
+
+class RateLimit(NamedTuple):
+    # Requests per second, 0 - unlimited.
+    rate: float
+    # Requests count, which can be sent at once after the idle time.
+    burst: int = 1
+
+
+class TokenBucket:
+    """
+    Token bucket: the request takes a token, tokens are added with the constant rate up to the burst
+    size.
+    """
+
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self._tokens = float(limit.burst)
+        self._updated = monotonic()
+
+    def reserve(self) -> float:
+        """
+        Take a token, the bucket can go into the debt: the requests are served in the reservation
+        order.
+
+        :return: delay in seconds before the request can be sent.
+        """
+
+        now = monotonic()
+        rate, burst = self.limit
+        self._tokens = min(float(burst), self._tokens + (now - self._updated) * rate)
+        self._updated = now
+        self._tokens -= 1
+
+        return -self._tokens / rate if self._tokens < 0 else 0.0
+
+
+class HostRateLimiter:
+    """
+    Requests rate limits by the host: one throttled host doesn't delay the requests to the other
+    hosts.
+
+    The host limit is taken from the override of the host or of its parent domain ("example.com" is
+    applied to "www.example.com"), then from the default limit. Limits can be changed while working.
+    """
+
+    def __init__(self, default: Optional[RateLimit] = None,
+                 overrides: Optional[Dict[str, RateLimit]] = None):
+        """
+        :parameter default: limit for every host without the override, None - unlimited.
+        :parameter overrides: limits by the host name, zero rate - unlimited.
+        """
+
+        self._default = default
+        self._overrides: Dict[str, RateLimit] = {k.lower(): v for k, v in (overrides or {}).items()}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = Lock()
+        self.throttled_count = 0
+
+    def configure(self, default: Optional[RateLimit], overrides: Dict[str, RateLimit]):
+        """
+        Replace all limits, running waits are not changed.
+        """
+
+        with self._lock:
+            self._default = default
+            self._overrides = {k.lower(): v for k, v in overrides.items()}
+            self._buckets.clear()
+
+        _logger.debug('Rate limits: default %s, overrides %s', default, overrides)
+
+    def set_default(self, default: Optional[RateLimit]):
+        with self._lock:
+            self._default = default
+            self._buckets.clear()
+
+    def load_config(self, text: str):
+        """
+        Replace all limits by the limits from the config.
+
+        Config has "[default]" section and the sections by the host name, with "rate" (requests per
+        second) and "burst" keys.
+
+        :raise ValueError: on the syntax errors and wrong values, limits are not changed.
+        """
+
+        self.configure(*_parse_config(text))
+
+    def reserve(self, host: str) -> float:
+        """
+        Take the host token.
+
+        :return: delay in seconds before the request to the host.
+        """
+
+        host = host.lower()
+
+        with self._lock:
+            if (bucket := self._buckets.get(host)) is None:
+                limit = self._limit_for(host)
+                if limit is None or limit.rate <= 0:
+                    return 0.0
+                bucket = self._buckets[host] = TokenBucket(limit)
+
+            delay = bucket.reserve()
+            if delay > 0:
+                self.throttled_count += 1
+
+        return delay
+
+    def to_config(self) -> str:
+        """
+        Limits in the config file format.
+        """
+
+        with self._lock:
+            sections = [(DEFAULT_SECTION, self._default)] if self._default is not None else []
+            sections += sorted(self._overrides.items())
+
+        return '\n'.join(f'[{name}]\nrate = {limit.rate:g}\nburst = {limit.burst}\n'
+                         for name, limit in sections)
+
+    @classmethod
+    def from_file(cls, path: Union[Path, str]) -> 'HostRateLimiter':
+        limiter = cls()
+        limiter.load_config(Path(path).read_text(encoding='utf8'))
+        return limiter
+
+    def _limit_for(self, host: str) -> Optional[RateLimit]:
+        domain = host
+        while domain:
+            if (limit := self._overrides.get(domain)) is not None:
+                return limit
+            domain = domain.partition('.')[2]
+
+        return self._default
+
+
+def _parse_config(text: str) -> Tuple[Optional[RateLimit], Dict[str, RateLimit]]:
+    # "DEFAULT" section of the configparser is merged into every section: own "default" section is
+    # used.
+    parser = configparser.ConfigParser(default_section='__defaults__', interpolation=None)
+    try:
+        parser.read_string(text)
+    except configparser.Error as e:
+        raise ValueError(str(e)) from e
+
+    default = None
+    overrides = {}
+
+    for section in parser.sections():
+        values = parser[section]
+        try:
+            limit = RateLimit(values.getfloat('rate', 0.0), values.getint('burst', 1))
+        except ValueError as e:
+            raise ValueError(f'Section "{section}": {e}') from e
+
+        if limit.rate < 0 or limit.burst < 1:
+            raise ValueError(f'Section "{section}": rate must be >= 0, burst must be >= 1')
+
+        if DEFAULT_SECTION == section.lower():
+            default = limit if limit.rate > 0 else None
+        else:
+            overrides[section.lower()] = limit
+
+    return default, overrides
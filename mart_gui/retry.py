@@ -0,0 +1,138 @@
+"""
+Failures classification and retries of the transient failures: exponential backoff with jitter, per
+host budget.
+"""
+import logging
+import random
+import socket
+import ssl
+from threading import Lock
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from requests import exceptions as requests_exceptions
+
+from .cancellation import JobCancelled
+from .fetcher import HttpError
+
+
+_logger = logging.getLogger(__name__)
+
+# Network failure, which can pass: timeout, connection reset, server overload.
+FAILURE_TRANSIENT = 'transient'
+# HTTP error, which will be the same on retry: not found, forbidden, bad URL.
+FAILURE_PERMANENT = 'permanent'
+# Article conversion error.
+FAILURE_CONVERSION = 'conversion'
+
+_TRANSIENT_STATUSES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+
+def _status_class(status_code: int) -> str:
+    return FAILURE_TRANSIENT if status_code in _TRANSIENT_STATUSES else FAILURE_PERMANENT
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Failure class of the item processing error.
+    """
+
+    if isinstance(error, HttpError):
+        return _status_class(error.status_code)
+
+    if isinstance(error, requests_exceptions.HTTPError) and error.response is not None:
+        # Images, which are downloaded by the `markdown_toolset` in the worker processes.
+        return _status_class(error.response.status_code)
+
+    if isinstance(error, (ssl.SSLCertVerificationError, requests_exceptions.SSLError,
+                          requests_exceptions.InvalidURL, requests_exceptions.MissingSchema)):
+        return FAILURE_PERMANENT
+
+    if isinstance(error, socket.gaierror):
+        # Name is not known or DNS server is not available.
+        return FAILURE_TRANSIENT if error.errno == socket.EAI_AGAIN else FAILURE_PERMANENT
+
+    if isinstance(error, (TimeoutError, ConnectionError, EOFError,
+                          requests_exceptions.ConnectionError, requests_exceptions.Timeout,
+                          requests_exceptions.ChunkedEncodingError)):
+        return FAILURE_TRANSIENT
+
+    if isinstance(error, (OSError, requests_exceptions.RequestException)):
+        # Missing local file, bad URL scheme, too many redirects.
+        return FAILURE_PERMANENT
+
+    return FAILURE_CONVERSION
+
+
+def url_host(url: str) -> str:
+    return urlsplit(url).hostname or ''
+
+
+class RetryPolicy:
+    """
+    Transient failures retries.
+
+    Delay is random between 0 and `base_delay * 2 ** attempt` (full jitter: retries of many items
+    don't come at the same time), the server Retry-After is respected. Every host has the retries
+    budget for the batch: the broken host doesn't get endless retries of all its items.
+    """
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 30.0,
+                 host_budget: int = 20):
+        """
+        :parameter max_retries: retries count for one request or conversion, 0 - no retries.
+        :parameter base_delay: first retry maximum delay, seconds.
+        :parameter max_delay: maximum delay, seconds.
+        :parameter host_budget: retries count for one host, until `reset()`.
+        """
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.host_budget = host_budget
+        self._spent: Dict[str, int] = {}
+        self._lock = Lock()
+
+    @property
+    def retries(self) -> int:
+        with self._lock:
+            return sum(self._spent.values())
+
+    def reset(self):
+        with self._lock:
+            self._spent.clear()
+
+    def delay(self, attempt: int) -> float:
+        """
+        :parameter attempt: failed attempts count.
+        """
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))  # nosec
+
+    def next_delay(self, error: Exception, attempt: int, url: str) -> Optional[float]:
+        """
+        Delay before the next attempt, None if the failure is not retried.
+
+        :parameter attempt: failed attempts count before this failure.
+        :parameter url: failed request URL or the item source.
+        """
+
+        if isinstance(error, JobCancelled) or attempt >= self.max_retries:
+            return None
+
+        if classify_error(error) != FAILURE_TRANSIENT:
+            return None
+
+        host = url_host(getattr(error, 'url', None) or url)
+
+        with self._lock:
+            if self._spent.get(host, 0) >= self.host_budget:
+                _logger.debug('Retries budget of the host "%s" was spent', host)
+                return None
+            self._spent[host] = self._spent.get(host, 0) + 1
+
+        delay = self.delay(attempt + 1)
+        if (retry_after := getattr(error, 'retry_after', None)) is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+
+        return delay
@@ -0,0 +1,74 @@
+"""
+Items scheduling: user priority first, then the shortest expected job first.
+"""
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from markdown_toolset.www_tools import is_url
+
+from .journal import JobJournal
+
+
+_logger = logging.getLogger(__name__)
+
+
+class JobCostEstimator:
+    """
+    Expected item processing time in seconds.
+
+    Sources, processed before, are estimated by the journal history. Local sources are estimated by
+    the size, remote sources without the history get the average estimate: they are not moved before
+    or after all others.
+    """
+
+    # Source byte processing time, while the journal doesn't have the history.
+    default_seconds_per_byte = 1e-5
+
+    def __init__(self, journal: Optional[JobJournal] = None):
+        self._journal = journal
+
+    def estimate(self, sources: Iterable[str]) -> Dict[str, float]:
+        sources = list(sources)
+        durations = self._journal.durations(sources) if self._journal is not None else {}
+        seconds_per_byte = None
+        result = {}
+        unknown = []
+
+        for source in sources:
+            if (duration := durations.get(source)) is not None:
+                result[source] = duration
+                continue
+
+            if not is_url(source):
+                try:
+                    size = Path(source).expanduser().stat().st_size
+                except OSError:
+                    # Fails fast.
+                    result[source] = 0.0
+                    continue
+
+                if seconds_per_byte is None:
+                    seconds_per_byte = self._seconds_per_byte()
+
+                result[source] = size * seconds_per_byte
+                continue
+
+            unknown.append(source)
+
+        average = sum(result.values()) / len(result) if result else 0.0
+        result.update((source, average) for source in unknown)
+
+        return result
+
+    def _seconds_per_byte(self) -> float:
+        rate = self._journal.seconds_per_byte() if self._journal is not None else None
+        return rate if rate is not None else self.default_seconds_per_byte
+
+
+def schedule_key(priority: int, estimate: float) -> Tuple[int, float]:
+    """
+    Jobs queue order: higher priority first, shorter job first in the same priority.
+    """
+
+    return -priority, estimate
@@ -0,0 +1,144 @@
+"""
+Options of the selected links: the common value or mixed for every option, kept up to date by the
+selection changes.
+"""
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from .item_parameters import OPTION_NAMES, ItemParameters
+from .links_model import LinksStore, RowRanges, intersect_ranges, merge_ranges, subtract_ranges
+
+
+# Check box options: shown as the tri-state.
+_FLAGS = frozenset(('skip_all_incorrect', 'download_incorrect_mime', 'remove_source',
+                    'save_hierarchy'))
+
+
+def _option_value(name: str, value: Any) -> Any:
+    if name in _FLAGS:
+        return bool(value)
+    if 'skip_list' == name:
+        return (value,) if isinstance(value, str) else tuple(sorted(value))
+    return value
+
+
+class SelectionAggregate:
+    """
+    Selected rows count by the profile and by the value of every option.
+
+    Selection change costs O(changed rows): only the selected and deselected rows are counted.
+    Option edit of the selected rows costs O(distinct profiles). Rows moving (sorting, removing)
+    invalidates the aggregate, it's counted again by `reset()`.
+    """
+
+    def __init__(self, store: LinksStore):
+        self._store = store
+        self.reset()
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def reset(self, ranges: RowRanges = ()):
+        """
+        Count the selected rows from scratch.
+
+        :parameter ranges: merged selected rows ranges.
+        """
+
+        self._ranges: RowRanges = ()
+        self._profile_counts: Dict[int, int] = {}
+        self._value_counts: Dict[str, Counter] = {name: Counter() for name in OPTION_NAMES}
+        self._dirty = False
+        self.select(ranges)
+
+    def invalidate(self):
+        self._dirty = True
+
+    def rows_inserted(self, first: int):
+        # Rows are appended usually: the selected rows are not moved.
+        if self._ranges and first <= self._ranges[-1][1]:
+            self._dirty = True
+
+    def select(self, ranges: RowRanges):
+        if self._dirty:
+            return
+
+        if added := subtract_ranges(merge_ranges(ranges), self._ranges):
+            self._count(added, 1)
+            self._ranges = merge_ranges(self._ranges + added)
+
+    def deselect(self, ranges: RowRanges):
+        if self._dirty:
+            return
+
+        if removed := intersect_ranges(merge_ranges(ranges), self._ranges):
+            self._count(removed, -1)
+            self._ranges = subtract_ranges(self._ranges, removed)
+
+    def replace_profiles(self, ranges: RowRanges, replaced: Dict[int, int]):
+        """
+        Rows of the ranges got the new profiles.
+        """
+
+        if self._dirty:
+            return
+
+        if ranges != self._ranges:
+            # Edit of the rows, which were selected before: recount.
+            self._dirty = True
+            return
+
+        for old_id, new_id in replaced.items():
+            if old_id != new_id and (count := self._profile_counts.get(old_id)):
+                self._add_profile(old_id, -count)
+                self._add_profile(new_id, count)
+
+    def parameters(self) -> Tuple[ItemParameters, List[str], bool]:
+        """
+        Options of the selected rows: the common value of the option or its default value, if the
+        values differ. Check box options are tri-state: 0 - unchecked, 1 - different, 2 - checked.
+
+        :return: options, union of the skip lists, skip lists differ flag.
+        """
+
+        p = ItemParameters()
+        if not self._profile_counts:
+            return p, [], False
+
+        for name, values in self._value_counts.items():
+            if 'skip_list' == name:
+                continue
+            if len(values) != 1:
+                p.set_default(name)
+                continue
+
+            value = next(iter(values))
+            setattr(p, name, (2 if value else 0) if name in _FLAGS else value)
+
+        skip_lists = self._value_counts['skip_list']
+        skip_lines = sorted(set().union(*skip_lists))
+        # List can contain duplicates.
+        skip_list_mixed = len(skip_lists) > 1 or len(skip_lines) != len(next(iter(skip_lists)))
+
+        return p, skip_lines, skip_list_mixed
+
+    def _count(self, ranges: RowRanges, sign: int):
+        profile_ids = self._store.profile_ids
+        for first, last in ranges:
+            for profile_id, count in Counter(profile_ids[first:last + 1]).items():
+                self._add_profile(profile_id, sign * count)
+
+    def _add_profile(self, profile_id: int, count: int):
+        if total := self._profile_counts.get(profile_id, 0) + count:
+            self._profile_counts[profile_id] = total
+        else:
+            del self._profile_counts[profile_id]
+
+        profile = self._store.profiles[profile_id]
+        for name, values in self._value_counts.items():
+            value = _option_value(name, getattr(profile, name))
+            if total := values[value] + count:
+                values[value] = total
+            else:
+                del values[value]
@@ -0,0 +1,50 @@
+from typing import Dict, Optional
+
+from PyQt6.QtWidgets import QHBoxLayout, QLabel, QWidget
+
+from .completion import ProgressSnapshot
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '--:--'
+
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}' if hours else f'{minutes}:{seconds:02}'
+
+
+class StatusPanel(QWidget):
+    """
+    Work progress in the status bar: items counters, throughput, workers, queue depth and ETA.
+    """
+
+    def __init__(self, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self._progress = QLabel(self)
+        self._throughput = QLabel(self)
+        self._workers = QLabel(self)
+        self._queue = QLabel(self)
+        self._eta = QLabel(self)
+
+        for label in (self._progress, self._throughput, self._workers, self._queue, self._eta):
+            layout.addWidget(label)
+
+    def update_status(self, status: ProgressSnapshot, workers: Dict[str, int], queue_depth: int,
+                      running: bool):
+        if not status.total:
+            self._progress.setText('')
+        else:
+            self._progress.setText(self.tr('Processed: {} of {} ({} running, {} failed)').format(
+                status.finished, status.total, status.running, status.failed + status.cancelled))
+
+        self._throughput.setText(self.tr('{:.1f} items/s, {:.2f} MB/s').format(
+            status.items_per_second, status.bytes_per_second / 1e6))
+        self._workers.setText(self.tr('Workers: {} (fetch: {})').format(
+            workers['transform'], workers['fetch']))
+        self._queue.setText(self.tr('Queue: {}').format(queue_depth))
+        self._eta.setText(self.tr('ETA: {}').format(format_eta(status.eta)) if running else '')
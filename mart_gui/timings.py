@@ -0,0 +1,117 @@
+"""
+Items processing timings: phases durations and counters, reports for the whole run.
+"""
+import csv
+import json
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic
+from typing import Dict, Iterable, Iterator, Union
+from urllib.parse import urlsplit
+
+from markdown_toolset.www_tools import is_url
+
+
+class ItemTimings:
+    """
+    Item processing phases durations in seconds, bytes and images counters.
+    """
+
+    # Phases in the processing order.
+    PHASES = ('queue', 'throttle', 'dns', 'connect', 'fetch_source', 'fetch_images', 'transform',
+              'dedup', 'format', 'write')
+    COUNTERS = ('source_bytes', 'image_bytes', 'images', 'images_failed', 'images_stored',
+                'output_bytes', 'retries')
+
+    def __init__(self, source: str):
+        self.source = source
+        self.host = (urlsplit(source).hostname or '') if is_url(source) else ''
+        self.state = ''
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self._created = monotonic()
+        self._finished = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, monotonic() - start)
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def merge(self, phases: Dict[str, float]):
+        for name, seconds in phases.items():
+            self.add(name, seconds)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def started(self):
+        """
+        Processing started: the time from the creation is the queue waiting time.
+        """
+
+        self.add('queue', monotonic() - self._created)
+
+    def finish(self, state: str):
+        self.state = state
+        self._finished = monotonic()
+
+    @property
+    def total(self) -> float:
+        """
+        Wall time from the adding to the finish, including the queue waiting.
+        """
+
+        return (self._finished if self._finished is not None else monotonic()) - self._created
+
+    @property
+    def processing_time(self) -> float:
+        """
+        Phases time without the queue waiting: throttling, DNS and connecting are the parts of the
+        fetching phases.
+        """
+
+        return sum(t for p, t in self.phases.items()
+                   if p not in ('queue', 'throttle', 'dns', 'connect'))
+
+    def to_dict(self) -> Dict[str, Union[str, float, int]]:
+        result = {'source': self.source, 'host': self.host, 'state': self.state,
+                  'total': round(self.total, 6)}
+        result.update({p: round(self.phases.get(p, 0.0), 6) for p in self.PHASES})
+        result.update({c: self.counters.get(c, 0) for c in self.COUNTERS})
+        return result
+
+    def summary(self) -> str:
+        """
+        Human readable text, i.e. for the tooltip.
+        """
+
+        lines = [f'{self.state or "processing"}, total {self.total:.3f} s']
+        lines += [f'{p}: {self.phases[p]:.3f} s' for p in self.PHASES if p in self.phases]
+        lines += [f'{c.replace("_", " ")}: {self.counters[c]}' for c in self.COUNTERS
+                  if self.counters.get(c)]
+        return '\n'.join(lines)
+
+
+def write_timings_report(path: Union[Path, str], timings: Iterable[ItemTimings]):
+    """
+    Write timings report: CSV for the ".csv" file, JSON otherwise.
+    """
+
+    path = Path(path)
+    rows = [t.to_dict() for t in timings]
+
+    if '.csv' == path.suffix.lower():
+        fields = ['source', 'host', 'state', 'total', *ItemTimings.PHASES, *ItemTimings.COUNTERS]
+        with open(path, 'w', newline='', encoding='utf8') as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump(rows, f, indent=2)
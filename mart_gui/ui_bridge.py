@@ -0,0 +1,105 @@
+import logging
+from threading import Lock
+from typing import Any, List, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QTimer, Qt, pyqtSignal, pyqtSlot
+
+
+_logger = logging.getLogger(__name__)
+
+# (row id, output file path or source path, error or None, failure class or None, success flag).
+ItemResult = Tuple[int, Any, Optional[BaseException], Optional[str], bool]
+
+
+class AppLogicBridge(QObject):
+    """
+    Delivers `AppLogic` callbacks from the worker threads to the GUI thread.
+
+    Events are queued and applied at most once per frame: many finished items make one table update.
+    """
+
+    items_finished = pyqtSignal(list)
+    completed = pyqtSignal()
+
+    # Events are delivered not often than once per this interval.
+    frame_interval_ms = 16
+
+    _wakeup = pyqtSignal()
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._events: List[Optional[ItemResult]] = []
+        self._lock = Lock()
+
+        self.events_count = 0
+        self.updates_count = 0
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.frame_interval_ms)
+        self._timer.timeout.connect(self._flush)
+        self._wakeup.connect(self._schedule, Qt.ConnectionType.QueuedConnection)
+
+    @property
+    def coalesced_count(self) -> int:
+        """
+        Events count, which didn't require own table update.
+        """
+
+        return self.events_count - self.updates_count
+
+    def reset_stats(self):
+        self.events_count = 0
+        self.updates_count = 0
+
+    def on_item_success(self, index: int, output_file_path):
+        self._push((index, output_file_path, None, None, True))
+
+    def on_item_fail(self, index: int, file_path: str, error: Optional[BaseException],
+                     failure_class: Optional[str] = None):
+        self._push((index, file_path, error, failure_class, False))
+
+    def on_complete(self):
+        # Completion marker keeps the events order.
+        self._push(None)
+
+    def _push(self, event: Optional[ItemResult]):
+        with self._lock:
+            need_wakeup = not self._events
+            self._events.append(event)
+
+        if need_wakeup:
+            self._wakeup.emit()
+
+    @pyqtSlot()
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    @pyqtSlot()
+    def _flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+
+        results: List[ItemResult] = []
+
+        for e in events:
+            if e is not None:
+                results.append(e)
+                continue
+
+            self._emit_results(results)
+            results = []
+            _logger.debug('%d events were delivered by %d updates', self.events_count,
+                          self.updates_count)
+            self.completed.emit()
+
+        self._emit_results(results)
+
+    def _emit_results(self, results: List[ItemResult]):
+        if not results:
+            return
+
+        self.events_count += len(results)
+        self.updates_count += 1
+        self.items_finished.emit(results)